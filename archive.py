@@ -0,0 +1,211 @@
+import gzip
+import io
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from message_store import MessageLog
+
+# zstandard is optional; archives fall back to gzip without it
+try:
+    import zstandard
+    ZSTD_AVAILABLE: bool = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_GZIP: str = "gzip"
+COMPRESSION_ZSTD: str = "zstd"
+EXTENSIONS: Dict[str, str] = {COMPRESSION_GZIP: ".jsonl.gz", COMPRESSION_ZSTD: ".jsonl.zst"}
+INDEX_FILE: str = "index.json"
+# Uncompressed JSONL bytes per segment before a new one is started
+SEGMENT_MAX_BYTES: int = 64_000_000
+# Records read from the live log per batch during an export
+EXPORT_BATCH_LINES: int = 2000
+
+def _compression_of(path: str) -> str:
+    return COMPRESSION_ZSTD if path.endswith(EXTENSIONS[COMPRESSION_ZSTD]) else COMPRESSION_GZIP
+
+# Append one compressed member/frame to a segment. Concatenated gzip members and
+# zstd frames both decode as a single stream, so segments never need rewriting.
+def _append_compressed(path: str, data: bytes) -> None:
+    if _compression_of(path) == COMPRESSION_ZSTD:
+        with open(path, "ab") as f:
+            f.write(zstandard.ZstdCompressor().compress(data))
+    else:
+        with gzip.open(path, "ab") as f:
+            f.write(data)
+
+def _open_lines(path: str) -> IO[bytes]:
+    if _compression_of(path) == COMPRESSION_ZSTD:
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    return gzip.open(path, "rb")
+
+# Long-term home for messages evicted from the message log. Records are written
+# to compressed JSONL segments in `directory`, rotated by size; index.json keeps
+# each segment's record count and timestamp range so exports only open the
+# segments that overlap the requested window. Hold `lock` while reading to keep
+# a concurrent compaction from appending mid-read.
+class MessageArchive:
+    def __init__(self, directory: str, compression: str = COMPRESSION_GZIP,
+                 segment_max_bytes: int = SEGMENT_MAX_BYTES):
+        if compression == COMPRESSION_ZSTD and not ZSTD_AVAILABLE:
+            logger.warning("zstandard is not installed; archiving messages with gzip instead")
+            compression = COMPRESSION_GZIP
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown archive compression {compression!r}")
+        self.directory = directory
+        self.compression = compression
+        self.segment_max_bytes = segment_max_bytes
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        # [{"file", "first_ts", "last_ts", "count", "bytes"}] oldest first; "bytes" is uncompressed
+        self.segments: List[Dict[str, Any]] = []
+        self.lock = threading.RLock()
+
+    def load(self) -> None:
+        try:
+            with open(self.index_path, "r") as f:
+                self.segments = json.load(f)
+        except FileNotFoundError:
+            self.segments = []
+        except (IOError, ValueError) as e:
+            logger.warning(f"Failed to load {self.index_path}; rebuilding: {e}")
+            self.segments = self._rebuild_index()
+            self._save_index()
+
+    # Recover the index by decompressing every segment (only after corruption)
+    def _rebuild_index(self) -> List[Dict[str, Any]]:
+        segments = []
+        if not os.path.isdir(self.directory):
+            return segments
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(tuple(EXTENSIONS.values())):
+                continue
+            segment = {"file": name, "first_ts": None, "last_ts": None, "count": 0, "bytes": 0}
+            with _open_lines(os.path.join(self.directory, name)) as f:
+                for line in f:
+                    self._account(segment, json.loads(line).get("timestamp", 0.0), len(line))
+            segments.append(segment)
+        return segments
+
+    def _save_index(self) -> None:
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.segments, f)
+        os.replace(temp_path, self.index_path)
+
+    @staticmethod
+    def _account(segment: Dict[str, Any], timestamp: float, size: int) -> None:
+        segment["first_ts"] = timestamp if segment["first_ts"] is None else min(segment["first_ts"], timestamp)
+        segment["last_ts"] = timestamp if segment["last_ts"] is None else max(segment["last_ts"], timestamp)
+        segment["count"] += 1
+        segment["bytes"] += size
+
+    def _new_segment(self, first_timestamp: float) -> Dict[str, Any]:
+        name = f"messages-{int(first_timestamp)}-{len(self.segments):05d}{EXTENSIONS[self.compression]}"
+        segment = {"file": name, "first_ts": None, "last_ts": None, "count": 0, "bytes": 0}
+        self.segments.append(segment)
+        return segment
+
+    # Append records (oldest first); used as MessageLog.compact's on_evict callback
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            segment = self.segments[-1] if self.segments else None
+            chunks: List[bytes] = []
+            for record in records:
+                timestamp = float(record.get("timestamp", 0.0))
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                if segment is None or segment["bytes"] >= self.segment_max_bytes or not segment["file"].endswith(EXTENSIONS[self.compression]):
+                    if chunks:
+                        _append_compressed(os.path.join(self.directory, segment["file"]), b"".join(chunks))
+                        chunks = []
+                    segment = self._new_segment(timestamp)
+                chunks.append(line)
+                self._account(segment, timestamp, len(line))
+            _append_compressed(os.path.join(self.directory, segment["file"]), b"".join(chunks))
+            self._save_index()
+
+    @property
+    def count(self) -> int:
+        return sum(segment["count"] for segment in self.segments)
+
+    def compressed_size(self) -> int:
+        total = 0
+        for segment in self.segments:
+            try:
+                total += os.path.getsize(os.path.join(self.directory, segment["file"]))
+            except OSError:
+                pass
+        return total
+
+    # Stream archived records in [start, end] that match `predicate`, opening only
+    # the segments whose time range overlaps the window
+    def iter_records(self, start: Optional[float] = None, end: Optional[float] = None,
+                     predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Iterator[Dict[str, Any]]:
+        for segment in list(self.segments):
+            if not segment["count"]:
+                continue
+            if (start is not None and segment["last_ts"] < start) or (end is not None and segment["first_ts"] > end):
+                continue
+            with _open_lines(os.path.join(self.directory, segment["file"])) as f:
+                for line in f:
+                    record = json.loads(line)
+                    timestamp = record.get("timestamp", 0.0)
+                    if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                        continue
+                    if predicate is None or predicate(record):
+                        yield record
+
+# Compact `log`, moving the evicted records into `archive`. The archive lock is
+# held from the first archived batch until the log has swapped its file, so an
+# export never sees a record both in the archive and still in the live log.
+# Returns the number of records moved. Runs in a worker thread.
+def compact_into(archive: MessageArchive, log: MessageLog) -> int:
+    with archive.lock:
+        return log.compact(archive.append)
+
+# Write the archived and live messages in [start, end] that match `predicate` to
+# `path` as gzip-compressed JSONL, oldest first, one batch at a time so memory
+# stays flat regardless of log size. Stops once the compressed output reaches
+# max_bytes. Returns (records written, truncated). Runs in a worker thread.
+def export_messages(archive: MessageArchive, log: MessageLog, path: str, start: Optional[float] = None,
+                    end: Optional[float] = None, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                    max_bytes: Optional[int] = None) -> Tuple[int, bool]:
+    written = 0
+    with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as out:
+        def write(record: Dict[str, Any]) -> bool:
+            nonlocal written
+            out.write((json.dumps(record) + "\n").encode("utf-8"))
+            written += 1
+            return max_bytes is None or raw.tell() < max_bytes
+
+        # compact_into holds the archive lock through archiving and the log's
+        # file swap, so no record moves from the live log into the archive
+        # during the export, and none is half-moved when it starts
+        with archive.lock:
+            for record in archive.iter_records(start, end, predicate):
+                if not write(record):
+                    return written, True
+            seq = log.first_seq if start is None else log.seq_at_time(start)
+            end_seq = log.next_seq
+            while seq < end_seq:
+                rows = log.read_forward(seq, min(EXPORT_BATCH_LINES, end_seq - seq))
+                if not rows:
+                    break
+                for _, record in rows:
+                    timestamp = record.get("timestamp", 0.0)
+                    if end is not None and timestamp > end:
+                        return written, False
+                    if (start is None or timestamp >= start) and (predicate is None or predicate(record)):
+                        if not write(record):
+                            return written, True
+                seq = rows[-1][0] + 1
+    return written, False
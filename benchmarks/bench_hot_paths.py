@@ -0,0 +1,353 @@
+# Time the bot's hot paths offline, with a stubbed Discord client and a fake
+# Meshtastic interface, and write machine-readable results for comparison
+# across releases.
+# Usage: python benchmarks/bench_hot_paths.py [--sizes 10000,100000,1000000]
+#        [--json results.json] [--compare baseline.json] [--tolerance 0.25]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
+
+# bot.py validates these at import; the values only need to parse as IDs
+for name in ["BOT_TOKEN", "GUILD_ID", "MESHTASTIC_CHANNEL_ID", "MESHTASTIC_NODE_CHANNEL_ID", "ADMIN_ROLE_ID",
+             "NODE_OWNER_ROLE_ID", "MESHTASTIC_PORT", "ADMIN_LOG_CHANNEL_ID"]:
+    os.environ.setdefault(name, "1")
+os.environ["TRACE_SAMPLE_RATE"] = "0"
+
+WORDS = "water net check copy roger over signal battery solar relay north south camp trail base ridge".split()
+
+class StubChannel:
+    id = 1
+    name = "mesh"
+
+    async def send(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+class StubUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+
+    async def send(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+class StubBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.channel = StubChannel()
+
+    def get_channel(self, channel_id: int) -> StubChannel:
+        return self.channel
+
+    def get_guild(self, guild_id: int) -> None:
+        return None
+
+    async def fetch_user(self, user_id: int) -> StubUser:
+        return StubUser(user_id)
+
+class FakeInterface:
+    def __init__(self, node_ids: List[str]):
+        now = time.time()
+        self.nodes = {
+            node_id: {"user": {"id": node_id, "longName": f"Node {node_id}", "shortName": node_id[-4:]},
+                      "lastHeard": now, "batteryLevel": 80, "snr": 5.0}
+            for node_id in node_ids
+        }
+        self.packet_ids = iter(range(1, 1 << 31))
+
+    def sendText(self, *args: Any, **kwargs: Any) -> SimpleNamespace:
+        return SimpleNamespace(id=next(self.packet_ids))
+
+    def getMyNodeInfo(self) -> Dict[str, Any]:
+        return {"user": {"id": "!00000000"}}
+
+class StubResponse:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, *args: Any, **kwargs: Any) -> None:
+        self.sent += 1
+
+    async def defer(self, *args: Any, **kwargs: Any) -> None:
+        return None
+
+    def is_done(self) -> bool:
+        return self.sent > 0
+
+def stub_interaction(user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(user=StubUser(user_id), response=StubResponse(), followup=StubResponse())
+
+def synthetic_record(rng: random.Random, node_ids: List[str], timestamp: float) -> Dict[str, Any]:
+    return {
+        "node_id": rng.choice(node_ids),
+        "timestamp": timestamp,
+        "message": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))
+    }
+
+def text_packet(node_id: str, text: str, packet_id: int) -> Dict[str, Any]:
+    return {"id": packet_id, "fromId": node_id, "rxSnr": 5.0, "decoded": {"portnum": "TEXT_MESSAGE_APP", "text": text}}
+
+class Runner:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.results: List[Dict[str, Any]] = []
+
+    def record(self, name: str, size: int, operations: int, seconds: float) -> None:
+        result = {
+            "name": name,
+            "size": size,
+            "operations": operations,
+            "seconds": seconds,
+            "us_per_op": seconds / max(operations, 1) * 1e6
+        }
+        self.results.append(result)
+        print(f"{name:<40} size={size:<9,} ops={operations:<9,} {seconds:9.3f}s {result['us_per_op']:12.1f} us/op")
+
+    def time_sync(self, name: str, size: int, operations: int, func: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        func()
+        self.record(name, size, operations, time.perf_counter() - started)
+
+    def time_async(self, name: str, size: int, operations: int, func: Callable[[], Awaitable[Any]]) -> None:
+        started = time.perf_counter()
+        self.loop.run_until_complete(func())
+        self.record(name, size, operations, time.perf_counter() - started)
+
+# Seed the message log with `size` records spread over the last `size` minutes
+def seed_message_log(bot: Any, size: int, node_ids: List[str]) -> None:
+    rng = random.Random(size)
+    start = time.time() - size * 60
+    batch: List[Dict[str, Any]] = []
+    for index in range(size):
+        batch.append(synthetic_record(rng, node_ids, start + index * 60))
+        if len(batch) == 10_000:
+            bot.message_log.append_many(batch)
+            batch = []
+    if batch:
+        bot.message_log.append_many(batch)
+
+def bench_message_log(runner: Runner, bot: Any, size: int, node_ids: List[str]) -> None:
+    bot.message_log.close()
+    for suffix in ("", ".idx"):
+        if os.path.exists(bot.MESSAGES_LOG_FILE + suffix):
+            os.remove(bot.MESSAGES_LOG_FILE + suffix)
+    bot.message_log = bot.MessageLog(bot.MESSAGES_LOG_FILE, bot.MAX_MESSAGES_FILE_SIZE)
+    bot.message_log.open()
+    seed_message_log(bot, size, node_ids)
+    bot.message_log.close()
+
+    def load() -> None:
+        bot.message_log = bot.MessageLog(bot.MESSAGES_LOG_FILE, bot.MAX_MESSAGES_FILE_SIZE)
+        bot.messages, bot.message_seq_base = bot.load_messages(bot.message_log)
+    runner.time_sync("load_messages", size, 1, load)
+
+    appends = 10_000
+    rng = random.Random(1)
+    records = [synthetic_record(rng, node_ids, time.time()) for _ in range(appends)]
+
+    def append() -> None:
+        for record in records:
+            bot.save_message(record)
+    runner.time_sync("save_message", size, appends, append)
+
+    # A node with no recent messages forces /filtermessages to page through the log on disk
+    rare_node = "!rare0000"
+    bot.data["nodes"][rare_node] = "Rare"
+    bot.meshtastic_interface.nodes[rare_node] = {"user": {"id": rare_node}}
+    bot.message_log.append({"node_id": rare_node, "timestamp": time.time() - size * 60, "message": "old"})
+    interaction = stub_interaction(1)
+
+    async def filter_common() -> None:
+        for _ in range(100):
+            await bot.filtermessages.callback(interaction, node_id=node_ids[0])
+    runner.time_async("filtermessages_recent_node", size, 100, filter_common)
+
+    async def filter_rare() -> None:
+        await bot.filtermessages.callback(interaction, node_id=rare_node)
+    runner.time_async("filtermessages_disk_scan", size, 1, filter_rare)
+
+def bench_packets(runner: Runner, bot: Any, node_ids: List[str], claims: int, users: int) -> None:
+    rng = random.Random(2)
+    bot.pending_claims.clear()
+    now = time.time()
+    for index in range(claims):
+        bot.pending_claims[str(10_000 + index)] = {"code": f"{rng.getrandbits(48):012x}", "timestamp": now}
+    bot.owners.clear()
+    bot.preferences.clear()
+    for index in range(users):
+        user_id = str(100_000 + index)
+        bot.owners[node_ids[index % len(node_ids)]] = user_id
+        bot.preferences[user_id] = {
+            "dm_notifications": index % 2 == 0,
+            "rules": [
+                {"id": f"n{index}", "type": "node", "node_id": rng.choice(node_ids)},
+                {"id": f"k{index}", "type": "keyword", "keyword": f"{rng.choice(WORDS)}{index}"},
+                {"id": f"b{index}", "type": "battery", "node_id": rng.choice(node_ids), "threshold": rng.randint(10, 50)}
+            ],
+            "quiet_hours": [22, 6] if index % 5 == 0 else None
+        }
+    runner.time_sync("notification_rules_compile", users, 1, lambda: bot.notification_rules.compile(bot.preferences))
+
+    packets = [text_packet(rng.choice(node_ids), " ".join(rng.choice(WORDS) for _ in range(8)), index) for index in range(2000)]
+
+    def match() -> None:
+        for packet in packets:
+            bot.notification_rules.match_message(packet["fromId"], packet["decoded"]["text"], bot.owners.get(packet["fromId"]), 12)
+    runner.time_sync("notification_match", users, len(packets), match)
+
+    async def fan_out() -> None:
+        embed = object()
+        for packet in packets[:500]:
+            matches = bot.notification_rules.match_message(packet["fromId"], packet["decoded"]["text"], bot.owners.get(packet["fromId"]), 12)
+            await bot.send_notifications(matches, embed)
+    runner.time_async("dm_fan_out", users, 500, fan_out)
+
+    # Full text-packet handling, including the claim-code scan over every pending claim
+    async def handle() -> None:
+        for packet in packets[:1000]:
+            await bot.on_meshtastic_message_async(packet, None)
+    runner.time_async("text_packet_with_pending_claims", claims, 1000, handle)
+
+def bench_alerts(runner: Runner, bot: Any, count: int) -> None:
+    now = time.time()
+    alerts = [
+        {"message": f"Alert {index}", "frequency": random.choice(["hourly", "daily", "weekly"]),
+         "next_run": now - 1 if index % 10 == 0 else now + 3600, "to_discord": True, "to_mesh": index % 3 == 0}
+        for index in range(count)
+    ]
+    bot.save_alerts(alerts)
+
+    # check_alerts loops forever; stop it at its first sleep
+    class StopLoop(Exception):
+        pass
+
+    class StopAtSleep:
+        def __getattr__(self, name: str) -> Any:
+            return getattr(asyncio, name)
+
+        async def sleep(self, seconds: float) -> None:
+            raise StopLoop()
+
+    async def one_pass() -> None:
+        real_asyncio = bot.asyncio
+        bot.asyncio = StopAtSleep()
+        try:
+            await bot.check_alerts()
+        except StopLoop:
+            pass
+        finally:
+            bot.asyncio = real_asyncio
+    runner.time_async("check_alerts_pass", count, 1, one_pass)
+
+def bench_log_handler(runner: Runner, bot: Any, stub_bot: StubBot, count: int) -> None:
+    handler = bot.DiscordLogHandler(stub_bot)
+    records = [
+        logging.LogRecord("bot", logging.INFO, __file__, 0, "Relayed message %d from %s", (index, "!abcd1234"), None)
+        for index in range(count)
+    ]
+
+    def emit() -> None:
+        for record in records:
+            handler.emit(record)
+    runner.time_sync("discord_log_handler_emit", count, count, emit)
+    runner.time_sync("discord_log_handler_drain", count, count, lambda: runner.loop.run_until_complete(asyncio.sleep(0)))
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Print per-benchmark change against a baseline; returns whether any slowed down past the tolerance
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path, "r") as f:
+        baseline = {(result["name"], result["size"]): result for result in json.load(f)["results"]}
+    regressed = False
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        previous = baseline.get((result["name"], result["size"]))
+        if previous is None:
+            continue
+        ratio = result["us_per_op"] / max(previous["us_per_op"], 1e-9)
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        regressed = regressed or bool(flag)
+        print(f"{result['name']:<40} size={result['size']:<9,} {ratio:6.2f}x{flag}")
+    return regressed
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths offline")
+    parser.add_argument("--sizes", default="10000,100000", help="Message log sizes, comma separated")
+    parser.add_argument("--nodes", type=int, default=300, help="Number of distinct nodes")
+    parser.add_argument("--claims", type=int, default=5000, help="Pending claims during packet handling")
+    parser.add_argument("--users", type=int, default=5000, help="Users with notification preferences")
+    parser.add_argument("--alerts", type=int, default=5000, help="Scheduled alerts")
+    parser.add_argument("--log-records", type=int, default=100_000, help="Records emitted through DiscordLogHandler")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    workdir = tempfile.mkdtemp(prefix="meshbot-bench-")
+    os.chdir(workdir)
+    logging.disable(logging.CRITICAL)
+    import bot
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    rng = random.Random(0)
+    node_ids = [f"!{rng.getrandbits(32):08x}" for _ in range(args.nodes)]
+    stub_bot = StubBot(loop)
+    bot.bot = stub_bot
+    bot.load_state()
+    bot.meshtastic_interface = FakeInterface(node_ids)
+    bot.radio_state = bot.RADIO_CONNECTED
+    bot.data["nodes"].update({node_id: f"Node {node_id}" for node_id in node_ids})
+    # Time the handlers, not the per-guild relay rate limit
+    bot.guild_registry.update(bot.guild_registry.primary_id, relay_rate=1_000_000_000)
+
+    runner = Runner(loop)
+    try:
+        for size in [int(size) for size in args.sizes.split(",") if size]:
+            bench_message_log(runner, bot, size, node_ids)
+        bench_packets(runner, bot, node_ids, args.claims, args.users)
+        bench_alerts(runner, bot, args.alerts)
+        bench_log_handler(runner, bot, stub_bot, args.log_records)
+    finally:
+        bot.message_log.close()
+        loop.close()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": runner.results
+    }
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {json_path}")
+    if baseline_path and compare(runner.results, baseline_path, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Compare resident memory of the old list-of-dicts message log with MessageStore.
+# Usage: python benchmarks/bench_message_memory.py [message_count]
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from message_store import MessageStore
+
+WORDS = "water net check copy roger over signal battery solar relay north south camp trail base ridge".split()
+
+def synthetic_log_json(count: int) -> str:
+    rng = random.Random(42)
+    node_ids = [f"!{rng.getrandbits(32):08x}" for _ in range(300)]
+    start = time.time() - count * 30
+    return json.dumps([
+        {
+            "node_id": rng.choice(node_ids),
+            "timestamp": start + i * 30,
+            "message": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))
+        }
+        for i in range(count)
+    ])
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return current
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    payload = synthetic_log_json(count)
+    # Parsing is included in both cases, as load_messages() does at startup
+    dict_bytes = measure(lambda: json.loads(payload))
+    store_bytes = measure(lambda: MessageStore(json.loads(payload)))
+    print(f"messages:       {count:,}")
+    print(f"list of dicts:  {dict_bytes / 1_048_576:8.1f} MiB ({dict_bytes / count:.0f} B/message)")
+    print(f"MessageStore:   {store_bytes / 1_048_576:8.1f} MiB ({store_bytes / count:.0f} B/message)")
+    print(f"reduction:      {dict_bytes / max(store_bytes, 1):8.1f}x")
+
+if __name__ == "__main__":
+    main()
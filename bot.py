@@ -10,20 +10,41 @@ from pubsub import pub
 import asyncio
 from datetime import datetime, timezone, timedelta
 import secrets
+import hashlib
+import functools
 import time
 import logging
-from logging.handlers import RotatingFileHandler
-from typing import Dict, List, Any, Optional
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s: %(message)s',
-    handlers=[
-        RotatingFileHandler('bot.log', maxBytes=10_000_000, backupCount=5),
-        logging.StreamHandler()
-    ]
+import io
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueListener
+from typing import Dict, List, Any, Optional, Tuple, Callable, Set, Union
+import charts
+from topology import MeshTopology
+from geoindex import GeoGridIndex, position_coordinates
+from node_index import NodeSortIndex, present
+from search_index import MessageSearchIndex, SearchQuery
+from dedup import PacketDeduplicator
+from message_store import MessageLog, MessageStore
+from archive import COMPRESSION_GZIP, MessageArchive, compact_into, export_messages
+from snapshot import SnapshotWriter, copy_to_depth
+from supervisor import TaskSupervisor
+from gateway import GATEWAY_SOCKET_ENV, GatewayClient
+from delivery import STATUS_DELIVERED, STATUS_FAILED, DeliveryTracker
+from notifications import (
+    MAX_KEYWORD_LENGTH, MAX_RULES_PER_USER, RULE_BATTERY, RULE_KEYWORD, RULE_NODE, NotificationRules, describe_rule, new_rule
 )
+from outbox import STALE_AFTER_SECONDS, AirtimePacer, Outbox
+from metrics import MetricsRegistry, RateLimitCounter, start_metrics_server
+from tracing import NULL_TRACE, Tracer, percentiles
+from loop_watchdog import LoopWatchdog
+from log_config import LOG_FORMAT_TEXT, add_listener_handler, configure_logging, parse_log_level, parse_log_levels
+from relay import RELAY_MODE_CHANNEL, RELAY_MODE_WEBHOOK, WebhookRelay, webhook_username
+from guilds import GuildConfig, GuildRegistry
+from bridge import BRIDGE_QUEUED, BRIDGE_USER_LIMITED, FragmentReassembler, MeshBridge, MeshTransmitter
+from mesh_commands import COMMAND_PREFIX, MeshCommandDispatcher
+
 logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
@@ -38,6 +59,33 @@ ADMIN_ROLE_ID: Optional[str] = os.getenv('ADMIN_ROLE_ID')
 NODE_OWNER_ROLE_ID: Optional[str] = os.getenv('NODE_OWNER_ROLE_ID')
 MESHTASTIC_PORT: Optional[str] = os.getenv('MESHTASTIC_PORT')
 ADMIN_LOG_CHANNEL_ID: Optional[str] = os.getenv('ADMIN_LOG_CHANNEL_ID')
+# When set, the radio is reached through a gateway.py daemon on this Unix socket
+MESHTASTIC_GATEWAY_SOCKET: Optional[str] = os.getenv(GATEWAY_SOCKET_ENV)
+# "channel" posts relayed mesh messages as the bot; "webhook" posts them through a
+# pool of channel webhooks named after the sending node
+RELAY_MODE: str = os.getenv('RELAY_MODE', RELAY_MODE_CHANNEL).lower()
+WEBHOOK_POOL_SIZE: int = int(os.getenv('WEBHOOK_POOL_SIZE', '3'))
+# Optional Prometheus endpoint; disabled unless METRICS_PORT is set
+METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT: Optional[int] = int(os.getenv('METRICS_PORT')) if os.getenv('METRICS_PORT') else None
+# Fraction of packets and node updates traced stage by stage (0 disables tracing)
+TRACE_SAMPLE_RATE: float = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))
+# Event-loop stalls longer than this are reported with the blocking stack; LOOP_DEBUG=true
+# also turns on asyncio debug mode, which logs every callback slower than the threshold
+LOOP_LAG_THRESHOLD: float = float(os.getenv('LOOP_LAG_THRESHOLD', '0.5'))
+LOOP_DEBUG: bool = os.getenv('LOOP_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+# Compression for archived message segments: "gzip", or "zstd" when zstandard is installed
+ARCHIVE_COMPRESSION: str = os.getenv('ARCHIVE_COMPRESSION', COMPRESSION_GZIP).lower()
+# Seconds between state snapshots (0 disables); see snapshot.py for restore
+SNAPSHOT_INTERVAL: int = int(os.getenv('SNAPSHOT_INTERVAL', '3600'))
+# Logging: LOG_FORMAT is "text" or "json"; LOG_LEVELS sets per-subsystem levels,
+# e.g. "meshtastic=WARNING,discord=INFO,bot=DEBUG"
+LOG_FILE: str = os.getenv('LOG_FILE', 'bot.log')
+LOG_FORMAT: str = os.getenv('LOG_FORMAT', LOG_FORMAT_TEXT).lower()
+LOG_LEVEL: int = parse_log_level(os.getenv('LOG_LEVEL', 'INFO'))
+LOG_LEVELS: Dict[str, int] = parse_log_levels(os.getenv('LOG_LEVELS'))
+if 'bot' in LOG_LEVELS:
+    LOG_LEVELS.setdefault(logger.name, LOG_LEVELS['bot'])  # "bot" also names this module when run as a script
 
 # Debug: Log loaded environment variables
 logger.debug(f"Loaded BOT_TOKEN: {BOT_TOKEN}")
@@ -48,6 +96,8 @@ logger.debug(f"Loaded ADMIN_ROLE_ID: {ADMIN_ROLE_ID}")
 logger.debug(f"Loaded NODE_OWNER_ROLE_ID: {NODE_OWNER_ROLE_ID}")
 logger.debug(f"Loaded MESHTASTIC_PORT: {MESHTASTIC_PORT}")
 logger.debug(f"Loaded ADMIN_LOG_CHANNEL_ID: {ADMIN_LOG_CHANNEL_ID}")
+logger.debug(f"Loaded MESHTASTIC_GATEWAY_SOCKET: {MESHTASTIC_GATEWAY_SOCKET}")
+logger.debug(f"Loaded RELAY_MODE: {RELAY_MODE}")
 
 # Check required environment variables
 required_vars: Dict[str, Optional[str]] = {
@@ -56,12 +106,14 @@ required_vars: Dict[str, Optional[str]] = {
     'MESHTASTIC_CHANNEL_ID': MESHTASTIC_CHANNEL_ID,
     'MESHTASTIC_NODE_CHANNEL_ID': MESHTASTIC_NODE_CHANNEL_ID,
     'ADMIN_ROLE_ID': ADMIN_ROLE_ID,
-    'NODE_OWNER_ROLE_ID': NODE_OWNER_ROLE_ID,
-    'MESHTASTIC_PORT': MESHTASTIC_PORT
+    'NODE_OWNER_ROLE_ID': NODE_OWNER_ROLE_ID
 }
+if not MESHTASTIC_GATEWAY_SOCKET:
+    required_vars['MESHTASTIC_PORT'] = MESHTASTIC_PORT
 missing_vars: List[str] = [key for key, value in required_vars.items() if value is None]
 if missing_vars:
     raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
+ADMIN_LOG_CHANNEL: Optional[int] = int(ADMIN_LOG_CHANNEL_ID) if ADMIN_LOG_CHANNEL_ID else None
 
 # Discord log handler
 class DiscordLogHandler(logging.Handler):
@@ -71,7 +123,7 @@ class DiscordLogHandler(logging.Handler):
         self.queue: asyncio.Queue = asyncio.Queue()
 
     def emit(self, record: logging.LogRecord):
-        if not ADMIN_LOG_CHANNEL_ID:
+        if not ADMIN_LOG_CHANNEL:
             return
         log_message = self.format(record)
         embed_color = {
@@ -88,14 +140,19 @@ class DiscordLogHandler(logging.Handler):
             timestamp=datetime.now(timezone.utc)
         )
         embed.set_footer(text="Logged via Meshtastic Bot")
-        asyncio.run_coroutine_threadsafe(
-            self.queue.put(embed),
-            self.bot.loop
-        )
+        # Runs on the log listener thread; hand the embed to the event loop
+        try:
+            self.bot.loop.call_soon_threadsafe(self.queue.put_nowait, embed)
+        except (AttributeError, RuntimeError):
+            pass  # Event loop not started yet or already closed
+
+# The operator's admin log channel (shared by all guilds), if configured
+def admin_log_channel() -> Optional[discord.abc.Messageable]:
+    return bot.get_channel(ADMIN_LOG_CHANNEL) if ADMIN_LOG_CHANNEL else None
 
 # Discord log message sender
 async def discord_log_sender(bot: commands.Bot, queue: asyncio.Queue):
-    channel = bot.get_channel(int(ADMIN_LOG_CHANNEL_ID)) if ADMIN_LOG_CHANNEL_ID else None
+    channel = admin_log_channel()
     if not channel:
         logger.warning("Admin log channel not found or not set; Discord logging disabled")
         return
@@ -113,17 +170,109 @@ async def discord_log_sender(bot: commands.Bot, queue: asyncio.Queue):
         await asyncio.sleep(0.2)  # Rate limit: 5 messages/second
         queue.task_done()
 
+# Metrics registry, scraped through /metrics when METRICS_PORT is set
+metrics = MetricsRegistry()
+PACKETS_RECEIVED = metrics.counter("meshtastic_packets_received_total", "Packets received from the radio", ["portnum"])
+PACKETS_DUPLICATE = metrics.counter("meshtastic_packets_duplicate_total", "Received packets dropped as duplicates")
+MESSAGES_RELAYED = metrics.counter("meshtastic_messages_relayed_total", "Mesh text messages posted to Discord", ["method"])
+RELAY_DROPPED = metrics.counter("meshtastic_relay_dropped_total", "Mesh text messages skipped for a guild over its relay rate", ["guild"])
+MESH_COMMANDS = metrics.counter("meshtastic_mesh_commands_total", "Commands DM'd to the gateway node, by outcome", ["outcome"])
+BRIDGE_MESSAGES = metrics.counter("meshtastic_bridge_messages_total", "Discord messages in bridged channels, by outcome", ["status"])
+DISCORD_REQUEST_SECONDS = metrics.histogram(
+    "discord_request_duration_seconds", "Discord API request latency, including rate-limit waits", ["method", "route"]
+)
+DISCORD_RATE_LIMITS = metrics.counter("discord_rate_limits_total", "Discord 429 responses retried by discord.py", ["scope"])
+DISCORD_GLOBAL_RATE_LIMITS = metrics.counter("discord_global_rate_limits_total", "Discord 429 responses that hit the global rate limit")
+PERSISTENCE_WRITE_SECONDS = metrics.histogram("persistence_write_duration_seconds", "Time spent writing state files", ["file"])
+PERSISTENCE_WRITE_BYTES = metrics.counter("persistence_write_bytes_total", "Bytes written to state files", ["file"])
+SNAPSHOT_CAPTURE_SECONDS = metrics.histogram(
+    "snapshot_capture_duration_seconds", "Time the event loop spends copying state for a snapshot",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+ALERT_FIRE_LAG_SECONDS = metrics.histogram(
+    "alert_fire_lag_seconds", "Delay between an alert's scheduled time and when it fired",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800)
+)
+RADIO_CONNECTION_EVENTS = metrics.counter("meshtastic_connection_events_total", "Radio connections established and lost", ["event"])
+metrics.gauge("discord_log_queue_depth", "Embeds waiting to be posted to the admin log channel",
+              function=lambda: discord_log_handler.queue.qsize() if discord_log_handler else 0)
+metrics.gauge("pending_claims", "Node claims waiting for their code", function=lambda: len(pending_claims))
+metrics.gauge("setup_sessions", "Active setup wizard sessions", function=lambda: len(setup_sessions))
+metrics.gauge("meshtastic_radio_connected", "Whether the radio is connected", function=lambda: radio_state == RADIO_CONNECTED)
+metrics.gauge("deliveries_pending", "Direct messages waiting for an ACK", function=lambda: len(delivery_tracker.pending))
+metrics.gauge("outbox_messages", "Messages queued for offline nodes",
+              function=lambda: sum(len(queue) for queue in outbox.queues.values()))
+metrics.gauge("background_task_restarts", "Crash restarts across supervised background tasks",
+              function=lambda: sum(task_supervisor.restarts.values()))
+metrics_runner = None
+
+# Heartbeat task plus sampling thread that catch whatever blocks the event loop
+loop_watchdog = LoopWatchdog(
+    lambda report: logger.warning(report),
+    LOOP_LAG_THRESHOLD,
+    metrics.histogram(
+        "event_loop_lag_seconds", "Event-loop scheduling delay of a 250ms heartbeat",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    ),
+    metrics.counter("event_loop_stalls_total", "Heartbeats delayed by more than LOOP_LAG_THRESHOLD")
+)
+
+# Per-stage latency of sampled packets and node updates, shown by /perf
+tracer = Tracer(TRACE_SAMPLE_RATE, metrics.histogram(
+    "event_stage_duration_seconds", "Time spent in each stage of handling a sampled packet or node update", ["kind", "stage"]
+))
+
+# Record how long a state-file save took and how large the file is afterwards
+def record_write(path: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PERSISTENCE_WRITE_SECONDS.observe(time.perf_counter() - started, file=path)
+                try:
+                    PERSISTENCE_WRITE_BYTES.inc(os.path.getsize(path), file=path)
+                except OSError:
+                    pass
+        return wrapper
+    return decorator
+
 # Paths for persistent JSON storage
 DATA_FILE: str = "data.json"
 OWNERS_FILE: str = "owners.json"
-MESSAGES_FILE: str = "messages.json"
+MESSAGES_FILE: str = "messages.json"  # Legacy format, migrated to MESSAGES_LOG_FILE
+MESSAGES_LOG_FILE: str = "messages.jsonl"
+ARCHIVE_DIR: str = "archive"  # Compressed segments of messages compacted out of MESSAGES_LOG_FILE
 ABOUT_FILE: str = "about.json"
 ALERTS_FILE: str = "alerts.json"
 PREFERENCES_FILE: str = "preferences.json"
+NODE_HISTORY_FILE: str = "node_history.json"
+COMMAND_SYNC_FILE: str = "command_sync.json"
+GATEWAY_STATE_FILE: str = "gateway_state.json"
+GUILDS_FILE: str = "guilds.json"
+DELIVERIES_FILE: str = "deliveries.json"
+OUTBOX_FILE: str = "outbox.json"
+SNAPSHOT_DIR: str = "snapshots"
 
 # Message size limit (500MB in bytes)
 MAX_MESSAGES_FILE_SIZE: int = 500_000_000
-MAX_PREFERENCES_FILE_SIZE: int = 10_000_000
+
+# Messages kept in memory: everything from the last MESSAGE_WINDOW_HOURS, but at least
+# MESSAGE_WINDOW_MIN_MESSAGES and at most MESSAGE_WINDOW_MAX_MESSAGES. Older history
+# stays on disk and is paged in on demand.
+MESSAGE_WINDOW_HOURS: int = 24
+MESSAGE_WINDOW_MIN_MESSAGES: int = 1000
+MESSAGE_WINDOW_MAX_MESSAGES: int = 50_000
+# Older lines /filtermessages reads from disk before giving up on finding more matches
+FILTER_SCAN_MAX_LINES: int = 200_000
+
+# Node history limits (per node) and chart cache settings
+MAX_NODE_HISTORY_SAMPLES: int = 2000
+MAX_NODE_HISTORY_AGE: int = 7 * 86400
+CHART_CACHE_SECONDS: int = 300
+MAX_CHART_CACHE_ENTRIES: int = 64
 
 # Reboot tracking
 reboot_in_progress: bool = False
@@ -138,6 +287,7 @@ def load_data() -> Dict[str, Any]:
         logger.warning(f"Failed to load {DATA_FILE}; returning default")
         return {"nodes": {}, "settings": {}}
 
+@record_write(DATA_FILE)
 def save_data(data: Dict[str, Any]) -> None:
     try:
         with open(DATA_FILE, 'w') as f:
@@ -153,6 +303,7 @@ def load_owners() -> Dict[str, str]:
         logger.warning(f"Failed to load {OWNERS_FILE}; returning default")
         return {}
 
+@record_write(OWNERS_FILE)
 def save_owners(owners: Dict[str, str]) -> None:
     try:
         with open(OWNERS_FILE, 'w') as f:
@@ -160,24 +311,63 @@ def save_owners(owners: Dict[str, str]) -> None:
     except IOError as e:
         logger.error(f"Failed to save owners to {OWNERS_FILE}: {e}")
 
-def load_messages() -> List[Dict[str, Any]]:
+# One-time conversion of the legacy JSON array into the append-only log
+def migrate_legacy_messages(log: MessageLog) -> None:
+    if not os.path.exists(MESSAGES_FILE) or log.next_seq > log.first_seq:
+        return
     try:
         with open(MESSAGES_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        logger.warning(f"Failed to load {MESSAGES_FILE}; returning default")
-        return []
-
-def save_messages(messages: List[Dict[str, Any]]) -> None:
+            legacy = json.load(f)
+        log.append_many(legacy)
+        os.replace(MESSAGES_FILE, MESSAGES_FILE + ".migrated")
+        logger.info(f"Migrated {len(legacy)} messages from {MESSAGES_FILE} to {MESSAGES_LOG_FILE}")
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Failed to migrate {MESSAGES_FILE}: {e}")
+
+# Open the message log and load only the recent window into memory.
+# Returns the window and the sequence number of its first message.
+def load_messages(log: MessageLog) -> Tuple[MessageStore, int]:
     try:
-        with open(MESSAGES_FILE, 'w') as f:
-            json.dump(messages, f, indent=4)
-        while os.path.getsize(MESSAGES_FILE) > MAX_MESSAGES_FILE_SIZE and messages:
-            messages.pop(0)
-            with open(MESSAGES_FILE, 'w') as f:
-                json.dump(messages, f, indent=4)
+        log.open()
+        migrate_legacy_messages(log)
+        since = time.time() - MESSAGE_WINDOW_HOURS * 3600
+        # Read backwards from the end until past the time window (keeping the minimum count)
+        recent = log.scan_backward(log.next_seq, max_lines=MESSAGE_WINDOW_MAX_MESSAGES)
+        keep = len(recent)
+        for position, (_, record) in enumerate(recent):
+            if position >= MESSAGE_WINDOW_MIN_MESSAGES and record.get("timestamp", 0) < since:
+                keep = position
+                break
+        recent = recent[:keep]
+        recent.reverse()
+        return MessageStore(record for _, record in recent), log.next_seq - len(recent)
+    except (IOError, ValueError) as e:
+        logger.warning(f"Failed to load {MESSAGES_LOG_FILE}; returning default: {e}")
+        return MessageStore(), log.next_seq
+
+# Append a message to the on-disk log and the in-memory window; returns its sequence number
+def save_message(record: Dict[str, Any]) -> Optional[int]:
+    global message_seq_base
+    started = time.perf_counter()
+    end_offset = message_log.end_offset
+    try:
+        seq = message_log.append(record)
     except IOError as e:
-        logger.error(f"Failed to save messages to {MESSAGES_FILE}: {e}")
+        logger.error(f"Failed to save message to {MESSAGES_LOG_FILE}: {e}")
+        return None
+    PERSISTENCE_WRITE_SECONDS.observe(time.perf_counter() - started, file=MESSAGES_LOG_FILE)
+    PERSISTENCE_WRITE_BYTES.inc(message_log.end_offset - end_offset, file=MESSAGES_LOG_FILE)
+    messages.append(record)
+    if len(messages) > MESSAGE_WINDOW_MAX_MESSAGES:
+        # Older messages remain on disk; drop a batch from memory at once
+        evicted = len(messages) - MESSAGE_WINDOW_MAX_MESSAGES + MESSAGE_WINDOW_MAX_MESSAGES // 10
+        messages.evict(evicted)
+        message_seq_base += evicted
+    if search_index_ready:
+        search_index.add(seq, record["timestamp"], record["message"], record["node_id"])
+    if message_log.needs_compaction():
+        task_supervisor.start("compact_message_log", compact_message_log, wait_ready=False)
+    return seq
 
 def load_about() -> Dict[str, Any]:
     try:
@@ -193,6 +383,7 @@ def load_about() -> Dict[str, Any]:
             "custom_message": ""
         }
 
+@record_write(ABOUT_FILE)
 def save_about(about: Dict[str, Any]) -> None:
     try:
         with open(ABOUT_FILE, 'w') as f:
@@ -208,6 +399,7 @@ def load_alerts() -> List[Dict[str, Any]]:
         logger.warning(f"Failed to load {ALERTS_FILE}; returning default")
         return []
 
+@record_write(ALERTS_FILE)
 def save_alerts(alerts: List[Dict[str, Any]]) -> None:
     try:
         with open(ALERTS_FILE, 'w') as f:
@@ -215,7 +407,7 @@ def save_alerts(alerts: List[Dict[str, Any]]) -> None:
     except IOError as e:
         logger.error(f"Failed to save alerts to {ALERTS_FILE}: {e}")
 
-def load_preferences() -> Dict[str, Dict[str, bool]]:
+def load_preferences() -> Dict[str, Dict[str, Any]]:
     try:
         with open(PREFERENCES_FILE, 'r') as f:
             return json.load(f)
@@ -223,44 +415,170 @@ def load_preferences() -> Dict[str, Dict[str, bool]]:
         logger.warning(f"Failed to load {PREFERENCES_FILE}; returning default")
         return {}
 
-def save_preferences(preferences: Dict[str, Dict[str, bool]]) -> None:
+# Saving also recompiles the notification matchers; rules per user are capped,
+# so the file stays small without evicting anyone
+@record_write(PREFERENCES_FILE)
+def save_preferences(preferences: Dict[str, Dict[str, Any]]) -> None:
+    notification_rules.compile(preferences)
     try:
         with open(PREFERENCES_FILE, 'w') as f:
             json.dump(preferences, f, indent=4)
-        while os.path.getsize(PREFERENCES_FILE) > MAX_PREFERENCES_FILE_SIZE and preferences:
-            oldest_user = next(iter(preferences))
-            del preferences[oldest_user]
-            with open(PREFERENCES_FILE, 'w') as f:
-                json.dump(preferences, f, indent=4)
     except IOError as e:
         logger.error(f"Failed to save preferences to {PREFERENCES_FILE}: {e}")
 
-# Initialize data
-data: Dict[str, Any] = load_data()
-owners: Dict[str, str] = load_owners()
+def load_node_history() -> Dict[str, List[Dict[str, Any]]]:
+    try:
+        with open(NODE_HISTORY_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        logger.warning(f"Failed to load {NODE_HISTORY_FILE}; returning default")
+        return {}
+
+@record_write(NODE_HISTORY_FILE)
+def save_node_history(node_history: Dict[str, List[Dict[str, Any]]]) -> None:
+    try:
+        with open(NODE_HISTORY_FILE, 'w') as f:
+            json.dump(node_history, f)
+    except IOError as e:
+        logger.error(f"Failed to save node history to {NODE_HISTORY_FILE}: {e}")
+
+# Persistent state; empty until load_state() runs at startup
+data: Dict[str, Any] = {"nodes": {}, "settings": {}}
+owners: Dict[str, str] = {}
 pending_claims: Dict[str, Dict[str, Any]] = {}
-messages: List[Dict[str, Any]] = load_messages()
-about: Dict[str, Any] = load_about()
-alerts: List[Dict[str, Any]] = load_alerts()
-preferences: Dict[str, Dict[str, bool]] = load_preferences()
-
-# Set up the bot with intents
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Add Discord log handler
-discord_log_handler = DiscordLogHandler(bot)
-discord_log_handler.setLevel(logging.DEBUG)
-logger.addHandler(discord_log_handler)
-
-# Meshtastic interface
-try:
-    meshtastic_interface = meshtastic.serial_interface.SerialInterface(MESHTASTIC_PORT)
-except Exception as e:
-    logger.error(f"Failed to connect to Meshtastic on {MESHTASTIC_PORT}: {e}")
-    meshtastic_interface = None
+message_log = MessageLog(MESSAGES_LOG_FILE, MAX_MESSAGES_FILE_SIZE)
+message_archive = MessageArchive(ARCHIVE_DIR, ARCHIVE_COMPRESSION)
+snapshot_writer = SnapshotWriter(SNAPSHOT_DIR)
+snapshot_lock = asyncio.Lock()
+# Recent window of the log; message_seq_base is the sequence number of messages[0]
+messages: MessageStore = MessageStore()
+message_seq_base: int = 0
+alerts: List[Dict[str, Any]] = []
+preferences: Dict[str, Dict[str, Any]] = {}  # {user_id: {"dm_notifications": bool, "rules": [...], "quiet_hours": [start, end]}}
+notification_rules = NotificationRules()
+node_history: Dict[str, List[Dict[str, Any]]] = {}
+node_history_dirty: bool = False
+
+# Load all persistent state from disk
+def load_state() -> None:
+    global data, owners, messages, message_seq_base, alerts, preferences, node_history
+    data = load_data()
+    owners = load_owners()
+    messages, message_seq_base = load_messages(message_log)
+    message_archive.load()
+    alerts = load_alerts()
+    preferences = load_preferences()
+    notification_rules.compile(preferences)
+    node_history = load_node_history()
+    delivery_tracker.load()
+    outbox.load()
+    guild_registry.load()
+
+# Wall-clock duration of each startup phase, in seconds
+startup_timings: Dict[str, float] = {}
+process_started_at: float = time.perf_counter()
+
+def record_startup_phase(phase: str, started: float) -> None:
+    startup_timings[phase] = time.perf_counter() - started
+    logger.info(f"Startup phase {phase} took {startup_timings[phase]:.2f}s")
+
+# Rendered chart cache: {(node_id, metric, hours, last_update): (rendered_at, png_bytes)}
+chart_cache: "OrderedDict[Tuple[str, str, int, float], Tuple[float, bytes]]" = OrderedDict()
+chart_executor: Optional[ProcessPoolExecutor] = None
+
+# Mesh topology graph built from neighbor info, traceroutes and the NodeDB
+mesh_topology = MeshTopology()
+local_node_id: Optional[str] = None
+
+# Spatial index of node positions for radius and bounding-box queries
+geo_index = GeoGridIndex()
+
+# Pre-sorted node index backing the paginated /nodes listing
+NODE_SORT_KEYS: List[str] = ["last_heard", "battery", "snr", "owner", "name"]
+NODES_PAGE_SIZE: int = 10
+node_sort_index = NodeSortIndex(NODE_SORT_KEYS)
+
+# Inverted index over logged message text, built in the background at startup
+SEARCH_PAGE_SIZE: int = 5
+search_index = MessageSearchIndex()
+search_index_ready: bool = False
+
+# Drops rebroadcast/retransmitted copies of packets already handled
+DEDUP_WINDOW_SECONDS: int = 600
+DEDUP_MAX_ENTRIES: int = 10_000
+packet_deduplicator = PacketDeduplicator(DEDUP_WINDOW_SECONDS, DEDUP_MAX_ENTRIES)
+
+# Send a direct message asking the destination for a routing ACK; returns the packet id
+def send_direct_text(node_id: str, text: str, channel: int) -> Optional[int]:
+    if meshtastic_interface is None:
+        raise ConnectionError(radio_unavailable_message())
+    packet = meshtastic_interface.sendText(text=text, destinationId=node_id, wantAck=True, channelIndex=channel)
+    return getattr(packet, "id", None)
+
+# Outbound direct messages awaiting an ACK, with per-node delivery stats
+delivery_tracker = DeliveryTracker(DELIVERIES_FILE, send_direct_text)
+
+# Direct messages held for nodes that are out of range, flushed when they are heard again
+outbox = Outbox(OUTBOX_FILE)
+outbox_pacer = AirtimePacer()
+
+# Broadcast text on a mesh channel (or to one node), for the paced transmit path
+def send_mesh_text(text: str, channel: int, destination: str) -> None:
+    if meshtastic_interface is None:
+        raise ConnectionError(radio_unavailable_message())
+    meshtastic_interface.sendText(text=text, destinationId=destination, channelIndex=channel)
+
+# Discord-to-mesh bridge: texts share the outbox's airtime pacer, so bridged
+# chatter and outbox flushes together stay within one duty cycle
+mesh_transmitter = MeshTransmitter(send_mesh_text, outbox_pacer)
+mesh_bridge = MeshBridge(mesh_transmitter)
+# Inbound fragments of long messages, held until the whole message is in
+fragment_reassembler = FragmentReassembler()
+
+# Commands mesh nodes DM to the gateway node (!ping, !nodes, ...), registered below the handlers
+mesh_command_dispatcher = MeshCommandDispatcher()
+MESH_COMMAND_CACHE_SECONDS: int = 60
+MESH_NODES_LISTED: int = 5
+MESH_WEATHER_NODES: int = 3
+MESH_ALERTS_LISTED: int = 3
+# Replies are kept to a few packets; longer ones are cut off
+MAX_MESH_REPLY_FRAGMENTS: int = 3
+
+# Discord servers sharing the radio; the one from the environment is the primary
+guild_registry = GuildRegistry(GUILDS_FILE, GuildConfig(
+    int(GUILD_ID),
+    relay_channel_id=MESHTASTIC_CHANNEL_ID,
+    node_channel_id=MESHTASTIC_NODE_CHANNEL_ID,
+    admin_role_id=ADMIN_ROLE_ID,
+    node_owner_role_id=NODE_OWNER_ROLE_ID
+))
+# Relayed messages further behind a guild's rate budget than this are dropped for that guild
+MAX_GUILD_RELAY_WAIT_SECONDS: float = 10.0
+
+# Webhook pools for relaying mesh messages (RELAY_MODE=webhook), one per relay channel
+webhook_relays: Dict[int, WebhookRelay] = {}
+
+# Discord client and log handler, created by create_bot()
+bot: commands.Bot = None
+discord_log_handler: Optional[DiscordLogHandler] = None
+# Background thread that owns the log handlers (set up in main)
+log_listener: Optional[QueueListener] = None
+# Owns the background tasks; each waits for the Discord cache before its first run
+task_supervisor = TaskSupervisor()
+
+# Meshtastic interface, opened in the background by connect_radio(): either the
+# serial port itself or a GatewayClient with the same interface
+meshtastic_interface: Union[meshtastic.serial_interface.SerialInterface, GatewayClient, None] = None
+RADIO_DISCONNECTED: str = "disconnected"
+RADIO_CONNECTING: str = "connecting"
+RADIO_CONNECTED: str = "connected"
+radio_state: str = RADIO_DISCONNECTED
+
+# Error text for commands that need the radio while it is unavailable
+def radio_unavailable_message() -> str:
+    if radio_state == RADIO_CONNECTING:
+        return "Meshtastic radio is still connecting. Please try again shortly."
+    return "Meshtastic device not connected."
 
 # Emoji constants
 EMOJIS = {
@@ -272,6 +590,262 @@ EMOJIS = {
     "skip": "\u23ed\ufe0f"   # ⏭️
 }
 
+# Format a node as "Long Name (!id)"
+def node_label(node_id: str) -> str:
+    return f"{data['nodes'].get(node_id, 'Unknown')} ({node_id})"
+
+# Node ID of the locally connected radio (cached after the first lookup)
+def get_local_node_id() -> Optional[str]:
+    global local_node_id
+    if local_node_id is None and meshtastic_interface:
+        try:
+            local_node_id = (meshtastic_interface.getMyNodeInfo() or {}).get("user", {}).get("id")
+        except Exception as e:
+            logger.warning(f"Failed to read local node ID: {e}")
+    return local_node_id
+
+# Seed the topology graph from the NodeDB downloaded at connect time
+def seed_topology() -> None:
+    local_id = get_local_node_id()
+    for node_id, node_info in list(meshtastic_interface.nodes.items()):
+        mesh_topology.ingest_node(local_id, node_id, node_info)
+    summary = mesh_topology.summary()
+    logger.info(f"Topology seeded with {summary['nodes']} nodes and {summary['edges']} edges")
+
+# Update the spatial index from a NodeDB entry or decoded position
+def index_node_position(node_id: str, position: Dict[str, Any]) -> None:
+    coordinates = position_coordinates(position)
+    if coordinates:
+        geo_index.update(node_id, coordinates[0], coordinates[1], position.get("time") or time.time())
+
+# Seed the spatial index from the NodeDB downloaded at connect time
+def seed_geo_index() -> None:
+    for node_id, node_info in list(meshtastic_interface.nodes.items()):
+        index_node_position(node_id, node_info.get("position", {}))
+    logger.info(f"Spatial index seeded with {len(geo_index)} node positions")
+
+# Battery level from a NodeDB entry (newer firmware nests it under deviceMetrics)
+def node_battery(node_info: Dict[str, Any]) -> Optional[int]:
+    battery = node_info.get("deviceMetrics", {}).get("batteryLevel", node_info.get("batteryLevel"))
+    return battery if isinstance(battery, int) else None
+
+# Display name of a node owner in any guild sharing the radio, falling back to the Discord user ID
+def owner_display_name(owner_id: str) -> str:
+    for config in guild_registry:
+        guild = bot.get_guild(config.guild_id)
+        member = guild.get_member(int(owner_id)) if guild else None
+        if member:
+            return member.display_name
+    return f"ID: {owner_id}"
+
+# A configured channel, or None when the guild has not set one
+def guild_channel(channel_id: Optional[int]) -> Optional[discord.abc.Messageable]:
+    return bot.get_channel(channel_id) if channel_id else None
+
+# Grant or remove the node owner role in every guild, depending on whether the user still owns a node
+async def sync_owner_roles(user_id: str) -> None:
+    owns_node = any(owner_id == user_id for owner_id in owners.values())
+    for config in guild_registry:
+        guild = bot.get_guild(config.guild_id)
+        member = guild.get_member(int(user_id)) if guild else None
+        role = guild.get_role(config.node_owner_role_id) if member and config.node_owner_role_id else None
+        if role is None:
+            continue
+        try:
+            if owns_node and role not in member.roles:
+                await member.add_roles(role)
+            elif not owns_node and role in member.roles:
+                await member.remove_roles(role)
+        except discord.Forbidden:
+            logger.warning(f"Missing permission to update the node owner role in guild {config.guild_id}")
+
+# App command check: the user holds the admin role configured for the guild the command was used in
+def is_admin(interaction: discord.Interaction) -> bool:
+    config = guild_registry.get(interaction.guild_id)
+    if config is None or config.admin_role_id is None or not isinstance(interaction.user, discord.Member):
+        return False
+    return interaction.user.get_role(config.admin_role_id) is not None
+
+# App command check for commands that act on the shared radio or on every guild's
+# nodes and data (/reboot, /addnode, /exportmessages, /linkguild, ...): an admin of the primary guild
+def is_primary_admin(interaction: discord.Interaction) -> bool:
+    return interaction.guild_id == guild_registry.primary_id and is_admin(interaction)
+
+# Whether an alert belongs to a guild; alerts saved before guilds were tracked belong to the primary
+def alert_in_guild(alert: Dict[str, Any], guild_id: Optional[int]) -> bool:
+    return guild_registry.get_or_primary(alert.get("guild_id")).guild_id == guild_id
+
+# Recompute a node's sort keys and move it within the /nodes index
+def refresh_node_index(node_id: str) -> None:
+    node_info = meshtastic_interface.nodes.get(node_id, {}) if meshtastic_interface else {}
+    keys: Dict[str, Any] = {
+        "name": present(data["nodes"].get(node_id, node_info.get("user", {}).get("longName", "Unknown")).lower())
+    }
+    last_heard = node_info.get("lastHeard")
+    if isinstance(last_heard, (int, float)):
+        keys["last_heard"] = present(-last_heard)
+    battery = node_battery(node_info)
+    if battery is not None:
+        keys["battery"] = present(-battery)
+    snr = node_info.get("snr")
+    if isinstance(snr, (int, float)):
+        keys["snr"] = present(-snr)
+    owner_id = owners.get(node_id)
+    if owner_id:
+        keys["owner"] = present((owner_display_name(owner_id).lower(), keys["name"][1]))
+    node_sort_index.update(node_id, keys)
+
+# Seed the /nodes index from the NodeDB and ownership records
+def seed_node_index() -> None:
+    node_ids = set(meshtastic_interface.nodes.keys()) if meshtastic_interface else set()
+    for node_id in node_ids | set(owners.keys()):
+        refresh_node_index(node_id)
+    logger.info(f"Node index seeded with {len(node_sort_index)} nodes")
+
+# A logged message by sequence number, from the in-memory window or paged in from disk
+def message_record(seq: int) -> Optional[Dict[str, Any]]:
+    index = seq - message_seq_base
+    if 0 <= index < len(messages):
+        return messages[index]
+    try:
+        return message_log.read(seq)
+    except (IOError, IndexError, ValueError):
+        return None
+
+def message_text(seq: int) -> Optional[str]:
+    record = message_record(seq)
+    return record["message"] if record else None
+
+# Background task to index the whole log (read from disk in chunks by a worker thread)
+async def build_search_index():
+    global search_index_ready
+    started = time.time()
+    while True:
+        rows = await asyncio.to_thread(message_log.read_forward, search_index.next_seq, 2000)
+        if not rows:
+            if search_index.next_seq >= message_log.next_seq:
+                break
+            continue
+        if rows[0][0] > search_index.next_seq:
+            search_index.evict_before(rows[0][0])  # The log was compacted while reading
+        for seq, record in rows:
+            if seq == search_index.next_seq:
+                search_index.add(seq, record["timestamp"], record["message"], record["node_id"])
+    search_index_ready = True
+    logger.info(f"Search index built over {len(search_index)} messages in {time.time() - started:.1f}s")
+
+# Trim the oldest part of the log file once it exceeds MAX_MESSAGES_FILE_SIZE
+async def compact_message_log():
+    global message_seq_base
+    try:
+        # Evicted messages are streamed into the archive before the log is cut
+        dropped = await asyncio.to_thread(compact_into, message_archive, message_log)
+        if message_seq_base < message_log.first_seq:
+            messages.evict(message_log.first_seq - message_seq_base)
+            message_seq_base = message_log.first_seq
+        search_index.evict_before(message_log.first_seq)
+        logger.info(f"Compacted {MESSAGES_LOG_FILE}: archived {dropped} oldest messages to {ARCHIVE_DIR}")
+    except (IOError, OSError) as e:
+        logger.error(f"Failed to compact {MESSAGES_LOG_FILE}: {e}")
+
+# Background task to time out unacknowledged deliveries and send retries
+async def track_deliveries():
+    while True:
+        await delivery_tracker.tick()
+        await asyncio.sleep(5)
+
+# Copy every store at one instant. This runs on the event loop without
+# awaiting, and every store is only mutated on the loop, so no handler can run
+# between two copies. Only the containers the bot mutates in place are copied
+# (see copy_to_depth); serialization happens later in a worker thread.
+def capture_state() -> Dict[str, Dict[str, Any]]:
+    return {
+        "data": {"file": DATA_FILE, "depth": 2, "value": copy_to_depth(data, 2)},
+        "owners": {"file": OWNERS_FILE, "depth": 1, "value": dict(owners)},
+        "about": {"file": ABOUT_FILE, "depth": 0, "value": load_about()},
+        "alerts": {"file": ALERTS_FILE, "depth": 0, "value": copy_to_depth(alerts, None)},
+        "preferences": {"file": PREFERENCES_FILE, "depth": 1, "value": copy_to_depth(preferences, None)},
+        "node_history": {"file": NODE_HISTORY_FILE, "depth": 1, "value": copy_to_depth(node_history, 2)},
+        "deliveries": {"file": DELIVERIES_FILE, "depth": 1, "value": copy_to_depth({
+            "pending": list(delivery_tracker.pending.values()),
+            "history": list(delivery_tracker.history),
+            "stats": delivery_tracker.node_stats
+        }, None)},
+        "outbox": {"file": OUTBOX_FILE, "depth": 1, "value": copy_to_depth(outbox.queues, None)},
+        "guilds": {"file": GUILDS_FILE, "depth": 1, "value": {
+            str(config.guild_id): config.to_dict() for config in guild_registry
+        }}
+    }
+
+# Take a snapshot: copy state on the loop, then compress and write it in a thread
+async def take_snapshot() -> Dict[str, Any]:
+    async with snapshot_lock:
+        started = time.perf_counter()
+        stores = capture_state()
+        end_seq = message_log.next_seq
+        SNAPSHOT_CAPTURE_SECONDS.observe(time.perf_counter() - started)
+        header = await asyncio.to_thread(snapshot_writer.write, stores, message_log, MESSAGES_LOG_FILE, end_seq)
+        logger.info(
+            f"Wrote {header['kind']} snapshot #{header['id']} to {snapshot_writer.chain_path} "
+            f"({header['entries']} entries, {header['message_range'][1] - header['message_range'][0]} messages)"
+        )
+        return header
+
+# Background task to snapshot state every SNAPSHOT_INTERVAL seconds
+async def snapshot_state():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await take_snapshot()
+        except (IOError, OSError) as e:
+            logger.error(f"Failed to write snapshot to {SNAPSHOT_DIR}: {e}")
+
+# Background task to drop outbox messages past their TTL
+async def expire_outbox():
+    while True:
+        expired = outbox.expire()
+        if expired:
+            logger.info(f"Dropped {expired} expired outbox messages")
+        await asyncio.sleep(300)
+
+# Send a node's queued messages now that it has been heard, paced by airtime. A
+# message leaves the outbox only once the delivery tracker has taken it, so a
+# flush cancelled during the wait or a crashed send keeps it queued.
+async def flush_outbox(node_id: str):
+    while True:
+        entry = outbox.peek(node_id)
+        if entry is None:
+            return
+        wait = outbox_pacer.reserve(entry["text"])
+        if wait:
+            await asyncio.sleep(wait)
+        if entry is not outbox.peek(node_id):
+            continue  # cleared with /outbox or expired while waiting
+        await delivery_tracker.send(node_id, entry["text"], entry["channel"])
+        outbox.remove(node_id, entry["id"])
+        logger.info(f"Flushed outbox message {entry['id']} to {node_id}, queued by {entry['queued_by']}")
+
+# Start flushing a node's outbox unless it is empty or already being flushed
+def schedule_outbox_flush(node_id: str) -> None:
+    if outbox.has_messages(node_id) and radio_state == RADIO_CONNECTED:
+        task_supervisor.start(f"flush_outbox:{node_id}", lambda: flush_outbox(node_id), wait_ready=False)
+
+# Whether a node has been heard recently enough to send to it directly
+def node_is_reachable(node_info: Dict[str, Any]) -> bool:
+    last_heard = node_info.get("lastHeard")
+    return bool(last_heard) and time.time() - last_heard < STALE_AFTER_SECONDS
+
+# Background task to drop topology edges that have not been refreshed
+async def prune_topology():
+    while True:
+        await asyncio.sleep(300)
+        try:
+            expired = mesh_topology.expire_edges()
+            if expired:
+                logger.debug(f"Expired {expired} stale topology edges")
+        except Exception as e:
+            logger.error(f"Error pruning topology: {e}")
+
 # Background task to check node status after reboot
 async def check_node_status():
     global reboot_in_progress, reboot_start_time, meshtastic_interface
@@ -291,7 +865,7 @@ async def check_node_status():
                         timestamp=datetime.now(timezone.utc)
                     )
                     embed.set_footer(text="Status via Meshtastic")
-                    channel = bot.get_channel(int(ADMIN_LOG_CHANNEL_ID)) if ADMIN_LOG_CHANNEL_ID else None
+                    channel = admin_log_channel()
                     if channel:
                         await discord_log_handler.queue.put(embed)
                     logger.info("Meshtastic node reconnected after reboot")
@@ -318,8 +892,9 @@ async def check_alerts():
             updated_alerts = []
             for alert in alerts:
                 if current_time >= alert["next_run"]:
+                    ALERT_FIRE_LAG_SECONDS.observe(current_time - alert["next_run"])
                     if alert["to_discord"]:
-                        channel = bot.get_channel(int(MESHTASTIC_CHANNEL_ID))
+                        channel = guild_channel(guild_registry.get_or_primary(alert.get("guild_id")).relay_channel_id)
                         if channel:
                             embed = discord.Embed(
                                 title="Scheduled Alert",
@@ -348,29 +923,84 @@ async def check_alerts():
             logger.error(f"Error processing alerts: {e}")
         await asyncio.sleep(60)
 
+# Background task to persist node history collected from packets
+async def flush_node_history():
+    global node_history_dirty
+    while True:
+        await asyncio.sleep(60)
+        if node_history_dirty:
+            node_history_dirty = False
+            save_node_history(node_history)
+
+# Record SNR and device telemetry samples for node charts
+def record_node_sample(packet: Dict[str, Any]) -> None:
+    global node_history_dirty
+    sender_id = packet.get("fromId")
+    if not sender_id:
+        return
+    sample: Dict[str, Any] = {}
+    if "rxSnr" in packet:
+        sample["snr"] = packet["rxSnr"]
+    decoded = packet.get("decoded", {})
+    if decoded.get("portnum") == "TELEMETRY_APP":
+        device_metrics = decoded.get("telemetry", {}).get("deviceMetrics", {})
+        if "batteryLevel" in device_metrics:
+            sample["battery"] = device_metrics["batteryLevel"]
+        if "voltage" in device_metrics:
+            sample["voltage"] = device_metrics["voltage"]
+    if not sample:
+        return
+    now = time.time()
+    sample["timestamp"] = now
+    samples = node_history.setdefault(sender_id, [])
+    samples.append(sample)
+    while samples and (len(samples) > MAX_NODE_HISTORY_SAMPLES or now - samples[0]["timestamp"] > MAX_NODE_HISTORY_AGE):
+        samples.pop(0)
+    node_history_dirty = True
+
 # Meshtastic message handler
-async def on_meshtastic_message_async(packet: Dict[str, Any], interface: Any):
+async def on_meshtastic_message_async(packet: Dict[str, Any], interface: Any, trace=NULL_TRACE):
     if meshtastic_interface is None:
         return
+    record_node_sample(packet)
+    await notify_battery_level(packet)
+    trace.mark("telemetry")
+    try:
+        mesh_topology.ingest_packet(packet)
+        sender_id = packet.get("fromId")
+        if sender_id:
+            mesh_topology.ingest_node(get_local_node_id(), sender_id, meshtastic_interface.nodes.get(sender_id, {}))
+    except Exception as e:
+        logger.error(f"Error updating topology from packet: {e}")
+    if packet.get("decoded", {}).get("portnum") == "POSITION_APP" and packet.get("fromId"):
+        index_node_position(packet["fromId"], packet["decoded"].get("position", {}))
+    if packet.get("fromId"):
+        refresh_node_index(packet["fromId"])
+        schedule_outbox_flush(packet["fromId"])
+    trace.mark("indexes")
+    try:
+        await delivery_tracker.handle_packet(packet)
+    except Exception as e:
+        logger.error(f"Error matching routing packet to a delivery: {e}")
+    trace.mark("delivery_match")
     if packet.get("decoded", {}).get("portnum") == "TEXT_MESSAGE_APP":
         try:
             sender_id = packet.get("fromId", "Unknown")
-            message = packet.get("decoded", {}).get("text", "").strip()
+            # Fragments of a long message wait here until the rest arrive
+            message = fragment_reassembler.add_packet(packet)
+            if message is None:
+                return
             sender_name = data["nodes"].get(sender_id, "Unknown")
             for user_id, claim_data in list(pending_claims.items()):
                 if message == claim_data["code"] and time.time() - claim_data["timestamp"] < 300:
                     owners[sender_id] = user_id
                     save_owners(owners)
+                    refresh_node_index(sender_id)
                     user = await bot.fetch_user(int(user_id))
-                    guild = bot.get_guild(int(GUILD_ID))
-                    if guild:
-                        member = guild.get_member(int(user_id))
-                        if member:
-                            role = guild.get_role(int(NODE_OWNER_ROLE_ID))
-                            if role and role not in member.roles:
-                                await member.add_roles(role)
+                    await sync_owner_roles(user_id)
                     await user.send(f"Success! You are now the owner of node {sender_name} ({sender_id}). You have been granted the Node Owner role.")
-                    channel = bot.get_channel(int(MESHTASTIC_CHANNEL_ID))
+                    # Announce in the relay channel of the guild the claim was started from
+                    channel = guild_channel(guild_registry.get_or_primary(claim_data.get("guild_id")).relay_channel_id)
                     if channel:
                         node_info = meshtastic_interface.nodes.get(sender_id, {})
                         user_data = node_info.get("user", {})
@@ -405,45 +1035,262 @@ async def on_meshtastic_message_async(packet: Dict[str, Any], interface: Any):
                             setup_sessions[user_id]["timestamp"] = time.time()
                             await send_preferences_step(user, setup_sessions[user_id])
                     return
-            messages.append({
-                "node_id": sender_id,
-                "timestamp": time.time(),
-                "message": message
-            })
-            save_messages(messages)
-            channel = bot.get_channel(int(MESHTASTIC_CHANNEL_ID))
-            if not channel:
-                logger.error(f"Error: Could not find channel {MESHTASTIC_CHANNEL_ID}")
+            trace.mark("claim_check")
+            # Commands DM'd to the gateway node are answered on the mesh instead of relayed
+            if mesh_command_dispatcher.is_command(message) and packet.get("toId") == get_local_node_id():
+                handle_mesh_command(packet, sender_id, message)
                 return
-            snr = packet.get("rxSnr", "N/A")
-            node_info = meshtastic_interface.nodes.get(sender_id, {})
-            battery = node_info.get("batteryLevel", "N/A")
-            if isinstance(battery, int):
-                battery = f"{battery}%"
-            embed = discord.Embed(
-                title="Meshtastic Message",
-                description=message,
-                color=discord.Color.green(),
-                timestamp=datetime.now(timezone.utc)
-            )
-            embed.add_field(name="Sender", value=f"{sender_name} ({sender_id})", inline=True)
-            embed.add_field(name="Channel", value=channel.name, inline=True)
-            embed.add_field(name="SNR", value=snr, inline=True)
-            embed.add_field(name="Battery", value=battery, inline=True)
-            embed.set_footer(text="Received via Meshtastic")
-            await channel.send(embed=embed)
-            for user_id, pref in preferences.items():
-                if isinstance(pref, dict) and pref.get("dm_notifications", False) and user_id in [owner_id for node_id, owner_id in owners.items() if node_id == sender_id]:
-                    try:
-                        user = await bot.fetch_user(int(user_id))
-                        await user.send(embed=embed)
-                    except discord.Forbidden:
-                        logger.warning(f"Could not send DM notification to user {user_id}")
+            await relay_text_message(packet, sender_id, sender_name, message, trace)
         except Exception as e:
             logger.error(f"Error processing Meshtastic message: {e}")
 
+# Log a mesh text message, post it to every guild relaying its channel and send notification DMs
+async def relay_text_message(packet: Dict[str, Any], sender_id: str, sender_name: str, message: str, trace=NULL_TRACE) -> None:
+    save_message({
+        "node_id": sender_id,
+        "timestamp": time.time(),
+        "message": message
+    })
+    trace.mark("save_message")
+    snr = packet.get("rxSnr", "N/A")
+    node_info = meshtastic_interface.nodes.get(sender_id, {})
+    battery = node_info.get("batteryLevel", "N/A")
+    if isinstance(battery, int):
+        battery = f"{battery}%"
+    channel_index = packet.get("channel", 0)
+    targets = guild_registry.relay_targets(channel_index)
+    if not targets:
+        logger.debug(f"No guild relays mesh channel {channel_index}; message from {sender_id} not posted")
+    # Fan out to every subscribed guild at once; each waits only on its own rate budget
+    posted = await asyncio.gather(*(
+        relay_to_guild(config, sender_id, sender_name, node_info, message, snr, battery) for config in targets
+    ))
+    trace.mark("discord_send")
+    embed = next((embed for embed in posted if embed is not None), None)
+    if embed is None:
+        embed = mesh_message_embed(message, sender_id, sender_name, f"Mesh channel {channel_index}", snr, battery)
+    hour = datetime.now(timezone.utc).hour
+    await send_notifications(notification_rules.match_message(sender_id, message, owners.get(sender_id), hour), embed)
+    trace.mark("notify")
+
+# Background task to relay long messages whose remaining fragments never arrived
+async def expire_fragments():
+    while True:
+        await asyncio.sleep(30)
+        for packet, message in fragment_reassembler.expire():
+            sender_id = packet.get("fromId", "Unknown")
+            logger.info(f"Relaying incomplete fragmented message from {sender_id}")
+            try:
+                await relay_text_message(packet, sender_id, data["nodes"].get(sender_id, "Unknown"), message.strip())
+            except Exception as e:
+                logger.error(f"Error relaying incomplete message from {sender_id}: {e}")
+
+# Answer a command DM'd to the gateway node through the paced transmit path
+def handle_mesh_command(packet: Dict[str, Any], sender_id: str, message: str) -> None:
+    outcome, reply = mesh_command_dispatcher.dispatch(sender_id, message)
+    MESH_COMMANDS.inc(outcome=outcome)
+    if reply is None:
+        logger.debug(f"Ignored mesh command from {sender_id}: {outcome}")
+        return
+    if mesh_transmitter.send_text(reply, packet.get("channel", 0), sender_id, MAX_MESH_REPLY_FRAGMENTS) is None:
+        logger.warning(f"Transmit backlog full; dropped reply to {message.split()[0]} from {sender_id}")
+        return
+    logger.info(f"Answered mesh command {message.split()[0]} from {sender_id} ({outcome})")
+
+# Short name of a node for mesh replies, which have little room
+def mesh_node_name(node_id: str) -> str:
+    user = meshtastic_interface.nodes.get(node_id, {}).get("user", {}) if meshtastic_interface else {}
+    return user.get("shortName") or data["nodes"].get(node_id) or node_id
+
+def minutes_ago(timestamp: Any, now: float) -> str:
+    if not isinstance(timestamp, (int, float)) or not timestamp:
+        return "never heard"
+    minutes = int((now - timestamp) // 60)
+    return f"{minutes // 60}h{minutes % 60:02d}m ago" if minutes >= 60 else f"{minutes}m ago"
+
+# Resolve "!abcd1234", "abcd1234" or a short name to a known node ID
+def find_mesh_node(query: str) -> Optional[str]:
+    query = query.strip()
+    node_id = query if query.startswith("!") else f"!{query}"
+    nodes = meshtastic_interface.nodes if meshtastic_interface else {}
+    if node_id.lower() in data["nodes"] or node_id.lower() in nodes:
+        return node_id.lower()
+    for candidate, node_info in nodes.items():
+        if node_info.get("user", {}).get("shortName", "").lower() == query.lower():
+            return candidate
+    return None
+
+# !ping: link quality of the asking node as the gateway last heard it
+def mesh_ping(node_id: str, args: str) -> str:
+    node_info = meshtastic_interface.nodes.get(node_id, {})
+    snr = node_info.get("snr")
+    hops = node_info.get("hopsAway")
+    return f"pong · SNR {snr if snr is not None else 'N/A'} · {hops if hops is not None else '?'} hop(s)"
+
+# !nodes: how many nodes were heard recently, newest first
+def mesh_nodes(node_id: str, args: str) -> str:
+    heard = []
+    for candidate in node_sort_index.iter_sorted("last_heard"):
+        if not node_is_reachable(meshtastic_interface.nodes.get(candidate, {})):
+            break
+        heard.append(candidate)
+    names = ", ".join(mesh_node_name(candidate) for candidate in heard[:MESH_NODES_LISTED])
+    more = f" +{len(heard) - MESH_NODES_LISTED}" if len(heard) > MESH_NODES_LISTED else ""
+    return f"{len(heard)}/{len(node_sort_index)} nodes heard in {STALE_AFTER_SECONDS // 3600}h: {names or 'none'}{more}"
+
+# !whois <id>: name, hardware, battery, last heard and owner of a node
+def mesh_whois(node_id: str, args: str) -> str:
+    if not args:
+        return f"Usage: {COMMAND_PREFIX}whois <node id or short name>"
+    target = find_mesh_node(args)
+    if target is None:
+        return f"Unknown node {args}"
+    node_info = meshtastic_interface.nodes.get(target, {})
+    battery = node_battery(node_info)
+    parts = [
+        f"{data['nodes'].get(target, node_info.get('user', {}).get('longName', 'Unknown'))} ({target})",
+        node_info.get("user", {}).get("hwModel", "N/A"),
+        f"bat {battery}%" if battery is not None else "bat N/A",
+        minutes_ago(node_info.get("lastHeard"), time.time())
+    ]
+    owner_id = owners.get(target)
+    if owner_id:
+        parts.append(f"owner {owner_display_name(owner_id)}")
+    return " · ".join(parts)
+
+# !weather: latest environment telemetry from nodes with weather sensors
+def mesh_weather(node_id: str, args: str) -> str:
+    if args:
+        target = find_mesh_node(args)
+        if target is None:
+            return f"Unknown node {args}"
+        candidates = [target]
+    else:
+        candidates = list(node_sort_index.iter_sorted("last_heard", lambda candidate: bool(
+            meshtastic_interface.nodes.get(candidate, {}).get("environmentMetrics"))))[:MESH_WEATHER_NODES]
+    now = time.time()
+    readings = []
+    for candidate in candidates:
+        node_info = meshtastic_interface.nodes.get(candidate, {})
+        metrics_data = node_info.get("environmentMetrics") or {}
+        values = []
+        if isinstance(metrics_data.get("temperature"), (int, float)):
+            values.append(f"{metrics_data['temperature']:.1f}C")
+        if isinstance(metrics_data.get("relativeHumidity"), (int, float)):
+            values.append(f"{metrics_data['relativeHumidity']:.0f}%")
+        if isinstance(metrics_data.get("barometricPressure"), (int, float)):
+            values.append(f"{metrics_data['barometricPressure']:.0f}hPa")
+        if values:
+            readings.append(f"{mesh_node_name(candidate)} {' '.join(values)} ({minutes_ago(node_info.get('lastHeard'), now)})")
+    return "; ".join(readings) if readings else "No weather readings: no node reports environment telemetry"
+
+# !alerts: the next scheduled announcements
+def mesh_alerts(node_id: str, args: str) -> str:
+    now = time.time()
+    active = sorted((alert for alert in load_alerts() if alert["frequency"] != "once" or alert["next_run"] > now),
+                    key=lambda alert: alert["next_run"])
+    if not active:
+        return "No alerts scheduled"
+    lines = [f"{alert['message'][:40]} ({alert['frequency']}, in {max(int(alert['next_run'] - now) // 60, 0)}m)"
+             for alert in active[:MESH_ALERTS_LISTED]]
+    return f"{len(active)} alert(s): " + "; ".join(lines)
+
+def mesh_help(node_id: str, args: str) -> str:
+    return "Commands: " + ", ".join(mesh_command_dispatcher.usage())
+
+mesh_command_dispatcher.register("ping", mesh_ping)
+mesh_command_dispatcher.register("nodes", mesh_nodes, cache_seconds=MESH_COMMAND_CACHE_SECONDS)
+mesh_command_dispatcher.register("whois", mesh_whois, usage=f"{COMMAND_PREFIX}whois <id>", cache_seconds=MESH_COMMAND_CACHE_SECONDS)
+mesh_command_dispatcher.register("weather", mesh_weather, usage=f"{COMMAND_PREFIX}weather [id]", cache_seconds=MESH_COMMAND_CACHE_SECONDS)
+mesh_command_dispatcher.register("alerts", mesh_alerts, cache_seconds=MESH_COMMAND_CACHE_SECONDS)
+mesh_command_dispatcher.register("help", mesh_help, cache_seconds=MESH_COMMAND_CACHE_SECONDS)
+
+# DM each matched user the embed, noting which of their rules matched
+async def send_notifications(matches: Dict[str, List[str]], embed: discord.Embed) -> None:
+    for user_id, reasons in matches.items():
+        try:
+            user = await bot.fetch_user(int(user_id))
+            await user.send(content=f"Notification: {', '.join(reasons)}", embed=embed)
+        except (discord.Forbidden, discord.NotFound):
+            logger.warning(f"Could not send DM notification to user {user_id}")
+        except discord.HTTPException as e:
+            logger.error(f"Failed to send DM notification to user {user_id}: {e}")
+
+# Notify subscribers when a telemetry packet shows a node's battery crossing their threshold
+async def notify_battery_level(packet: Dict[str, Any]) -> None:
+    sender_id = packet.get("fromId")
+    decoded = packet.get("decoded", {})
+    if not sender_id or decoded.get("portnum") != "TELEMETRY_APP":
+        return
+    level = decoded.get("telemetry", {}).get("deviceMetrics", {}).get("batteryLevel")
+    if not isinstance(level, int):
+        return
+    matches = notification_rules.match_battery(sender_id, level, datetime.now(timezone.utc).hour)
+    if matches:
+        embed = discord.Embed(
+            title="Low Battery",
+            description=f"{node_label(sender_id)} battery is at {level}%.",
+            color=discord.Color.orange(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Received via Meshtastic")
+        await send_notifications(matches, embed)
+
+# Embed for a relayed mesh text message
+def mesh_message_embed(message: str, sender_id: str, sender_name: str, channel_name: str, snr: Any, battery: Any) -> discord.Embed:
+    embed = discord.Embed(
+        title="Meshtastic Message",
+        description=message,
+        color=discord.Color.green(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    embed.add_field(name="Sender", value=f"{sender_name} ({sender_id})", inline=True)
+    embed.add_field(name="Channel", value=channel_name, inline=True)
+    embed.add_field(name="SNR", value=snr, inline=True)
+    embed.add_field(name="Battery", value=battery, inline=True)
+    embed.set_footer(text="Received via Meshtastic")
+    return embed
+
+# Relay a mesh text message to one guild's relay channel within that guild's rate budget.
+# Returns the posted embed, or None when the guild was skipped.
+async def relay_to_guild(config: GuildConfig, sender_id: str, sender_name: str, node_info: Dict[str, Any],
+                         message: str, snr: Any, battery: Any) -> Optional[discord.Embed]:
+    channel = guild_channel(config.relay_channel_id)
+    if not channel:
+        logger.error(f"Error: Could not find channel {config.relay_channel_id} in guild {config.guild_id}")
+        return None
+    if config.relay_bucket.delay() > MAX_GUILD_RELAY_WAIT_SECONDS:
+        RELAY_DROPPED.inc(guild=str(config.guild_id))
+        logger.warning(f"Guild {config.guild_id} is over its relay rate; dropped message from {sender_id}")
+        return None
+    wait = config.relay_bucket.reserve()
+    if wait:
+        await asyncio.sleep(wait)
+    embed = mesh_message_embed(message, sender_id, sender_name, channel.name, snr, battery)
+    try:
+        await relay_mesh_message(channel, embed, sender_id, node_info, message, snr, battery)
+    except discord.HTTPException as e:
+        logger.error(f"Failed to relay message to guild {config.guild_id}: {e}")
+    return embed
+
+# Post a relayed mesh message: through the channel's webhook pool as the node when enabled, else as the bot
+async def relay_mesh_message(channel: discord.TextChannel, embed: discord.Embed, sender_id: str,
+                             node_info: Dict[str, Any], message: str, snr: Any, battery: Any) -> None:
+    if RELAY_MODE == RELAY_MODE_WEBHOOK:
+        webhook_relay = webhook_relays.get(channel.id)
+        if webhook_relay is None:
+            webhook_relay = webhook_relays[channel.id] = WebhookRelay(WEBHOOK_POOL_SIZE)
+        user = node_info.get("user", {})
+        username = webhook_username(user.get("longName") or data["nodes"].get(sender_id), user.get("shortName"), sender_id)
+        content = f"{message}\n-# {sender_id} · SNR {snr} · Battery {battery}"
+        if await webhook_relay.send(channel, username, content):
+            MESSAGES_RELAYED.inc(method="webhook")
+            return
+    await channel.send(embed=embed)
+    MESSAGES_RELAYED.inc(method="bot")
+
 # Meshtastic new node handler
-async def on_node_updated_async(node_id: str):
+async def on_node_updated_async(node_id: str, trace=NULL_TRACE):
     if meshtastic_interface is None:
         logger.error("Meshtastic interface not initialized")
         return
@@ -459,19 +1306,37 @@ async def on_node_updated_async(node_id: str):
         if not node_info:
             logger.error(f"Node {node_id} info not found after retries")
             return
+        trace.mark("node_lookup")
 
+        mesh_topology.ingest_node(get_local_node_id(), node_id, node_info)
+        index_node_position(node_id, node_info.get("position", {}))
         long_name = node_info.get("user", {}).get("longName", "Unknown")
         data["nodes"][node_id] = long_name
         save_data(data)
+        refresh_node_index(node_id)
+        if node_is_reachable(node_info):
+            schedule_outbox_flush(node_id)
+        trace.mark("indexes")
         logger.debug(f"Saved node {node_id} with name {long_name}")
 
-        channel = bot.get_channel(int(MESHTASTIC_NODE_CHANNEL_ID))
+        await asyncio.gather(*(
+            announce_node(config, node_id, long_name) for config in guild_registry if config.node_channel_id
+        ))
+        trace.mark("discord_send")
+    except Exception as e:
+        logger.error(f"Error processing new node {node_id}: {e}", exc_info=True)
+
+# Post a new-node notice to one guild's node channel
+async def announce_node(config: GuildConfig, node_id: str, long_name: str) -> None:
+    channel_id = config.node_channel_id
+    try:
+        channel = guild_channel(channel_id)
         if not channel:
-            logger.error(f"Could not find node channel {MESHTASTIC_NODE_CHANNEL_ID}")
+            logger.error(f"Could not find node channel {channel_id} in guild {config.guild_id}")
             # Notify admin channel if set
-            admin_channel = bot.get_channel(int(ADMIN_LOG_CHANNEL_ID)) if ADMIN_LOG_CHANNEL_ID else None
+            admin_channel = admin_log_channel()
             if admin_channel:
-                await admin_channel.send(f"Error: Node channel {MESHTASTIC_NODE_CHANNEL_ID} not found. Please check configuration.")
+                await admin_channel.send(f"Error: Node channel {channel_id} not found. Please check configuration.")
             return
 
         embed = discord.Embed(
@@ -485,80 +1350,245 @@ async def on_node_updated_async(node_id: str):
         embed.add_field(name="Channel", value=channel.name, inline=True)
         embed.set_footer(text="Node joined via Meshtastic")
         await channel.send(embed=embed)
-        logger.info(f"Sent new node notification for {node_id} to channel {MESHTASTIC_NODE_CHANNEL_ID}")
+        logger.info(f"Sent new node notification for {node_id} to channel {channel_id}")
     except discord.errors.Forbidden:
-        logger.error(f"Bot lacks permission to send messages to channel {MESHTASTIC_NODE_CHANNEL_ID}")
-        admin_channel = bot.get_channel(int(ADMIN_LOG_CHANNEL_ID)) if ADMIN_LOG_CHANNEL_ID else None
+        logger.error(f"Bot lacks permission to send messages to channel {channel_id}")
+        admin_channel = admin_log_channel()
         if admin_channel:
-            await admin_channel.send(f"Error: Bot lacks permission to send to node channel {MESHTASTIC_NODE_CHANNEL_ID}.")
+            await admin_channel.send(f"Error: Bot lacks permission to send to node channel {channel_id}.")
     except discord.errors.HTTPException as e:
-        logger.error(f"Failed to send message to channel {MESHTASTIC_NODE_CHANNEL_ID}: {e}")
-    except Exception as e:
-        logger.error(f"Error processing new node {node_id}: {e}", exc_info=True)
+        logger.error(f"Failed to send message to channel {channel_id}: {e}")
+
+# Time the thread-to-loop hop, then finish the trace once the handler returns
+async def run_traced(trace, handler) -> None:
+    trace.mark("dispatch")
+    try:
+        await handler
+    finally:
+        trace.finish()
 
 # Synchronous wrappers
 def on_meshtastic_message(packet: Dict[str, Any], interface: Any):
+    PACKETS_RECEIVED.inc(portnum=str(packet.get("decoded", {}).get("portnum", "ENCRYPTED")))
+    trace = tracer.start("packet")
+    if packet_deduplicator.is_duplicate(packet):
+        PACKETS_DUPLICATE.inc()
+        logger.debug(f"Dropped duplicate packet {packet.get('id')} from {packet.get('fromId')}")
+        return
     asyncio.run_coroutine_threadsafe(
-        on_meshtastic_message_async(packet, interface),
+        run_traced(trace, on_meshtastic_message_async(packet, interface, trace)),
         bot.loop
     )
 
-def on_node_updated(node_id: str):
+def on_node_updated(node: Dict[str, Any], interface: Any = None):
+    node_id = node.get("user", {}).get("id")
+    if not node_id:
+        return  # Node has not sent its user info yet
+    trace = tracer.start("node_update")
     asyncio.run_coroutine_threadsafe(
-        on_node_updated_async(node_id),
+        run_traced(trace, on_node_updated_async(node_id, trace)),
         bot.loop
     )
 
-# Subscribe to Meshtastic events
-if meshtastic_interface:
+# Radio link events, counted so reconnects show up in metrics
+def on_connection_established(interface: Any = None, topic=pub.AUTO_TOPIC):
+    RADIO_CONNECTION_EVENTS.inc(event="established")
+
+def on_connection_lost(interface: Any = None, topic=pub.AUTO_TOPIC):
+    RADIO_CONNECTION_EVENTS.inc(event="lost")
+    logger.warning("Lost connection to the Meshtastic radio")
+
+# Open the radio in a worker thread (SerialInterface blocks while the NodeDB downloads),
+# then seed the node indexes and subscribe to Meshtastic events
+async def connect_radio() -> None:
+    global meshtastic_interface, radio_state
+    radio_state = RADIO_CONNECTING
+    started = time.perf_counter()
+    target = MESHTASTIC_GATEWAY_SOCKET or MESHTASTIC_PORT
+    try:
+        if MESHTASTIC_GATEWAY_SOCKET:
+            interface = await asyncio.to_thread(GatewayClient, MESHTASTIC_GATEWAY_SOCKET, GATEWAY_STATE_FILE)
+        else:
+            interface = await asyncio.to_thread(meshtastic.serial_interface.SerialInterface, MESHTASTIC_PORT)
+    except Exception as e:
+        radio_state = RADIO_DISCONNECTED
+        RADIO_CONNECTION_EVENTS.inc(event="failed")
+        logger.error(f"Failed to connect to Meshtastic on {target}: {e}")
+        return
+    RADIO_CONNECTION_EVENTS.inc(event="established")
+    record_startup_phase("radio_connect", started)
+    started = time.perf_counter()
+    meshtastic_interface = interface
+    radio_state = RADIO_CONNECTED
+    seed_topology()
+    seed_geo_index()
+    seed_node_index()
     pub.subscribe(on_meshtastic_message, "meshtastic.receive")
     pub.subscribe(on_node_updated, "meshtastic.node.updated")
+    pub.subscribe(on_connection_established, "meshtastic.connection.established")
+    pub.subscribe(on_connection_lost, "meshtastic.connection.lost")
+    # The gateway client holds events, including the replay of those sent while the bot was down, until now
+    if isinstance(interface, GatewayClient):
+        interface.start()
+    record_startup_phase("radio_indexes", started)
 
 # Setup wizard sessions
 setup_sessions: Dict[str, Dict[str, Any]] = {}  # {user_id: {"step": float, "message_id": int, "node_claimed": bool, "dm_notifications": bool, "timestamp": float}}
 
-# Event: Bot is ready and connected
-@bot.event
+# Slash commands registered to the guild
+def guild_commands() -> List[app_commands.Command]:
+    return [
+        meshtastic_status,
+        claimnode,
+        releasenode,
+        ownednodes,
+        nodeinfo,
+        addnode,
+        removenode,
+        filtermessages,
+        ack,
+        broadcast,
+        about,
+        reboot,
+        alert,
+        listalerts,
+        deletealert,
+        clearalerts,
+        setup,
+        help,
+        nodechart,
+        activitychart,
+        route,
+        neighbors,
+        spof,
+        nearby,
+        nodesin,
+        nodes,
+        searchmessages,
+        deliverystats,
+        outbox_command,
+        notify,
+        notifications,
+        unnotify,
+        quiethours,
+        perf,
+        exportmessages,
+        snapshot,
+        linkguild,
+        guildsetup,
+        bridge
+    ]
+
+# Stable hash of the command tree as Discord sees it, used to skip redundant syncs
+def command_tree_hash(tree: app_commands.CommandTree, guild: discord.abc.Snowflake) -> str:
+    payload = []
+    for command in sorted(tree.get_commands(guild=guild), key=lambda command: command.name):
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:
+            payload.append(command.to_dict())  # discord.py < 2.4 takes no tree argument
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def load_command_sync_state() -> Dict[str, str]:
+    try:
+        with open(COMMAND_SYNC_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_command_sync_state(state: Dict[str, str]) -> None:
+    try:
+        with open(COMMAND_SYNC_FILE, 'w') as f:
+            json.dump(state, f, indent=4)
+    except IOError as e:
+        logger.error(f"Failed to save command sync state to {COMMAND_SYNC_FILE}: {e}")
+
+# Register slash commands in a guild and sync them only when the tree has changed
+async def register_guild_commands(client: commands.Bot, guild_id: int) -> None:
+    guild = discord.Object(id=guild_id)
+    for command in guild_commands():
+        client.tree.add_command(command, guild=guild, override=True)
+    tree_hash = command_tree_hash(client.tree, guild)
+    sync_state = load_command_sync_state()
+    if sync_state.get(str(guild_id)) == tree_hash:
+        logger.info(f"Slash commands unchanged; skipping sync to guild {guild_id}")
+        return
+    try:
+        await client.tree.sync(guild=guild)
+        sync_state[str(guild_id)] = tree_hash
+        save_command_sync_state(sync_state)
+        logger.info(f'Slash commands synced to guild {guild_id}')
+    except Exception as e:
+        logger.error(f'Error syncing commands to guild {guild_id}: {e}')
+
+# Remove the slash commands from a guild that no longer shares the radio
+async def unregister_guild_commands(client: commands.Bot, guild_id: int) -> None:
+    guild = discord.Object(id=guild_id)
+    client.tree.clear_commands(guild=guild)
+    try:
+        await client.tree.sync(guild=guild)
+        logger.info(f'Slash commands removed from guild {guild_id}')
+    except Exception as e:
+        logger.error(f'Error removing commands from guild {guild_id}: {e}')
+    sync_state = load_command_sync_state()
+    if sync_state.pop(str(guild_id), None) is not None:
+        save_command_sync_state(sync_state)
+
+async def register_commands(client: commands.Bot) -> None:
+    for config in guild_registry:
+        await register_guild_commands(client, config.guild_id)
+
+# Start the long-running background tasks; the supervisor keeps exactly one of each
+def start_background_tasks() -> None:
+    task_supervisor.start("discord_log_sender", lambda: discord_log_sender(bot, discord_log_handler.queue))
+    task_supervisor.start("check_node_status", check_node_status)
+    task_supervisor.start("prune_pending_claims", prune_pending_claims)
+    task_supervisor.start("check_alerts", check_alerts)
+    task_supervisor.start("flush_node_history", flush_node_history)
+    task_supervisor.start("prune_topology", prune_topology)
+    task_supervisor.start("track_deliveries", track_deliveries, wait_ready=False)
+    task_supervisor.start("expire_outbox", expire_outbox, wait_ready=False)
+    task_supervisor.start("mesh_transmitter", mesh_transmitter.run, wait_ready=False)
+    task_supervisor.start("expire_fragments", expire_fragments, wait_ready=False)
+    task_supervisor.start("loop_watchdog", loop_watchdog.run, wait_ready=False)
+    if SNAPSHOT_INTERVAL > 0:
+        task_supervisor.start("snapshot_state", snapshot_state, wait_ready=False)
+    if not search_index_ready:
+        task_supervisor.start("build_search_index", build_search_index, wait_ready=False)
+
+# Discord client with a one-time startup lifecycle
+# Wrap the HTTP client's request method to time every Discord API call by route template
+def timed_discord_request(request):
+    @functools.wraps(request)
+    async def wrapper(route, **kwargs):
+        with DISCORD_REQUEST_SECONDS.time(method=route.method, route=route.path):
+            return await request(route, **kwargs)
+    return wrapper
+
+class MeshtasticBot(commands.Bot):
+    async def setup_hook(self) -> None:
+        started = time.perf_counter()
+        self.http.request = timed_discord_request(self.http.request)
+        await register_commands(self)
+        start_background_tasks()
+        record_startup_phase("setup_hook", started)
+
+# Event: Bot is ready and connected (also fires after gateway reconnects)
 async def on_ready():
     logger.info(f'Logged in as {bot.user.name}')
-    bot.loop.create_task(discord_log_sender(bot, discord_log_handler.queue))
-    bot.loop.create_task(check_node_status())
-    bot.loop.create_task(prune_pending_claims())
-    bot.loop.create_task(check_alerts())
-    try:
-        guild = discord.Object(id=GUILD_ID)
-        bot.tree.add_command(meshtastic_status, guild=guild)
-        bot.tree.add_command(claimnode, guild=guild)
-        bot.tree.add_command(releasenode, guild=guild)
-        bot.tree.add_command(ownednodes, guild=guild)
-        bot.tree.add_command(nodeinfo, guild=guild)
-        bot.tree.add_command(addnode, guild=guild)
-        bot.tree.add_command(removenode, guild=guild)
-        bot.tree.add_command(filtermessages, guild=guild)
-        bot.tree.add_command(ack, guild=guild)
-        bot.tree.add_command(broadcast, guild=guild)
-        bot.tree.add_command(about, guild=guild)
-        bot.tree.add_command(reboot, guild=guild)
-        bot.tree.add_command(alert, guild=guild)
-        bot.tree.add_command(listalerts, guild=guild)
-        bot.tree.add_command(deletealert, guild=guild)
-        bot.tree.add_command(clearalerts, guild=guild)
-        bot.tree.add_command(setup, guild=guild)
-        bot.tree.add_command(help, guild=guild)
-        await bot.tree.sync(guild=guild)
-        logger.info(f'Slash commands synced to guild {GUILD_ID}')
-        embed = discord.Embed(
-            title="Bot Online",
-            description="Meshtastic bot has started.",
-            color=discord.Color.green(),
-            timestamp=datetime.now(timezone.utc)
-        )
-        embed.set_footer(text="Status via Meshtastic")
-        channel = bot.get_channel(int(ADMIN_LOG_CHANNEL_ID)) if ADMIN_LOG_CHANNEL_ID else None
-        if channel:
-            await discord_log_handler.queue.put(embed)
-    except Exception as e:
-        logger.error(f'Error syncing commands: {e}')
+    if "discord_ready" in startup_timings:
+        return
+    record_startup_phase("discord_ready", process_started_at)
+    embed = discord.Embed(
+        title="Bot Online",
+        description="Meshtastic bot has started.",
+        color=discord.Color.green(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    embed.set_footer(text="Status via Meshtastic")
+    channel = admin_log_channel()
+    if channel:
+        await discord_log_handler.queue.put(embed)
 
 # Setup wizard steps
 async def send_welcome_step(user: discord.User, session: Dict[str, Any]) -> Optional[discord.Message]:
@@ -706,7 +1736,7 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
                 await update_step(1)
             elif emoji == EMOJIS["next"]:
                 if meshtastic_interface is None:
-                    await user.send("Error: Meshtastic device not connected. Please try again later.")
+                    await user.send(f"Error: {radio_unavailable_message()}")
                     del setup_sessions[user_id]
                     logger.error(f"User {user.name} attempted node claim but Meshtastic is not connected")
                     return
@@ -746,7 +1776,7 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
             if emoji == EMOJIS["back"]:
                 await update_step(3)
             elif emoji == EMOJIS["yes"]:
-                preferences[user_id] = {"dm_notifications": session.get("dm_notifications", False)}
+                preferences.setdefault(user_id, {})["dm_notifications"] = session.get("dm_notifications", False)
                 save_preferences(preferences)
                 logger.debug(f"Sending help embed to user {user.name} on step 4")
                 embed = discord.Embed(
@@ -760,7 +1790,12 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
                     name="🔗 Network & Status",
                     value=(
                         "**/meshtastic_status**: Check node and network status\n"
-                        "**/nodeinfo <node_id>**: View details of a specific node (e.g., `!abc123`)"
+                        "**/nodes [sort] [search] [owned_only]**: Browse all known nodes\n"
+                        "**/nodeinfo <node_id>**: View details of a specific node (e.g., `!abc123`)\n"
+                        "**/nodechart <node_id> [metric] [hours]**: Chart battery, voltage or SNR\n"
+                        "**/activitychart [hours] [node_id]**: Chart messages per hour\n"
+                        "**/route <node_id>**, **/neighbors <node_id>**, **/spof**: Explore the mesh topology\n"
+                        "**/nearby**, **/nodesin**: Find nodes by location"
                     ),
                     inline=True
                 )
@@ -776,7 +1811,13 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
                 )
                 embed.add_field(
                     name="💬 Messaging",
-                    value="**/filtermessages [node_id] [owner]**: Filter message logs by node or owner",
+                    value=(
+                        "**/filtermessages [node_id] [owner]**: Filter message logs by node or owner\n"
+                        "**/searchmessages <query> [hours] [node_id]**: Search message text\n"
+                        "**/deliverystats [node_id]**: Delivery rate and latency of direct messages\n"
+                        "**/notify <kind> [node_id] [keyword] [threshold]**: DM me for a node, keyword or low battery\n"
+                        "**/notifications**, **/unnotify <rule_id>**, **/quiethours [start] [end]**: Manage notification rules"
+                    ),
                     inline=True
                 )
                 embed.add_field(
@@ -790,6 +1831,13 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
                         "**/addnode <node_id> <user>**: Assign a node to a user\n"
                         "**/removenode <node_id>**: Remove a node’s ownership\n"
                         "**/ack <node_id> <message> [channel]**: Send a message to a node\n"
+                        "**/outbox [node_id] [clear]**: Show or clear messages queued for offline nodes\n"
+                        "**/perf**: Per-stage packet latency and event-loop lag\n"
+                        "**/exportmessages [node_id] [owner] [since] [until]**: Download archived and logged messages\n"
+                        "**/snapshot**: Take a state snapshot now\n"
+                        "**/linkguild <guild_id> [remove]**: Share the radio with another server\n"
+                        "**/guildsetup [relay_channel] [node_channel] [admin_role] [owner_role] [mesh_channels] [rate] [clear]**: Configure this server\n"
+                        "**/bridge <channel> [mesh_channel] [remove]**: Send a channel's messages to the mesh\n"
                         "**/broadcast <message> [channel]**: Broadcast to all nodes\n"
                         "**/reboot [seconds]**: Reboot the connected node\n"
                         "**/alert <message> <frequency> [to_discord] [to_mesh]**: Schedule an announcement\n"
@@ -803,7 +1851,7 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
                 del setup_sessions[user_id]
                 logger.info(f"User {user.name} completed setup wizard with /help")
             elif emoji == EMOJIS["no"]:
-                preferences[user_id] = {"dm_notifications": session.get("dm_notifications", False)}
+                preferences.setdefault(user_id, {})["dm_notifications"] = session.get("dm_notifications", False)
                 save_preferences(preferences)
                 await user.send("Setup complete! Use `/help` to explore commands.")
                 del setup_sessions[user_id]
@@ -816,8 +1864,40 @@ async def handle_setup_reaction(reaction: discord.Reaction, user: discord.User):
             logger.warning(f"Cannot send error DM to user {user.name}")
         del setup_sessions[user_id]
 
+# Reactions telling the author what became of a bridged message
+BRIDGE_REACTIONS: Dict[str, str] = {
+    BRIDGE_QUEUED: "\U0001f4e1",        # 📡
+    BRIDGE_USER_LIMITED: "\u23f3",       # ⏳
+    "refused": "\u274c"                  # ❌ global limit, airtime budget or radio down
+}
+
+# Event: send messages posted in a bridged channel to the mesh
+async def on_message(message: discord.Message):
+    if message.author.bot or message.webhook_id or message.guild is None:
+        return
+    target = guild_registry.bridge_target(message.channel.id)
+    if target is None:
+        return
+    config, mesh_channel = target
+    content = message.clean_content.strip()
+    if not content:
+        return
+    if radio_state != RADIO_CONNECTED:
+        status, fragments, truncated = "radio_down", 0, False
+    else:
+        status, fragments, truncated = mesh_bridge.submit(message.author.id, f"{message.author.display_name}: {content}", mesh_channel)
+    BRIDGE_MESSAGES.inc(status=status)
+    if status == BRIDGE_QUEUED:
+        logger.info(f"Bridged message from {message.author.name} in guild {config.guild_id} to mesh channel {mesh_channel} "
+                    f"as {fragments} packet(s){' (truncated)' if truncated else ''}")
+    else:
+        logger.debug(f"Bridge refused message from {message.author.name}: {status}")
+    try:
+        await message.add_reaction(BRIDGE_REACTIONS.get(status, BRIDGE_REACTIONS["refused"]))
+    except discord.HTTPException as e:
+        logger.warning(f"Could not react to bridged message {message.id}: {e}")
+
 # Event: Reaction added
-@bot.event
 async def on_reaction_add(reaction: discord.Reaction, user: discord.User):
     if user.bot:
         return
@@ -872,7 +1952,12 @@ async def help(interaction: discord.Interaction):
             name="🔗 Network & Status",
             value=(
                 "**/meshtastic_status**: Check node and network status\n"
-                "**/nodeinfo <node_id>**: View details of a specific node (e.g., `!abc123`)"
+                "**/nodes [sort] [search] [owned_only]**: Browse all known nodes\n"
+                "**/nodeinfo <node_id>**: View details of a specific node (e.g., `!abc123`)\n"
+                "**/nodechart <node_id> [metric] [hours]**: Chart battery, voltage or SNR\n"
+                "**/activitychart [hours] [node_id]**: Chart messages per hour\n"
+                "**/route <node_id>**, **/neighbors <node_id>**, **/spof**: Explore the mesh topology\n"
+                "**/nearby**, **/nodesin**: Find nodes by location"
             ),
             inline=True
         )
@@ -888,7 +1973,13 @@ async def help(interaction: discord.Interaction):
         )
         embed.add_field(
             name="💬 Messaging",
-            value="**/filtermessages [node_id] [owner]**: Filter message logs by node or owner",
+            value=(
+                "**/filtermessages [node_id] [owner]**: Filter message logs by node or owner\n"
+                "**/searchmessages <query> [hours] [node_id]**: Search message text\n"
+                "**/deliverystats [node_id]**: Delivery rate and latency of direct messages\n"
+                "**/notify <kind> [node_id] [keyword] [threshold]**: DM me for a node, keyword or low battery\n"
+                "**/notifications**, **/unnotify <rule_id>**, **/quiethours [start] [end]**: Manage notification rules"
+            ),
             inline=True
         )
         embed.add_field(
@@ -902,6 +1993,13 @@ async def help(interaction: discord.Interaction):
                 "**/addnode <node_id> <user>**: Assign a node to a user\n"
                 "**/removenode <node_id>**: Remove a node’s ownership\n"
                 "**/ack <node_id> <message> [channel]**: Send a message to a node\n"
+                "**/outbox [node_id] [clear]**: Show or clear messages queued for offline nodes\n"
+                "**/perf**: Per-stage packet latency and event-loop lag\n"
+                "**/exportmessages [node_id] [owner] [since] [until]**: Download archived and logged messages\n"
+                "**/snapshot**: Take a state snapshot now\n"
+                "**/linkguild <guild_id> [remove]**: Share the radio with another server\n"
+                "**/guildsetup [relay_channel] [node_channel] [admin_role] [owner_role] [mesh_channels] [rate] [clear]**: Configure this server\n"
+                "**/bridge <channel> [mesh_channel] [remove]**: Send a channel's messages to the mesh\n"
                 "**/broadcast <message> [channel]**: Broadcast to all nodes\n"
                 "**/reboot [seconds]**: Reboot the connected node\n"
                 "**/alert <message> <frequency> [to_discord] [to_mesh]**: Schedule an announcement\n"
@@ -926,11 +2024,12 @@ async def help(interaction: discord.Interaction):
 
 # Slash command: /clearalerts
 @app_commands.command(name="clearalerts", description="Admin: Clear all scheduled alerts")
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_admin)
 async def clearalerts(interaction: discord.Interaction):
     try:
         alerts = load_alerts()
-        if not alerts:
+        remaining = [alert for alert in alerts if not alert_in_guild(alert, interaction.guild_id)]
+        if len(remaining) == len(alerts):
             embed = discord.Embed(
                 title="Clear Alerts Error",
                 description="No alerts exist to clear.",
@@ -941,16 +2040,16 @@ async def clearalerts(interaction: discord.Interaction):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             logger.error(f"User {interaction.user.name} attempted to clear alerts but none exist")
             return
-        save_alerts([])
+        save_alerts(remaining)
         embed = discord.Embed(
             title="All Alerts Cleared",
-            description="All scheduled alerts have been removed.",
+            description="All scheduled alerts for this server have been removed.",
             color=discord.Color.green(),
             timestamp=datetime.now(timezone.utc)
         )
         embed.set_footer(text="Command via Meshtastic")
         await interaction.response.send_message(embed=embed, ephemeral=True)
-        logger.info(f"User {interaction.user.name} cleared all alerts")
+        logger.info(f"User {interaction.user.name} cleared all alerts of guild {interaction.guild_id}")
     except Exception as e:
         logger.error(f"Error in /clearalerts command: {e}")
         embed = discord.Embed(
@@ -965,11 +2064,12 @@ async def clearalerts(interaction: discord.Interaction):
 # Slash command: /deletealert
 @app_commands.command(name="deletealert", description="Admin: Delete a scheduled alert by index")
 @app_commands.describe(index="The alert index from /listalerts")
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_admin)
 async def deletealert(interaction: discord.Interaction, index: int):
     try:
         alerts = load_alerts()
-        if not alerts or index < 1 or index > len(alerts):
+        guild_alerts = [alert for alert in alerts if alert_in_guild(alert, interaction.guild_id)]
+        if not guild_alerts or index < 1 or index > len(guild_alerts):
             embed = discord.Embed(
                 title="Delete Alert Error",
                 description="Invalid alert index or no alerts exist.",
@@ -980,7 +2080,8 @@ async def deletealert(interaction: discord.Interaction, index: int):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             logger.error(f"User {interaction.user.name} attempted to delete invalid alert index {index}")
             return
-        deleted_alert = alerts.pop(index - 1)
+        deleted_alert = guild_alerts[index - 1]
+        alerts.remove(deleted_alert)
         save_alerts(alerts)
         embed = discord.Embed(
             title="Alert Deleted",
@@ -1010,7 +2111,8 @@ async def listalerts(interaction: discord.Interaction):
         current_time = time.time()
         active_alerts = [
             alert for alert in alerts
-            if alert["frequency"] != "once" or alert["next_run"] > current_time
+            if alert_in_guild(alert, interaction.guild_id)
+            and (alert["frequency"] != "once" or alert["next_run"] > current_time)
         ]
         embed = discord.Embed(
             title="Scheduled Alerts",
@@ -1048,7 +2150,7 @@ async def listalerts(interaction: discord.Interaction):
     to_discord="Send to Discord channel (default: True)",
     to_mesh="Send to Meshtastic network (default: False)"
 )
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_admin)
 async def alert(interaction: discord.Interaction, message: str, frequency: str, to_discord: bool = True, to_mesh: bool = False):
     valid_frequencies = ["once", "hourly", "daily", "weekly"]
     if frequency.lower() not in valid_frequencies:
@@ -1062,7 +2164,8 @@ async def alert(interaction: discord.Interaction, message: str, frequency: str,
             "frequency": frequency.lower(),
             "to_discord": to_discord,
             "to_mesh": to_mesh,
-            "next_run": next_run
+            "next_run": next_run,
+            "guild_id": interaction.guild_id
         })
         save_alerts(alerts)
         embed = discord.Embed(
@@ -1117,19 +2220,20 @@ async def about(interaction: discord.Interaction):
             uptime_str = f"{uptime:.2f} hours" if isinstance(uptime, float) else uptime
             embed.add_field(name="Uptime", value=uptime_str, inline=True)
         else:
-            embed.add_field(name="Node Status", value="Meshtastic device not connected", inline=False)
+            embed.add_field(name="Node Status", value=radio_unavailable_message(), inline=False)
         owner_name = "No Admin Found"
-        guild = bot.get_guild(int(GUILD_ID))
-        if guild and ADMIN_ROLE_ID:
+        config = guild_registry.get_or_primary(interaction.guild_id)
+        guild = bot.get_guild(config.guild_id)
+        if guild and config.admin_role_id:
             try:
-                admin_role = guild.get_role(int(ADMIN_ROLE_ID))
+                admin_role = guild.get_role(config.admin_role_id)
                 if admin_role:
                     for member in guild.members:
                         if admin_role in member.roles:
                             owner_name = member.name
                             break
                 else:
-                    logger.error(f"Admin role ID {ADMIN_ROLE_ID} not found in guild")
+                    logger.error(f"Admin role ID {config.admin_role_id} not found in guild {config.guild_id}")
             except Exception as e:
                 logger.error(f"Failed to fetch admin role or members: {e}")
                 owner_name = "Error fetching admin"
@@ -1156,11 +2260,11 @@ async def about(interaction: discord.Interaction):
 # Slash command: /reboot
 @app_commands.command(name="reboot", description="Admin: Reboot the connected Meshtastic node")
 @app_commands.describe(seconds="Delay before reboot (default 10 seconds)")
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_primary_admin)
 async def reboot(interaction: discord.Interaction, seconds: int = 10):
     global reboot_in_progress, reboot_start_time
     if meshtastic_interface is None:
-        await interaction.response.send_message("Error: Meshtastic device not connected.", ephemeral=True)
+        await interaction.response.send_message(f"Error: {radio_unavailable_message()}", ephemeral=True)
         return
     try:
         if seconds < 1:
@@ -1195,7 +2299,7 @@ async def meshtastic_status(interaction: discord.Interaction):
     if meshtastic_interface is None:
         embed = discord.Embed(
             title="Meshtastic Status",
-            description="Error: Meshtastic device not connected.",
+            description=f"Error: {radio_unavailable_message()}",
             color=discord.Color.red(),
             timestamp=datetime.now(timezone.utc)
         )
@@ -1229,6 +2333,23 @@ async def meshtastic_status(interaction: discord.Interaction):
             value="Connected" if network_connected else "Not connected (no other nodes detected)",
             inline=True
         )
+        dedup_stats = packet_deduplicator.stats
+        embed.add_field(
+            name="Duplicate Packets",
+            value=f"{dedup_stats['duplicates']} of {dedup_stats['packets']} ({packet_deduplicator.duplicate_rate():.1%})",
+            inline=True
+        )
+        topology_summary = mesh_topology.summary()
+        embed.add_field(
+            name="Topology",
+            value=f"{topology_summary['nodes']} nodes, {topology_summary['edges']} links, {topology_summary['components']} segment(s)",
+            inline=True
+        )
+        embed.add_field(
+            name="Single Points of Failure",
+            value=str(len(mesh_topology.articulation_points())),
+            inline=True
+        )
         embed.set_footer(text="Checked via Meshtastic")
         await interaction.response.send_message(embed=embed)
     except Exception as e:
@@ -1245,7 +2366,7 @@ async def meshtastic_status(interaction: discord.Interaction):
 @app_commands.command(name="claimnode", description="Claim a Meshtastic node by receiving a code")
 async def claimnode(interaction: discord.Interaction):
     if meshtastic_interface is None:
-        await interaction.response.send_message("Error: Meshtastic device not connected.", ephemeral=True)
+        await interaction.response.send_message(f"Error: {radio_unavailable_message()}", ephemeral=True)
         return
     user_id = str(interaction.user.id)
     if user_id in pending_claims:
@@ -1253,7 +2374,7 @@ async def claimnode(interaction: discord.Interaction):
         return
     try:
         code = secrets.token_hex(4)
-        pending_claims[user_id] = {"code": code, "timestamp": time.time()}
+        pending_claims[user_id] = {"code": code, "timestamp": time.time(), "guild_id": interaction.guild_id}
         await interaction.user.send(f"To claim your Meshtastic node, send this code via your device: **{code}**\nIt expires in 5 minutes.")
         await interaction.response.send_message("Check your DMs for a code to send via your Meshtastic device.", ephemeral=True)
         logger.info(f"User {interaction.user.name} initiated node claim with code {code}")
@@ -1277,13 +2398,8 @@ async def releasenode(interaction: discord.Interaction):
         node_name = data["nodes"].get(owned_node, "Unknown")
         del owners[owned_node]
         save_owners(owners)
-        guild = bot.get_guild(int(GUILD_ID))
-        if guild:
-            member = guild.get_member(int(user_id))
-            if member and not any(owner_id == user_id for owner_id in owners.values()):
-                role = guild.get_role(int(NODE_OWNER_ROLE_ID))
-                if role and role in member.roles:
-                    await member.remove_roles(role)
+        refresh_node_index(owned_node)
+        await sync_owner_roles(user_id)
         await interaction.response.send_message(f"You have released ownership of node {node_name} ({owned_node}).", ephemeral=True)
         logger.info(f"User {interaction.user.name} released node {node_name} ({owned_node})")
     except Exception as e:
@@ -1331,7 +2447,7 @@ async def nodeinfo(interaction: discord.Interaction, node_id: str):
     if meshtastic_interface is None:
         embed = discord.Embed(
             title="Node Info",
-            description="Error: Meshtastic device not connected.",
+            description=f"Error: {radio_unavailable_message()}",
             color=discord.Color.red(),
             timestamp=datetime.now(timezone.utc)
         )
@@ -1407,7 +2523,7 @@ async def nodeinfo(interaction: discord.Interaction, node_id: str):
 # Slash command: /addnode
 @app_commands.command(name="addnode", description="Admin: Assign a node to a user")
 @app_commands.describe(node_id="The Node ID (e.g., !abc123)", user="The user to assign the node to")
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_primary_admin)
 async def addnode(interaction: discord.Interaction, node_id: str, user: discord.Member):
     try:
         node_id = node_id.strip()
@@ -1418,11 +2534,8 @@ async def addnode(interaction: discord.Interaction, node_id: str, user: discord.
         user_id = str(user.id)
         owners[node_id] = user_id
         save_owners(owners)
-        guild = bot.get_guild(int(GUILD_ID))
-        if guild:
-            role = guild.get_role(int(NODE_OWNER_ROLE_ID))
-            if role and role not in user.roles:
-                await user.add_roles(role)
+        refresh_node_index(node_id)
+        await sync_owner_roles(user_id)
         node_name = data["nodes"].get(node_id, "Unknown")
         await interaction.response.send_message(f"Node {node_name} ({node_id}) assigned to {user.name}.", ephemeral=True)
         logger.info(f"User {interaction.user.name} assigned node {node_name} ({node_id}) to {user.name}")
@@ -1433,7 +2546,7 @@ async def addnode(interaction: discord.Interaction, node_id: str, user: discord.
 # Slash command: /removenode
 @app_commands.command(name="removenode", description="Admin: Remove a node's ownership")
 @app_commands.describe(node_id="The Node ID (e.g., !abc123)")
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_primary_admin)
 async def removenode(interaction: discord.Interaction, node_id: str):
     try:
         node_id = node_id.strip()
@@ -1444,13 +2557,8 @@ async def removenode(interaction: discord.Interaction, node_id: str):
         node_name = data["nodes"].get(node_id, "Unknown")
         del owners[node_id]
         save_owners(owners)
-        guild = bot.get_guild(int(GUILD_ID))
-        if guild:
-            member = guild.get_member(int(user_id))
-            if member and not any(owner_id == user_id for owner_id in owners.values()):
-                role = guild.get_role(int(NODE_OWNER_ROLE_ID))
-                if role and role in member.roles:
-                    await member.remove_roles(role)
+        refresh_node_index(node_id)
+        await sync_owner_roles(user_id)
         await interaction.response.send_message(f"Ownership of node {node_name} ({node_id}) removed.", ephemeral=True)
         logger.info(f"User {interaction.user.name} removed ownership of node {node_name} ({node_id})")
     except Exception as e:
@@ -1464,7 +2572,7 @@ async def removenode(interaction: discord.Interaction, node_id: str):
     owner="Filter by node owner (Discord user), optional"
 )
 async def filtermessages(interaction: discord.Interaction, node_id: Optional[str] = None, owner: Optional[discord.Member] = None):
-    if not messages:
+    if not messages and message_log.next_seq == message_log.first_seq:
         embed = discord.Embed(
             title="Filtered Messages",
             description="No messages found in the log.",
@@ -1475,7 +2583,7 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
         await interaction.response.send_message(embed=embed)
         return
     try:
-        filtered_messages = messages
+        node_filter: Set[str] = set()
         filter_description = []
         if node_id:
             node_id = node_id.strip()
@@ -1489,7 +2597,7 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
                 embed.set_footer(text="Checked via Meshtastic")
                 await interaction.response.send_message(embed=embed)
                 return
-            filtered_messages = [msg for msg in filtered_messages if msg["node_id"] == node_id]
+            node_filter = {node_id}
             filter_description.append(f"Node ID: {node_id}")
         elif not owner:
             user_id = str(interaction.user.id)
@@ -1504,11 +2612,11 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
                 embed.set_footer(text="Checked via Meshtastic")
                 await interaction.response.send_message(embed=embed)
                 return
-            filtered_messages = [msg for msg in filtered_messages if msg["node_id"] in owned_nodes]
+            node_filter = set(owned_nodes)
             filter_description.append(f"User: {interaction.user.name}")
         else:
             owner_id = str(owner.id)
-            owned_nodes = [node_id for node_id, owner_id in owners.items() if owner_id == owner_id]
+            owned_nodes = [owned_node for owned_node, node_owner_id in owners.items() if node_owner_id == owner_id]
             if not owned_nodes:
                 embed = discord.Embed(
                     title="Filtered Messages",
@@ -1519,7 +2627,7 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
                 embed.set_footer(text="Checked via Meshtastic")
                 await interaction.response.send_message(embed=embed)
                 return
-            filtered_messages = [msg for msg in filtered_messages if msg["node_id"] in owned_nodes]
+            node_filter = set(owned_nodes)
             filter_description.append(f"Owner: {owner.name}")
         embed = discord.Embed(
             title="Filtered Messages",
@@ -1527,12 +2635,20 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
             timestamp=datetime.now(timezone.utc)
         )
         embed.add_field(name="Filter", value=", ".join(filter_description) or "None", inline=False)
-        if not filtered_messages:
+        latest = [messages[index] for index in messages.latest_for_nodes(node_filter, 5)]
+        if len(latest) < 5:
+            # Not enough in the recent window; page in older history from disk
+            older = await asyncio.to_thread(
+                message_log.scan_backward, message_seq_base,
+                lambda record: record.get("node_id") in node_filter, 5 - len(latest), None, FILTER_SCAN_MAX_LINES
+            )
+            latest.extend(record for _, record in older)
+        if not latest:
             embed.description = "No messages match the filter."
         else:
             messages_text = "\n".join(
                 f"**{data['nodes'].get(msg['node_id'], 'Unknown')} ({msg['node_id']})** at {datetime.fromtimestamp(msg['timestamp'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}: {msg['message']}"
-                for msg in filtered_messages[-5:]
+                for msg in reversed(latest)
             )
             embed.add_field(name="Messages", value=messages_text, inline=False)
         embed.set_footer(text="Checked via Meshtastic")
@@ -1549,6 +2665,15 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
         embed.set_footer(text="Checked via Meshtastic")
         await interaction.response.send_message(embed=embed)
 
+# One-line delivery status for /ack replies
+def delivery_status_text(delivery: Dict[str, Any]) -> str:
+    attempts = f"{delivery['attempts']} attempt{'s' if delivery['attempts'] != 1 else ''}"
+    if delivery["status"] == STATUS_DELIVERED:
+        return f"✅ Delivered in {delivery['latency']:.1f}s ({attempts})"
+    if delivery["status"] == STATUS_FAILED:
+        return f"❌ Not delivered after {attempts}: {delivery['error']}"
+    return "⏳ Waiting for acknowledgement..."
+
 # Slash command: /ack
 @app_commands.command(name="ack", description="Admin: Send a message to a specific Meshtastic node")
 @app_commands.describe(
@@ -1556,10 +2681,10 @@ async def filtermessages(interaction: discord.Interaction, node_id: Optional[str
     message="The message to send",
     channel="The Meshtastic channel index (0-7, default 0)"
 )
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_admin)
 async def ack(interaction: discord.Interaction, node_id: str, message: str, channel: int = 0):
     if meshtastic_interface is None:
-        await interaction.response.send_message("Error: Meshtastic device not connected.", ephemeral=True)
+        await interaction.response.send_message(f"Error: {radio_unavailable_message()}", ephemeral=True)
         return
     try:
         node_id = node_id.strip()
@@ -1570,17 +2695,40 @@ async def ack(interaction: discord.Interaction, node_id: str, message: str, chan
         if not (0 <= channel <= 7):
             await interaction.response.send_message("Error: Channel index must be between 0 and 7.", ephemeral=True)
             return
-        meshtastic_interface.sendText(
-            text=message,
-            destinationId=node_id,
-            channelIndex=channel
-        )
         node_name = data["nodes"].get(node_id, "Unknown")
-        await interaction.response.send_message(f"Message sent to {node_name} ({node_id}) on channel {channel}: {message}", ephemeral=True)
+        if not node_is_reachable(nodes[node_id]):
+            entry, dropped = outbox.enqueue(node_id, message, channel, interaction.user.name)
+            hours = (entry["expires_at"] - entry["queued_at"]) / 3600
+            reply = (
+                f"{node_name} ({node_id}) has not been heard recently. Message queued in its outbox "
+                f"and will be sent when the node is heard again (expires in {hours:.0f}h)."
+            )
+            if dropped:
+                reply += f"\nOutbox full; dropped the oldest queued message: {dropped['text']}"
+            await interaction.response.send_message(reply, ephemeral=True)
+            logger.info(f"User {interaction.user.name} queued message for stale node {node_name} ({node_id})")
+            return
+        await interaction.response.defer(ephemeral=True)
+        delivery = await delivery_tracker.send(node_id, message, channel)
+        followup = await interaction.followup.send(
+            f"Message sent to {node_name} ({node_id}) on channel {channel}: {message}\n{delivery_status_text(delivery)}",
+            ephemeral=True, wait=True
+        )
+
+        async def report(finished: Dict[str, Any]) -> None:
+            await followup.edit(content=f"Message to {node_name} ({node_id}) on channel {channel}: {message}\n{delivery_status_text(finished)}")
+
+        if delivery["id"] in delivery_tracker.pending:
+            delivery_tracker.add_listener(delivery["id"], report)
+        else:
+            await report(delivery)  # Finished already (e.g. failed to send)
         logger.info(f"User {interaction.user.name} sent message to node {node_name} ({node_id})")
     except Exception as e:
         logger.error(f"Error in /ack command for user {interaction.user.name}: {e}")
-        await interaction.response.send_message(f"Error sending message: {e}", ephemeral=True)
+        if interaction.response.is_done():
+            await interaction.followup.send(f"Error sending message: {e}", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"Error sending message: {e}", ephemeral=True)
 
 # Slash command: /broadcast
 @app_commands.command(name="broadcast", description="Admin: Broadcast a message to all Meshtastic nodes")
@@ -1588,10 +2736,10 @@ async def ack(interaction: discord.Interaction, node_id: str, message: str, chan
     message="The message to broadcast",
     channel="The Meshtastic channel index (0-7, default 0)"
 )
-@app_commands.checks.has_role(int(ADMIN_ROLE_ID))
+@app_commands.check(is_admin)
 async def broadcast(interaction: discord.Interaction, message: str, channel: int = 0):
     if meshtastic_interface is None:
-        await interaction.response.send_message("Error: Meshtastic device not connected.", ephemeral=True)
+        await interaction.response.send_message(f"Error: {radio_unavailable_message()}", ephemeral=True)
         return
     try:
         if not (0 <= channel <= 7):
@@ -1608,5 +2756,1065 @@ async def broadcast(interaction: discord.Interaction, message: str, channel: int
         logger.error(f"Error in /broadcast command for user {interaction.user.name}: {e}")
         await interaction.response.send_message(f"Error broadcasting message: {e}", ephemeral=True)
 
+# Render a chart in the worker process pool, serving repeated requests from the cache
+async def render_chart_cached(cache_key: Tuple[str, str, int, float], render_func, *args) -> bytes:
+    global chart_executor
+    now = time.time()
+    cached = chart_cache.get(cache_key)
+    if cached and now - cached[0] < CHART_CACHE_SECONDS:
+        chart_cache.move_to_end(cache_key)
+        return cached[1]
+    if chart_executor is None:
+        chart_executor = ProcessPoolExecutor(max_workers=1)
+    png = await asyncio.get_running_loop().run_in_executor(chart_executor, render_func, *args)
+    chart_cache[cache_key] = (now, png)
+    chart_cache.move_to_end(cache_key)
+    while len(chart_cache) > MAX_CHART_CACHE_ENTRIES:
+        chart_cache.popitem(last=False)
+    return png
+
+# Collect message timestamps since a point in time (messages are appended in time order),
+# paging in history older than the in-memory window from disk
+async def message_timestamps_since(start: float, node_id: Optional[str] = None) -> List[float]:
+    timestamps = [
+        messages.timestamp_at(i) for i in range(messages.first_index_at_or_after(start), len(messages))
+        if node_id is None or messages.node_id_at(i) == node_id
+    ]
+    if not messages or messages.timestamp_at(0) >= start:
+        older = await asyncio.to_thread(
+            message_log.scan_backward, message_seq_base,
+            (lambda record: record.get("node_id") == node_id) if node_id else None,
+            None, lambda record: record.get("timestamp", 0) < start
+        )
+        timestamps[:0] = [record["timestamp"] for _, record in reversed(older)]
+    return timestamps
+
+def chart_error_embed(description: str) -> discord.Embed:
+    embed = discord.Embed(
+        title="Chart Error",
+        description=description,
+        color=discord.Color.red(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    embed.set_footer(text="Checked via Meshtastic")
+    return embed
+
+# Slash command: /nodechart
+@app_commands.command(name="nodechart", description="Chart a node's battery, voltage or SNR over time")
+@app_commands.describe(
+    node_id="The Node ID (e.g., !abc123)",
+    metric="The metric to chart",
+    hours="How many hours of history to show (1-168, default 24)"
+)
+@app_commands.choices(metric=[
+    app_commands.Choice(name="Battery", value="battery"),
+    app_commands.Choice(name="Voltage", value="voltage"),
+    app_commands.Choice(name="SNR", value="snr")
+])
+async def nodechart(interaction: discord.Interaction, node_id: str, metric: str = "battery", hours: int = 24):
+    if not charts.CHARTS_AVAILABLE:
+        await interaction.response.send_message(embed=chart_error_embed("Chart rendering requires matplotlib to be installed."), ephemeral=True)
+        return
+    if not (1 <= hours <= 168):
+        await interaction.response.send_message(embed=chart_error_embed("Hours must be between 1 and 168."), ephemeral=True)
+        return
+    await interaction.response.defer()
+    try:
+        node_id = node_id.strip()
+        start = time.time() - hours * 3600
+        samples = [
+            (sample["timestamp"], sample[metric])
+            for sample in node_history.get(node_id, [])
+            if sample["timestamp"] >= start and metric in sample
+        ]
+        if not samples:
+            await interaction.followup.send(embed=chart_error_embed(f"No {metric} history recorded for node {node_id} in the last {hours} hours."))
+            return
+        name = data["nodes"].get(node_id, "Unknown")
+        title = f"{name} ({node_id}) - last {hours}h"
+        png = await render_chart_cached((node_id, metric, hours, samples[-1][0]), charts.render_metric_chart, title, metric, samples)
+        embed = discord.Embed(
+            title=f"Node Chart: {name} ({node_id})",
+            description=f"{charts.METRIC_LABELS[metric]} over the last {hours} hours ({len(samples)} samples).",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_image(url="attachment://chart.png")
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(png), filename="chart.png"))
+        logger.info(f"User {interaction.user.name} used /nodechart for node {node_id} ({metric}, {hours}h)")
+    except Exception as e:
+        logger.error(f"Error in /nodechart command for user {interaction.user.name}: {e}")
+        await interaction.followup.send(embed=chart_error_embed(f"Error rendering chart: {e}"))
+
+# Slash command: /activitychart
+@app_commands.command(name="activitychart", description="Chart mesh messages per hour")
+@app_commands.describe(
+    hours="How many hours of activity to show (1-168, default 24)",
+    node_id="Only count messages from this Node ID, optional"
+)
+async def activitychart(interaction: discord.Interaction, hours: int = 24, node_id: Optional[str] = None):
+    if not charts.CHARTS_AVAILABLE:
+        await interaction.response.send_message(embed=chart_error_embed("Chart rendering requires matplotlib to be installed."), ephemeral=True)
+        return
+    if not (1 <= hours <= 168):
+        await interaction.response.send_message(embed=chart_error_embed("Hours must be between 1 and 168."), ephemeral=True)
+        return
+    await interaction.response.defer()
+    try:
+        node_id = node_id.strip() if node_id else None
+        now = time.time()
+        start = now - hours * 3600
+        timestamps = await message_timestamps_since(start, node_id)
+        buckets = charts.hourly_buckets(timestamps, start, now)
+        label = f"{data['nodes'].get(node_id, 'Unknown')} ({node_id})" if node_id else "All nodes"
+        last_update = timestamps[-1] if timestamps else 0.0
+        cache_key = (node_id or "*", "messages", hours, last_update)
+        png = await render_chart_cached(cache_key, charts.render_activity_chart, f"{label} - last {hours}h", buckets)
+        embed = discord.Embed(
+            title="Mesh Activity",
+            description=f"{len(timestamps)} messages from {label} over the last {hours} hours.",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_image(url="attachment://chart.png")
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(png), filename="chart.png"))
+        logger.info(f"User {interaction.user.name} used /activitychart ({hours}h)")
+    except Exception as e:
+        logger.error(f"Error in /activitychart command for user {interaction.user.name}: {e}")
+        await interaction.followup.send(embed=chart_error_embed(f"Error rendering chart: {e}"))
+
+# Slash command: /route
+@app_commands.command(name="route", description="Show the best known mesh route to a node")
+@app_commands.describe(
+    node_id="The destination Node ID (e.g., !abc123)",
+    source="The starting Node ID, optional (defaults to the connected node)"
+)
+async def route(interaction: discord.Interaction, node_id: str, source: Optional[str] = None):
+    try:
+        node_id = node_id.strip()
+        source = source.strip() if source else get_local_node_id()
+        result = mesh_topology.shortest_path(source, node_id) if source else None
+        embed = discord.Embed(
+            title=f"Route to {node_label(node_id)}",
+            color=discord.Color.green() if result else discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        if not result:
+            embed.description = f"No known route from {source or 'the connected node'} to {node_id}."
+        else:
+            path, cost = result
+            embed.description = " → ".join(node_label(hop) for hop in path)
+            embed.add_field(name="Hops", value=str(len(path) - 1), inline=True)
+            embed.add_field(name="Route Cost", value=f"{cost:.2f}", inline=True)
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+        logger.info(f"User {interaction.user.name} used /route for node {node_id}")
+    except Exception as e:
+        logger.error(f"Error in /route command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Route",
+            description=f"Error computing route: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Slash command: /neighbors
+@app_commands.command(name="neighbors", description="List the direct radio neighbors of a node")
+@app_commands.describe(node_id="The Node ID (e.g., !abc123)")
+async def neighbors(interaction: discord.Interaction, node_id: str):
+    try:
+        node_id = node_id.strip()
+        node_neighbors = mesh_topology.neighbors(node_id)
+        embed = discord.Embed(
+            title=f"Neighbors of {node_label(node_id)}",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        if not node_neighbors:
+            embed.description = "No neighbors known for this node."
+        else:
+            now = time.time()
+            embed.description = "\n".join(
+                f"- {node_label(neighbor)}: SNR {snr if snr is not None else 'N/A'}, seen {int((now - updated_at) // 60)} min ago"
+                for neighbor, snr, updated_at in node_neighbors[:25]
+            )
+            if len(node_neighbors) > 25:
+                embed.description += f"\n...and {len(node_neighbors) - 25} more"
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+        logger.info(f"User {interaction.user.name} used /neighbors for node {node_id}")
+    except Exception as e:
+        logger.error(f"Error in /neighbors command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Neighbors",
+            description=f"Error listing neighbors: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Slash command: /spof
+@app_commands.command(name="spof", description="List nodes whose loss would split the mesh")
+async def spof(interaction: discord.Interaction):
+    try:
+        points = sorted(mesh_topology.articulation_points())
+        embed = discord.Embed(
+            title="Single Points of Failure",
+            color=discord.Color.orange() if points else discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        if not points:
+            embed.description = "No single points of failure detected in the known topology."
+        else:
+            embed.description = "\n".join(f"- {node_label(node_id)}" for node_id in points[:25])
+            if len(points) > 25:
+                embed.description += f"\n...and {len(points) - 25} more"
+        summary = mesh_topology.summary()
+        embed.add_field(name="Known Nodes", value=str(summary["nodes"]), inline=True)
+        embed.add_field(name="Links", value=str(summary["edges"]), inline=True)
+        embed.add_field(name="Segments", value=str(summary["components"]), inline=True)
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+        logger.info(f"User {interaction.user.name} used /spof command")
+    except Exception as e:
+        logger.error(f"Error in /spof command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Single Points of Failure",
+            description=f"Error analysing topology: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Format a distance for embeds
+def format_distance(distance_km: float) -> str:
+    return f"{distance_km * 1000:.0f} m" if distance_km < 1 else f"{distance_km:.2f} km"
+
+# Slash command: /nearby
+@app_commands.command(name="nearby", description="Find nodes near a coordinate or another node")
+@app_commands.describe(
+    latitude="Latitude of the search center, optional if node_id is given",
+    longitude="Longitude of the search center, optional if node_id is given",
+    node_id="Use this node's last known position as the center, optional",
+    radius_km="List every node within this radius; omit to show the nearest nodes",
+    limit="Maximum number of nodes to show (1-25, default 5)"
+)
+async def nearby(interaction: discord.Interaction, latitude: Optional[float] = None, longitude: Optional[float] = None,
+                 node_id: Optional[str] = None, radius_km: Optional[float] = None, limit: int = 5):
+    try:
+        limit = max(1, min(limit, 25))
+        center_label = None
+        exclude = set()
+        if node_id:
+            node_id = node_id.strip()
+            position = geo_index.get(node_id)
+            if not position:
+                await interaction.response.send_message(f"Error: No known position for node {node_id}.", ephemeral=True)
+                return
+            latitude, longitude = position[0], position[1]
+            center_label = node_label(node_id)
+            exclude.add(node_id)
+        if latitude is None or longitude is None:
+            await interaction.response.send_message("Error: Provide latitude and longitude, or a node_id.", ephemeral=True)
+            return
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            await interaction.response.send_message("Error: Coordinates are out of range.", ephemeral=True)
+            return
+        if radius_km is not None:
+            if radius_km <= 0:
+                await interaction.response.send_message("Error: Radius must be greater than 0.", ephemeral=True)
+                return
+            results = [(found, distance) for found, distance in geo_index.within_radius(latitude, longitude, radius_km) if found not in exclude]
+            title = f"Nodes within {format_distance(radius_km)}"
+        else:
+            results = geo_index.nearest(latitude, longitude, limit, exclude)
+            title = "Nearest Nodes"
+        embed = discord.Embed(
+            title=title,
+            description=f"Center: {center_label or f'{latitude:.5f}, {longitude:.5f}'}",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        if not results:
+            embed.add_field(name="Nodes", value="No nodes with a known position found.", inline=False)
+        else:
+            lines = [f"- {node_label(found)}: {format_distance(distance)}" for found, distance in results[:limit]]
+            if len(results) > limit:
+                lines.append(f"...and {len(results) - limit} more")
+            embed.add_field(name=f"Nodes ({len(results)})", value="\n".join(lines), inline=False)
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+        logger.info(f"User {interaction.user.name} used /nearby command")
+    except Exception as e:
+        logger.error(f"Error in /nearby command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Nearby Nodes",
+            description=f"Error searching nodes: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Slash command: /nodesin
+@app_commands.command(name="nodesin", description="List nodes inside a latitude/longitude bounding box")
+@app_commands.describe(
+    min_lat="Southern edge latitude",
+    min_lon="Western edge longitude",
+    max_lat="Northern edge latitude",
+    max_lon="Eastern edge longitude"
+)
+async def nodesin(interaction: discord.Interaction, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    try:
+        if min_lat > max_lat:
+            await interaction.response.send_message("Error: min_lat must not be greater than max_lat.", ephemeral=True)
+            return
+        found = sorted(geo_index.in_bounding_box(min_lat, min_lon, max_lat, max_lon))
+        embed = discord.Embed(
+            title="Nodes in Area",
+            description=f"Box: {min_lat:.5f}, {min_lon:.5f} to {max_lat:.5f}, {max_lon:.5f}",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        if not found:
+            embed.add_field(name="Nodes", value="No nodes with a known position in this area.", inline=False)
+        else:
+            lines = []
+            for node_id in found[:25]:
+                node_lat, node_lon, _ = geo_index.get(node_id)
+                lines.append(f"- {node_label(node_id)}: {node_lat:.5f}, {node_lon:.5f}")
+            if len(found) > 25:
+                lines.append(f"...and {len(found) - 25} more")
+            embed.add_field(name=f"Nodes ({len(found)})", value="\n".join(lines), inline=False)
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+        logger.info(f"User {interaction.user.name} used /nodesin command")
+    except Exception as e:
+        logger.error(f"Error in /nodesin command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Nodes in Area",
+            description=f"Error searching nodes: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Button-based pager for long embed listings; pages are rendered on demand
+class PaginatorView(discord.ui.View):
+    def __init__(self, user_id: int, page_count: Callable[[], int], render_page: Callable[[int], discord.Embed]):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.page_count = page_count
+        self.render_page = render_page
+        self.current_page = 0
+        self.update_buttons()
+
+    def update_buttons(self) -> None:
+        total = max(1, self.page_count())
+        self.current_page = min(self.current_page, total - 1)
+        self.previous_page.disabled = self.current_page == 0
+        self.next_page.disabled = self.current_page >= total - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the user who ran this command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    async def show_page(self, interaction: discord.Interaction) -> None:
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.render_page(self.current_page), view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.current_page = max(0, self.current_page - 1)
+        await self.show_page(interaction)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.current_page += 1
+        await self.show_page(interaction)
+
+# One /nodes line: name, battery, SNR, last heard and owner
+def format_node_line(node_id: str, now: float) -> str:
+    node_info = meshtastic_interface.nodes.get(node_id, {}) if meshtastic_interface else {}
+    battery = node_battery(node_info)
+    snr = node_info.get("snr")
+    last_heard = node_info.get("lastHeard")
+    parts = [f"**{data['nodes'].get(node_id, 'Unknown')}** ({node_id})"]
+    parts.append(f"🔋 {battery}%" if battery is not None else "🔋 N/A")
+    parts.append(f"SNR {snr}" if snr is not None else "SNR N/A")
+    if isinstance(last_heard, (int, float)) and last_heard:
+        minutes = int((now - last_heard) // 60)
+        parts.append(f"heard {minutes // 60}h {minutes % 60}m ago" if minutes >= 60 else f"heard {minutes}m ago")
+    else:
+        parts.append("never heard")
+    owner_id = owners.get(node_id)
+    if owner_id:
+        parts.append(f"owner {owner_display_name(owner_id)}")
+    return " · ".join(parts)
+
+# Slash command: /nodes
+@app_commands.command(name="nodes", description="List all known Meshtastic nodes")
+@app_commands.describe(
+    sort="Sort order (default: last heard)",
+    search="Only show nodes whose name or ID contains this text, optional",
+    owned_only="Only show claimed nodes (default: False)"
+)
+@app_commands.choices(sort=[
+    app_commands.Choice(name="Last heard", value="last_heard"),
+    app_commands.Choice(name="Battery", value="battery"),
+    app_commands.Choice(name="SNR", value="snr"),
+    app_commands.Choice(name="Owner", value="owner"),
+    app_commands.Choice(name="Name", value="name")
+])
+async def nodes(interaction: discord.Interaction, sort: str = "last_heard", search: Optional[str] = None, owned_only: bool = False):
+    try:
+        search_text = search.strip().lower() if search else None
+        filtered: Optional[List[str]] = None
+        if search_text or owned_only:
+            def matches(node_id: str) -> bool:
+                if owned_only and node_id not in owners:
+                    return False
+                return not search_text or search_text in node_id.lower() or search_text in data["nodes"].get(node_id, "").lower()
+            # Walks the pre-sorted index once; page flips then slice the result
+            filtered = list(node_sort_index.iter_sorted(sort, matches))
+
+        def total_nodes() -> int:
+            return len(filtered) if filtered is not None else len(node_sort_index)
+
+        def page_count() -> int:
+            return max(1, -(-total_nodes() // NODES_PAGE_SIZE))
+
+        def render_page(page: int) -> discord.Embed:
+            if filtered is not None:
+                page_nodes = filtered[page * NODES_PAGE_SIZE:(page + 1) * NODES_PAGE_SIZE]
+            else:
+                page_nodes = node_sort_index.page(sort, page, NODES_PAGE_SIZE)
+            embed = discord.Embed(
+                title="Meshtastic Nodes",
+                color=discord.Color.green(),
+                timestamp=datetime.now(timezone.utc)
+            )
+            now = time.time()
+            embed.description = "\n".join(format_node_line(node_id, now) for node_id in page_nodes) or "No nodes match."
+            filters = [f"search: {search}"] if search_text else []
+            if owned_only:
+                filters.append("claimed only")
+            embed.set_footer(text=f"Page {page + 1}/{page_count()} · {total_nodes()} nodes · sorted by {sort.replace('_', ' ')}"
+                                  + (f" · {', '.join(filters)}" if filters else "") + " · Checked via Meshtastic")
+            return embed
+
+        view = PaginatorView(interaction.user.id, page_count, render_page)
+        await interaction.response.send_message(embed=render_page(0), view=view if page_count() > 1 else discord.utils.MISSING)
+        logger.info(f"User {interaction.user.name} used /nodes command (sort: {sort})")
+    except Exception as e:
+        logger.error(f"Error in /nodes command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Meshtastic Nodes",
+            description=f"Error listing nodes: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Slash command: /searchmessages
+@app_commands.command(name="searchmessages", description="Search the Meshtastic message log")
+@app_commands.describe(
+    query='Words to find; use "quotes" for phrases and word* for prefixes',
+    hours="Only search the last N hours, optional",
+    node_id="Only show messages from this Node ID, optional"
+)
+async def searchmessages(interaction: discord.Interaction, query: str, hours: Optional[int] = None, node_id: Optional[str] = None):
+    try:
+        parsed_query = SearchQuery(query)
+        if not parsed_query:
+            await interaction.response.send_message("Error: The search query has no searchable words.", ephemeral=True)
+            return
+        if hours is not None and hours < 1:
+            await interaction.response.send_message("Error: Hours must be at least 1.", ephemeral=True)
+            return
+        node_id = node_id.strip() if node_id else None
+        start_time = time.time() - hours * 3600 if hours else None
+        results = [
+            seq for seq, _ in search_index.search(
+                parsed_query, start_time=start_time, get_text=message_text, node_ids=[node_id] if node_id else None
+            )
+        ]
+        filter_text = f"Query: {query}" + (f" · last {hours}h" if hours else "") + (f" · node {node_id}" if node_id else "")
+
+        def page_count() -> int:
+            return max(1, -(-len(results) // SEARCH_PAGE_SIZE))
+
+        def render_page(page: int) -> discord.Embed:
+            embed = discord.Embed(
+                title="Message Search",
+                description=filter_text,
+                color=discord.Color.green() if results else discord.Color.red(),
+                timestamp=datetime.now(timezone.utc)
+            )
+            lines = []
+            for seq in results[page * SEARCH_PAGE_SIZE:(page + 1) * SEARCH_PAGE_SIZE]:
+                msg = message_record(seq)
+                if msg is None:
+                    continue
+                sent_at = datetime.fromtimestamp(msg["timestamp"], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                lines.append(f"**{node_label(msg['node_id'])}** at {sent_at}: {msg['message'][:200]}")
+            embed.add_field(name=f"Matches ({len(results)})", value="\n".join(lines) or "No messages match the search.", inline=False)
+            footer = f"Page {page + 1}/{page_count()}"
+            if not search_index_ready:
+                footer += " · index still building, results may be incomplete"
+            embed.set_footer(text=footer + " · Checked via Meshtastic")
+            return embed
+
+        view = PaginatorView(interaction.user.id, page_count, render_page)
+        await interaction.response.send_message(embed=render_page(0), view=view if page_count() > 1 else discord.utils.MISSING)
+        logger.info(f"User {interaction.user.name} used /searchmessages ({len(results)} matches)")
+    except Exception as e:
+        logger.error(f"Error in /searchmessages command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Message Search",
+            description=f"Error searching messages: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Format a delivery latency for embeds
+def format_latency(seconds: Optional[float]) -> str:
+    return "N/A" if seconds is None else f"{seconds:.1f}s"
+
+# Slash command: /deliverystats
+@app_commands.command(name="deliverystats", description="Show delivery rate and latency of direct messages")
+@app_commands.describe(node_id="Only show this Node ID, optional")
+async def deliverystats(interaction: discord.Interaction, node_id: Optional[str] = None):
+    try:
+        embed = discord.Embed(
+            title="Delivery Stats",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        node_ids = [node_id.strip()] if node_id else sorted(
+            delivery_tracker.node_stats, key=lambda tracked: delivery_tracker.node_stats[tracked]["sent"], reverse=True
+        )[:10]
+        if not node_ids:
+            embed.description = "No direct messages have been sent yet."
+        for tracked_id in node_ids:
+            summary = delivery_tracker.summary(tracked_id)
+            rate = "N/A" if summary["delivery_rate"] is None else f"{summary['delivery_rate']:.0%}"
+            embed.add_field(
+                name=node_label(tracked_id),
+                value=(
+                    f"Sent: {summary['sent']} · Delivered: {summary['delivered']} · Failed: {summary['failed']} · Pending: {summary['pending']}\n"
+                    f"Delivery rate: {rate} · Latency p50: {format_latency(summary['latency_p50'])} · p95: {format_latency(summary['latency_p95'])}"
+                ),
+                inline=False
+            )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+        logger.info(f"User {interaction.user.name} used /deliverystats command")
+    except Exception as e:
+        logger.error(f"Error in /deliverystats command for user {interaction.user.name}: {e}")
+        embed = discord.Embed(
+            title="Delivery Stats",
+            description=f"Error reading delivery stats: {e}",
+            color=discord.Color.red(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed)
+
+# Slash command: /outbox
+@app_commands.command(name="outbox", description="Admin: Show or clear messages queued for offline nodes")
+@app_commands.describe(
+    node_id="Only show this Node ID, optional",
+    clear="Discard the queued messages for node_id"
+)
+@app_commands.check(is_primary_admin)
+async def outbox_command(interaction: discord.Interaction, node_id: Optional[str] = None, clear: bool = False):
+    try:
+        node_id = node_id.strip() if node_id else None
+        if clear:
+            if not node_id:
+                await interaction.response.send_message("Error: Specify a node_id to clear.", ephemeral=True)
+                return
+            removed = outbox.remove(node_id)
+            await interaction.response.send_message(f"Discarded {removed} queued messages for {node_label(node_id)}.", ephemeral=True)
+            logger.info(f"User {interaction.user.name} cleared the outbox for {node_id}")
+            return
+        embed = discord.Embed(
+            title="Outbox",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        now = time.time()
+        node_ids = [node_id] if node_id else sorted(outbox.queues)[:10]
+        for queued_id in node_ids:
+            entries = outbox.queues.get(queued_id, [])
+            if not entries:
+                continue
+            lines = [
+                f"{entry['text'][:80]} (by {entry['queued_by']}, expires in {max(0, entry['expires_at'] - now) / 3600:.1f}h)"
+                for entry in entries
+            ]
+            embed.add_field(name=f"{node_label(queued_id)}: {len(entries)} queued", value="\n".join(lines)[:1024], inline=False)
+        if not embed.fields:
+            embed.description = "No messages are queued."
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        logger.info(f"User {interaction.user.name} used /outbox command")
+    except Exception as e:
+        logger.error(f"Error in /outbox command for user {interaction.user.name}: {e}")
+        await interaction.response.send_message(f"Error reading outbox: {e}", ephemeral=True)
+
+# Slash command: /notify
+@app_commands.command(name="notify", description="Get a DM for messages from a node, keywords or low battery")
+@app_commands.describe(
+    kind="What to be notified about",
+    node_id="The Node ID (required for node and battery, optional filter for keyword)",
+    keyword="Word or phrase to watch for (keyword only)",
+    threshold="Battery percentage to alert below (battery only, default 20)"
+)
+@app_commands.choices(kind=[
+    app_commands.Choice(name="Messages from a node", value=RULE_NODE),
+    app_commands.Choice(name="Messages containing a keyword", value=RULE_KEYWORD),
+    app_commands.Choice(name="Low battery", value=RULE_BATTERY)
+])
+async def notify(interaction: discord.Interaction, kind: str, node_id: Optional[str] = None,
+                 keyword: Optional[str] = None, threshold: int = 20):
+    user_id = str(interaction.user.id)
+    node_id = node_id.strip() if node_id else None
+    keyword = keyword.strip() if keyword else None
+    if kind in (RULE_NODE, RULE_BATTERY) and not node_id:
+        await interaction.response.send_message("Error: Specify a node_id for this kind of notification.", ephemeral=True)
+        return
+    if kind == RULE_KEYWORD and not keyword:
+        await interaction.response.send_message("Error: Specify a keyword to watch for.", ephemeral=True)
+        return
+    if keyword and len(keyword) > MAX_KEYWORD_LENGTH:
+        await interaction.response.send_message(f"Error: Keywords can be at most {MAX_KEYWORD_LENGTH} characters.", ephemeral=True)
+        return
+    if kind == RULE_BATTERY and not (1 <= threshold <= 100):
+        await interaction.response.send_message("Error: Threshold must be between 1 and 100.", ephemeral=True)
+        return
+    pref = preferences.setdefault(user_id, {})
+    rules = pref.setdefault("rules", [])
+    if len(rules) >= MAX_RULES_PER_USER:
+        await interaction.response.send_message(
+            f"Error: You already have {MAX_RULES_PER_USER} notification rules. Remove one with /unnotify first.", ephemeral=True
+        )
+        return
+    rule = new_rule(
+        kind,
+        node_id=node_id,
+        keyword=keyword if kind == RULE_KEYWORD else None,
+        threshold=threshold if kind == RULE_BATTERY else None
+    )
+    rules.append(rule)
+    save_preferences(preferences)
+    await interaction.response.send_message(f"You will get a DM for {describe_rule(rule)} (rule `{rule['id']}`).", ephemeral=True)
+    logger.info(f"User {interaction.user.name} added notification rule {rule['id']}: {describe_rule(rule)}")
+
+# Slash command: /notifications
+@app_commands.command(name="notifications", description="List your notification rules and quiet hours")
+async def notifications(interaction: discord.Interaction):
+    pref = preferences.get(str(interaction.user.id), {})
+    embed = discord.Embed(
+        title="Your Notifications",
+        color=discord.Color.green(),
+        timestamp=datetime.now(timezone.utc)
+    )
+    lines = [f"`{rule['id']}`: {describe_rule(rule)}" for rule in pref.get("rules", [])]
+    if pref.get("dm_notifications", False):
+        lines.insert(0, "Messages from nodes you own (from /setup)")
+    embed.description = "\n".join(lines) if lines else "No notification rules. Add one with /notify."
+    quiet = pref.get("quiet_hours")
+    embed.add_field(name="Quiet Hours (UTC)", value=f"{quiet[0]:02d}:00-{quiet[1]:02d}:00" if quiet else "None", inline=False)
+    embed.set_footer(text="Remove a rule with /unnotify <rule_id>")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Slash command: /unnotify
+@app_commands.command(name="unnotify", description="Remove one of your notification rules")
+@app_commands.describe(rule_id="The rule ID shown by /notifications")
+async def unnotify(interaction: discord.Interaction, rule_id: str):
+    pref = preferences.get(str(interaction.user.id), {})
+    rules = pref.get("rules", [])
+    kept = [rule for rule in rules if rule["id"] != rule_id.strip()]
+    if len(kept) == len(rules):
+        await interaction.response.send_message(f"Error: No notification rule with ID {rule_id}.", ephemeral=True)
+        return
+    pref["rules"] = kept
+    save_preferences(preferences)
+    await interaction.response.send_message(f"Removed notification rule `{rule_id.strip()}`.", ephemeral=True)
+    logger.info(f"User {interaction.user.name} removed notification rule {rule_id}")
+
+# Slash command: /quiethours
+@app_commands.command(name="quiethours", description="Mute notification DMs during a daily window (UTC)")
+@app_commands.describe(
+    start="Hour the quiet window starts (0-23, UTC); omit both to clear",
+    end="Hour the quiet window ends (0-23, UTC)"
+)
+async def quiethours(interaction: discord.Interaction, start: Optional[int] = None, end: Optional[int] = None):
+    pref = preferences.setdefault(str(interaction.user.id), {})
+    if start is None and end is None:
+        pref.pop("quiet_hours", None)
+        save_preferences(preferences)
+        await interaction.response.send_message("Quiet hours cleared.", ephemeral=True)
+        return
+    if start is None or end is None or not (0 <= start <= 23 and 0 <= end <= 23) or start == end:
+        await interaction.response.send_message("Error: Give two different hours between 0 and 23.", ephemeral=True)
+        return
+    pref["quiet_hours"] = [start, end]
+    save_preferences(preferences)
+    await interaction.response.send_message(f"Notifications are muted from {start:02d}:00 to {end:02d}:00 UTC.", ephemeral=True)
+    logger.info(f"User {interaction.user.name} set quiet hours {start}-{end}")
+
+# Format a stage duration in milliseconds for /perf
+def format_ms(seconds: Optional[float]) -> str:
+    return "N/A" if seconds is None else f"{seconds * 1000:.1f}"
+
+# Slash command: /perf
+@app_commands.command(name="perf", description="Admin: Show per-stage latency of packet and node-update handling")
+@app_commands.check(is_admin)
+async def perf(interaction: discord.Interaction):
+    try:
+        embed = discord.Embed(
+            title="Handling Latency (ms)",
+            description=f"p50 / p95 / p99 over the last sampled events (sample rate {tracer.sample_rate:.0%})",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        summary = tracer.summary()
+        for kind, title in (("packet", "Packets"), ("node_update", "Node Updates")):
+            stages = sorted(summary.get(kind, []), key=lambda stage: stage[0] == "total")
+            lines = [
+                f"`{stage}`: {format_ms(p50)} / {format_ms(p95)} / {format_ms(p99)} (n={count})"
+                for stage, count, p50, p95, p99 in stages
+            ]
+            embed.add_field(
+                name=f"{title} ({tracer.traced.get(kind, 0)} traced)",
+                value="\n".join(lines) if lines else "No samples yet.",
+                inline=False
+            )
+        p50, p99 = percentiles(list(loop_watchdog.lags), (0.5, 0.99))
+        embed.add_field(
+            name="Event Loop Lag",
+            value=(
+                f"p50 {format_ms(p50)} / p99 {format_ms(p99)} over the last 10 minutes · max {format_ms(loop_watchdog.max_lag)}\n"
+                f"Stalls over {LOOP_LAG_THRESHOLD * 1000:.0f}ms: {loop_watchdog.stalls}"
+            ),
+            inline=False
+        )
+        embed.set_footer(text="Checked via Meshtastic")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        logger.info(f"User {interaction.user.name} used /perf command")
+    except Exception as e:
+        logger.error(f"Error in /perf command for user {interaction.user.name}: {e}")
+        await interaction.response.send_message(f"Error reading latency stats: {e}", ephemeral=True)
+
+# Parse "YYYY-MM-DD" or "YYYY-MM-DD HH:MM" as UTC into a Unix timestamp
+def parse_utc_time(text: str) -> float:
+    parsed = datetime.fromisoformat(text.strip())
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+# Headroom under the upload limit, since the compressor flushes output in blocks
+EXPORT_SIZE_MARGIN: int = 1_000_000
+
+# Slash command: /exportmessages
+@app_commands.command(name="exportmessages", description="Admin: Download archived and logged messages as compressed JSONL")
+@app_commands.describe(
+    node_id="Only messages from this Node ID (e.g., !abc123)",
+    owner="Only messages from nodes owned by this user",
+    since="Start of the window in UTC (YYYY-MM-DD or YYYY-MM-DD HH:MM)",
+    until="End of the window in UTC (YYYY-MM-DD or YYYY-MM-DD HH:MM)"
+)
+@app_commands.check(is_primary_admin)
+async def exportmessages(interaction: discord.Interaction, node_id: Optional[str] = None,
+                         owner: Optional[discord.Member] = None, since: Optional[str] = None, until: Optional[str] = None):
+    try:
+        start = parse_utc_time(since) if since else None
+        end = parse_utc_time(until) if until else None
+    except ValueError:
+        await interaction.response.send_message("Error: Use YYYY-MM-DD or YYYY-MM-DD HH:MM for since and until.", ephemeral=True)
+        return
+    node_filter: Optional[Set[str]] = None
+    filter_description = []
+    if node_id:
+        node_filter = {node_id.strip()}
+        filter_description.append(f"Node ID: {node_id.strip()}")
+    if owner:
+        owned_nodes = {owned_node for owned_node, owner_id in owners.items() if owner_id == str(owner.id)}
+        node_filter = owned_nodes if node_filter is None else node_filter & owned_nodes
+        filter_description.append(f"Owner: {owner.name}")
+    if since:
+        filter_description.append(f"Since: {since}")
+    if until:
+        filter_description.append(f"Until: {until}")
+    predicate = None if node_filter is None else (lambda record: record.get("node_id") in node_filter)
+    await interaction.response.defer(ephemeral=True)
+    fd, path = tempfile.mkstemp(suffix=".jsonl.gz")
+    os.close(fd)
+    try:
+        size_limit = interaction.guild.filesize_limit if interaction.guild else 10_000_000
+        count, truncated = await asyncio.to_thread(
+            export_messages, message_archive, message_log, path, start, end, predicate,
+            max(size_limit - EXPORT_SIZE_MARGIN, EXPORT_SIZE_MARGIN)
+        )
+        summary = f"Exported {count} message{'s' if count != 1 else ''} ({', '.join(filter_description) or 'no filter'})."
+        if truncated:
+            summary += " The export hit Discord's upload limit; narrow the window for the rest."
+        filename = f"messages-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+        await interaction.followup.send(summary, file=discord.File(path, filename=filename), ephemeral=True)
+        logger.info(f"User {interaction.user.name} used /exportmessages command ({count} messages)")
+    except Exception as e:
+        logger.error(f"Error in /exportmessages command for user {interaction.user.name}: {e}")
+        await interaction.followup.send(f"Error exporting messages: {e}", ephemeral=True)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Slash command: /snapshot
+@app_commands.command(name="snapshot", description="Admin: Take a consistent snapshot of the bot's state now")
+@app_commands.check(is_primary_admin)
+async def snapshot(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        header = await take_snapshot()
+        start, end = header["message_range"]
+        await interaction.followup.send(
+            f"Wrote {header['kind']} snapshot #{header['id']} to `{snapshot_writer.chain_path}`: "
+            f"{header['entries']} changed entries, {end - start} messages.\n"
+            f"Restore with `python snapshot.py restore` while the bot is stopped.",
+            ephemeral=True
+        )
+        logger.info(f"User {interaction.user.name} used /snapshot command")
+    except Exception as e:
+        logger.error(f"Error in /snapshot command for user {interaction.user.name}: {e}")
+        await interaction.followup.send(f"Error writing snapshot: {e}", ephemeral=True)
+
+# App command check for /guildsetup: an admin, or a server manager of a linked guild that has no admin role yet
+def can_configure_guild(interaction: discord.Interaction) -> bool:
+    config = guild_registry.get(interaction.guild_id)
+    if config is None:
+        return False
+    if is_admin(interaction):
+        return True
+    permissions = getattr(interaction.user, "guild_permissions", None)
+    return config.admin_role_id is None and permissions is not None and permissions.manage_guild
+
+# Slash command: /linkguild
+@app_commands.command(name="linkguild", description="Admin: Share the radio with another Discord server, or stop sharing")
+@app_commands.describe(guild_id="The server (guild) ID", remove="Unlink the server instead (default: False)")
+@app_commands.check(is_primary_admin)
+async def linkguild(interaction: discord.Interaction, guild_id: str, remove: bool = False):
+    try:
+        target_id = int(guild_id.strip())
+    except ValueError:
+        await interaction.response.send_message("Error: The guild ID must be a number.", ephemeral=True)
+        return
+    if remove:
+        if not guild_registry.remove(target_id):
+            await interaction.response.send_message(f"Error: Guild {target_id} is not linked (the primary guild cannot be removed).", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        await unregister_guild_commands(bot, target_id)
+        await interaction.followup.send(f"Guild {target_id} unlinked; it no longer receives relayed messages and its slash commands were removed.", ephemeral=True)
+        logger.info(f"User {interaction.user.name} unlinked guild {target_id}")
+        return
+    if bot.get_guild(target_id) is None:
+        await interaction.response.send_message(f"Error: The bot is not a member of guild {target_id}. Invite it first.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    guild_registry.update(target_id)
+    await register_guild_commands(bot, target_id)
+    await interaction.followup.send(
+        f"Guild {target_id} linked. A server manager there can now run `/guildsetup` to pick channels and roles.",
+        ephemeral=True
+    )
+    logger.info(f"User {interaction.user.name} linked guild {target_id}")
+
+# Channel (#) or role (@&) mention for a configured ID
+def format_mention(prefix: str, value: Optional[int]) -> str:
+    return f"<{prefix}{value}>" if value else "Not set"
+
+# /guildsetup clear names and the settings they unset
+GUILD_SETUP_CLEARABLE: Dict[str, str] = {
+    "relay_channel": "relay_channel_id",
+    "node_channel": "node_channel_id",
+    "admin_role": "admin_role_id",
+    "owner_role": "node_owner_role_id"
+}
+
+# Slash command: /guildsetup
+@app_commands.command(name="guildsetup", description="Admin: Configure relay channels and roles for this server")
+@app_commands.describe(
+    relay_channel="Channel that receives mesh messages",
+    node_channel="Channel for new node notices",
+    admin_role="Role allowed to use admin commands",
+    owner_role="Role granted to node owners",
+    mesh_channels="Comma-separated mesh channel indexes to relay (e.g. 0,2)",
+    rate="Relayed messages per minute for this server",
+    clear="Comma-separated settings to unset: relay_channel, node_channel, admin_role, owner_role"
+)
+@app_commands.check(can_configure_guild)
+async def guildsetup(interaction: discord.Interaction, relay_channel: Optional[discord.TextChannel] = None,
+                     node_channel: Optional[discord.TextChannel] = None, admin_role: Optional[discord.Role] = None,
+                     owner_role: Optional[discord.Role] = None, mesh_channels: Optional[str] = None, rate: Optional[int] = None,
+                     clear: Optional[str] = None):
+    cleared = [name for name in (clear or "").replace(" ", "").split(",") if name]
+    unknown = [name for name in cleared if name not in GUILD_SETUP_CLEARABLE]
+    if unknown:
+        await interaction.response.send_message(
+            f"Error: Cannot clear {', '.join(unknown)}. Choose from {', '.join(GUILD_SETUP_CLEARABLE)}.", ephemeral=True
+        )
+        return
+    try:
+        indexes = None
+        if mesh_channels is not None:
+            indexes = sorted({int(index) for index in mesh_channels.replace(" ", "").split(",") if index})
+            if not indexes or not all(0 <= index <= 7 for index in indexes):
+                raise ValueError
+    except ValueError:
+        await interaction.response.send_message("Error: Mesh channels must be indexes between 0 and 7, e.g. 0,2.", ephemeral=True)
+        return
+    if rate is not None and not 1 <= rate <= 120:
+        await interaction.response.send_message("Error: Rate must be between 1 and 120 messages per minute.", ephemeral=True)
+        return
+    try:
+        config = guild_registry.update(
+            interaction.guild_id,
+            relay_channel_id=relay_channel.id if relay_channel else None,
+            node_channel_id=node_channel.id if node_channel else None,
+            admin_role_id=admin_role.id if admin_role else None,
+            node_owner_role_id=owner_role.id if owner_role else None,
+            mesh_channels=indexes,
+            relay_rate=rate,
+            clear=[GUILD_SETUP_CLEARABLE[name] for name in cleared]
+        )
+        embed = discord.Embed(
+            title="Server Configuration",
+            color=discord.Color.green(),
+            timestamp=datetime.now(timezone.utc)
+        )
+        embed.add_field(name="Relay Channel", value=format_mention("#", config.relay_channel_id), inline=True)
+        embed.add_field(name="Node Channel", value=format_mention("#", config.node_channel_id), inline=True)
+        embed.add_field(name="Admin Role", value=format_mention("@&", config.admin_role_id), inline=True)
+        embed.add_field(name="Owner Role", value=format_mention("@&", config.node_owner_role_id), inline=True)
+        embed.add_field(name="Mesh Channels", value=", ".join(str(index) for index in config.mesh_channels), inline=True)
+        embed.add_field(name="Relay Rate", value=f"{config.relay_rate}/min", inline=True)
+        embed.set_footer(text="Command via Meshtastic")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        logger.info(f"User {interaction.user.name} updated the configuration of guild {interaction.guild_id}")
+    except Exception as e:
+        logger.error(f"Error in /guildsetup command for user {interaction.user.name}: {e}")
+        await interaction.response.send_message(f"Error saving configuration: {e}", ephemeral=True)
+
+# Slash command: /bridge
+@app_commands.command(name="bridge", description="Admin: Send messages from a channel to the mesh, or stop")
+@app_commands.describe(
+    channel="The Discord channel to bridge",
+    mesh_channel="The Meshtastic channel index to send on (0-7, default 0)",
+    remove="Stop bridging the channel instead (default: False)"
+)
+@app_commands.check(can_configure_guild)
+async def bridge(interaction: discord.Interaction, channel: discord.TextChannel, mesh_channel: int = 0, remove: bool = False):
+    if not (0 <= mesh_channel <= 7):
+        await interaction.response.send_message("Error: Channel index must be between 0 and 7.", ephemeral=True)
+        return
+    try:
+        bridge_channels = dict(guild_registry.get_or_primary(interaction.guild_id).bridge_channels)
+        if remove:
+            if bridge_channels.pop(channel.id, None) is None:
+                await interaction.response.send_message(f"{channel.mention} is not bridged.", ephemeral=True)
+                return
+        else:
+            bridge_channels[channel.id] = mesh_channel
+        guild_registry.update(interaction.guild_id, bridge_channels=bridge_channels)
+        if remove:
+            reply = f"Messages in {channel.mention} are no longer sent to the mesh."
+        else:
+            reply = (f"Messages in {channel.mention} are now sent to mesh channel {mesh_channel}. "
+                     "Long messages are split into packets; reactions show whether each one was sent.")
+        await interaction.response.send_message(reply, ephemeral=True)
+        logger.info(f"User {interaction.user.name} {'removed' if remove else 'set'} the bridge for channel {channel.id} in guild {interaction.guild_id}")
+    except Exception as e:
+        logger.error(f"Error in /bridge command for user {interaction.user.name}: {e}")
+        await interaction.response.send_message(f"Error saving bridge: {e}", ephemeral=True)
+
+# Build the Discord client and attach the log handler and event handlers
+def create_bot() -> commands.Bot:
+    global discord_log_handler
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    new_bot = MeshtasticBot(command_prefix='!', intents=intents)
+    task_supervisor.wait_ready = new_bot.wait_until_ready
+    new_bot.event(on_ready)
+    new_bot.event(on_reaction_add)
+    new_bot.event(on_message)
+    discord_log_handler = DiscordLogHandler(new_bot)
+    discord_log_handler.setLevel(logging.DEBUG)
+    discord_log_handler.addFilter(logging.Filter(logger.name))  # Only this module's records go to the admin channel
+    rate_limit_counter = RateLimitCounter(DISCORD_RATE_LIMITS, DISCORD_GLOBAL_RATE_LIMITS)
+    logging.getLogger("discord.http").addHandler(rate_limit_counter)
+    logging.getLogger("discord.webhook.async_").addHandler(rate_limit_counter)
+    if log_listener is not None:
+        add_listener_handler(log_listener, discord_log_handler)
+    else:
+        logger.addHandler(discord_log_handler)
+    return new_bot
+
+# Load state, then log in to Discord while the radio connects in the background
+async def run_bot() -> None:
+    global bot, metrics_runner
+    started = time.perf_counter()
+    load_state()
+    seed_node_index()
+    record_startup_phase("load_state", started)
+    bot = create_bot()
+    if LOOP_DEBUG:
+        LoopWatchdog.enable_slow_callback_logging(asyncio.get_running_loop(), LOOP_LAG_THRESHOLD)
+    if METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.error(f"Failed to start metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
+    async with bot:
+        radio_task = asyncio.create_task(connect_radio())
+        try:
+            await bot.start(BOT_TOKEN)
+        finally:
+            radio_task.cancel()
+            await task_supervisor.stop_all()
+            for webhook_relay in webhook_relays.values():
+                await webhook_relay.close()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+            if meshtastic_interface:
+                meshtastic_interface.close()
+            message_log.close()
+
+def main() -> None:
+    global log_listener
+    log_listener = configure_logging(LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_LEVELS)
+    try:
+        asyncio.run(run_bot())
+    finally:
+        log_listener.stop()
+
 # Run the bot
-bot.run(BOT_TOKEN)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
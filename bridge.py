@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from outbox import PACKET_OVERHEAD_BYTES, AirtimePacer, estimate_airtime
+from relay import RateBucket
+
+logger = logging.getLogger(__name__)
+
+# Meshtastic text payloads top out at 228 bytes; stay clear of the limit
+MAX_PAYLOAD_BYTES: int = 200
+# Longer texts are cut to this many fragments
+MAX_FRAGMENTS: int = 8
+TRUNCATION_MARK: str = "…"
+# "[<tag> <index>/<total>] " in front of every fragment; the tag tells apart
+# messages from the same sender whose fragments interleave
+FRAGMENT_HEADER = re.compile(r"^\[([0-9a-f]{2}) (\d{1,2})/(\d{1,2})\] ")
+# Incomplete messages are relayed with gaps once no fragment arrived for this long
+REASSEMBLY_TIMEOUT_SECONDS: float = 120.0
+MAX_PENDING_MESSAGES: int = 64
+# Discord messages per minute sent to the mesh, per user and for everyone together
+USER_RATE: int = 3
+GLOBAL_RATE: int = 10
+RATE_PER_SECONDS: float = 60.0
+# Refuse new messages once the queued fragments would keep the transmit path
+# busy (at the pacer's duty cycle) for longer than this
+MAX_BACKLOG_SECONDS: float = 300.0
+
+BRIDGE_QUEUED: str = "queued"
+BRIDGE_USER_LIMITED: str = "user_limited"
+BRIDGE_GLOBAL_LIMITED: str = "global_limited"
+BRIDGE_BUSY: str = "busy"
+
+# Split text into pieces of at most `limit` UTF-8 bytes, never inside a
+# character and at a space where one is reasonably close to the cut. Spaces are
+# kept, so joining the pieces gives back the text.
+def split_utf8(text: str, limit: int) -> List[str]:
+    pieces = []
+    while text:
+        encoded = text.encode("utf-8")
+        if len(encoded) <= limit:
+            pieces.append(text)
+            break
+        cut = encoded[:limit].decode("utf-8", errors="ignore")
+        space = cut.rfind(" ")
+        if space > len(cut) // 2:
+            cut = cut[:space + 1]
+        pieces.append(cut)
+        text = text[len(cut):]
+    return pieces
+
+# Fragments to transmit for `text`: the text itself when it fits one packet,
+# else up to max_fragments pieces with a sequence header. Returns (fragments,
+# truncated).
+def fragment_text(text: str, tag: int, max_bytes: int = MAX_PAYLOAD_BYTES,
+                  max_fragments: int = MAX_FRAGMENTS) -> Tuple[List[str], bool]:
+    if len(text.encode("utf-8")) <= max_bytes:
+        return [text], False
+    header_bytes = len(f"[{tag:02x} {max_fragments}/{max_fragments}] ")
+    pieces = split_utf8(text, max_bytes - header_bytes)
+    truncated = len(pieces) > max_fragments
+    if truncated:
+        pieces = pieces[:max_fragments]
+        pieces[-1] = split_utf8(pieces[-1], max_bytes - header_bytes - len(TRUNCATION_MARK.encode("utf-8")))[0] + TRUNCATION_MARK
+    total = len(pieces)
+    return [f"[{tag:02x} {index}/{total}] {piece}" for index, piece in enumerate(pieces, 1)], truncated
+
+# Buffers inbound fragments per (sender, tag) until the message is complete.
+# Texts without a fragment header pass straight through, so plain messages
+# cost one regex match.
+class FragmentReassembler:
+    def __init__(self, timeout: float = REASSEMBLY_TIMEOUT_SECONDS, max_pending: int = MAX_PENDING_MESSAGES):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        # {(sender, tag): {"total", "parts": {index: text}, "packet": latest packet, "updated"}}, least recently updated first
+        self.pending: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # Incomplete messages pushed out by max_pending, handed over by the next expire()
+        self.evicted: List[Tuple[Dict[str, Any], str]] = []
+
+    # The text to handle now: a plain message unchanged, the whole message when
+    # this fragment completes it, or None while fragments are still missing
+    def add(self, sender: str, text: str, packet: Dict[str, Any], now: Optional[float] = None) -> Optional[str]:
+        match = FRAGMENT_HEADER.match(text)
+        if match is None:
+            return text
+        tag, index, total = match.group(1), int(match.group(2)), int(match.group(3))
+        if not 1 <= index <= total:
+            return text
+        if total == 1:
+            return text[match.end():]
+        now = time.monotonic() if now is None else now
+        key = (sender, tag)
+        entry = self.pending.get(key)
+        if entry is None or entry["total"] != total:
+            if entry is not None:
+                self.evicted.append((entry["packet"], self._join(entry)))
+            entry = self.pending[key] = {"total": total, "parts": {}}
+            while len(self.pending) > self.max_pending:
+                _, oldest = self.pending.popitem(last=False)
+                self.evicted.append((oldest["packet"], self._join(oldest)))
+        self.pending.move_to_end(key)
+        entry["parts"][index] = text[match.end():]
+        entry["packet"] = packet
+        entry["updated"] = now
+        if len(entry["parts"]) < total:
+            return None
+        del self.pending[key]
+        return self._join(entry)
+
+    # add() for a received text packet. The decoded text goes in as sent, since a
+    # fragment ends with the space at its word boundary; only the result is stripped.
+    def add_packet(self, packet: Dict[str, Any], now: Optional[float] = None) -> Optional[str]:
+        text = self.add(packet.get("fromId", "Unknown"), packet.get("decoded", {}).get("text", ""), packet, now)
+        return text.strip() if text is not None else None
+
+    @staticmethod
+    def _join(entry: Dict[str, Any]) -> str:
+        return "".join(entry["parts"].get(index, TRUNCATION_MARK) for index in range(1, entry["total"] + 1))
+
+    # Incomplete messages that stopped receiving fragments, as (latest packet, text with gaps marked)
+    def expire(self, now: Optional[float] = None) -> List[Tuple[Dict[str, Any], str]]:
+        now = time.monotonic() if now is None else now
+        expired, self.evicted = self.evicted, []
+        while self.pending:
+            key, entry = next(iter(self.pending.items()))
+            if now - entry["updated"] < self.timeout:
+                break
+            del self.pending[key]
+            expired.append((entry["packet"], self._join(entry)))
+        return expired
+
+# The paced transmit path for text the bot sends to the mesh on its own. Texts
+# go out one at a time in order, each after the wait the shared airtime pacer
+# books for it; enqueue() refuses work once the backlog, counted in paced
+# seconds, would exceed max_backlog. send blocks on the radio link, so it runs
+# in a worker thread.
+class MeshTransmitter:
+    def __init__(self, send: Callable[[str, int, str], Any], pacer: AirtimePacer,
+                 max_backlog: float = MAX_BACKLOG_SECONDS):
+        self.send = send
+        self.pacer = pacer
+        self.max_backlog = max_backlog
+        # [(text, channel index, destination)]
+        self.queue: Deque[Tuple[str, int, str]] = deque()
+        self.queued_seconds = 0.0
+        self.wakeup = asyncio.Event()
+        # Fragment tag of the next split text; one counter for everything sent from this node
+        self.next_tag = 0
+
+    def _slot_seconds(self, text: str) -> float:
+        airtime = estimate_airtime(len(text.encode("utf-8")) + PACKET_OVERHEAD_BYTES)
+        return max(airtime / self.pacer.duty_cycle, self.pacer.min_gap)
+
+    # Seconds until everything already booked or queued has gone out
+    def backlog(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.pacer.next_slot - now) + self.queued_seconds
+
+    # Queue all of `texts` or none of them
+    def enqueue(self, texts: List[str], channel: int, destination: str = "^all") -> bool:
+        cost = sum(self._slot_seconds(text) for text in texts)
+        if self.backlog() + cost > self.max_backlog:
+            return False
+        self.queue.extend((text, channel, destination) for text in texts)
+        self.queued_seconds += cost
+        self.wakeup.set()
+        return True
+
+    # Fragment `text` and queue the fragments. Returns (fragments, truncated), or None when the backlog is full.
+    def send_text(self, text: str, channel: int, destination: str = "^all",
+                  max_fragments: int = MAX_FRAGMENTS) -> Optional[Tuple[int, bool]]:
+        fragments, truncated = fragment_text(text, self.next_tag, max_fragments=max_fragments)
+        if not self.enqueue(fragments, channel, destination):
+            return None
+        if len(fragments) > 1:
+            self.next_tag = (self.next_tag + 1) % 256
+        return len(fragments), truncated
+
+    async def run(self) -> None:
+        while True:
+            while not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            text, channel, destination = self.queue.popleft()
+            self.queued_seconds = max(0.0, self.queued_seconds - self._slot_seconds(text))
+            wait = self.pacer.reserve(text)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                await asyncio.to_thread(self.send, text, channel, destination)
+            except Exception as e:
+                logger.error(f"Failed to send to mesh channel {channel}: {e}")
+
+# Discord-to-mesh side of the bridge: per-user and global rate limits in front
+# of the transmitter. A message is refused outright rather than delayed when a
+# limit is hit, and counts against the limits only once it is queued.
+class MeshBridge:
+    def __init__(self, transmitter: MeshTransmitter, user_rate: int = USER_RATE, global_rate: int = GLOBAL_RATE):
+        self.transmitter = transmitter
+        self.user_rate = user_rate
+        self.user_buckets: Dict[int, RateBucket] = {}
+        self.global_bucket = RateBucket(global_rate, RATE_PER_SECONDS)
+
+    # Queue `text` for mesh channel `channel`. Returns (status, fragments queued, truncated).
+    def submit(self, user_id: int, text: str, channel: int, now: Optional[float] = None) -> Tuple[str, int, bool]:
+        now = time.monotonic() if now is None else now
+        user_bucket = self.user_buckets.get(user_id)
+        if user_bucket is None:
+            user_bucket = self.user_buckets[user_id] = RateBucket(self.user_rate, RATE_PER_SECONDS)
+        if user_bucket.delay(now) > 0:
+            return BRIDGE_USER_LIMITED, 0, False
+        if self.global_bucket.delay(now) > 0:
+            return BRIDGE_GLOBAL_LIMITED, 0, False
+        sent = self.transmitter.send_text(text, channel)
+        if sent is None:
+            return BRIDGE_BUSY, 0, False
+        user_bucket.reserve(now)
+        self.global_bucket.reserve(now)
+        return BRIDGE_QUEUED, sent[0], sent[1]
@@ -0,0 +1,77 @@
+import io
+from datetime import datetime, timezone
+from typing import List, Sequence, Tuple
+
+# matplotlib is optional; chart commands are disabled without it
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+    CHARTS_AVAILABLE: bool = True
+except ImportError:
+    plt = None
+    CHARTS_AVAILABLE = False
+
+# Chart styling shared by every chart (Discord dark theme friendly)
+BACKGROUND_COLOR: str = "#2f3136"
+FOREGROUND_COLOR: str = "#dcddde"
+LINE_COLOR: str = "#7289da"
+FIGURE_SIZE: Tuple[float, float] = (8, 4)
+FIGURE_DPI: int = 100
+
+METRIC_LABELS = {
+    "battery": "Battery (%)",
+    "voltage": "Voltage (V)",
+    "snr": "SNR (dB)",
+    "messages": "Messages per hour",
+}
+
+def _new_figure(title: str, ylabel: str):
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+    fig.patch.set_facecolor(BACKGROUND_COLOR)
+    ax.set_facecolor(BACKGROUND_COLOR)
+    ax.set_title(title, color=FOREGROUND_COLOR)
+    ax.set_ylabel(ylabel, color=FOREGROUND_COLOR)
+    ax.tick_params(colors=FOREGROUND_COLOR)
+    for spine in ax.spines.values():
+        spine.set_color(FOREGROUND_COLOR)
+    ax.grid(True, alpha=0.2)
+    return fig, ax
+
+def _finish_figure(fig, ax) -> bytes:
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%m-%d %H:%M", tz=timezone.utc))
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", facecolor=fig.get_facecolor())
+    plt.close(fig)
+    return buffer.getvalue()
+
+# Render a time series of one node metric; runs inside a worker process
+def render_metric_chart(title: str, metric: str, samples: Sequence[Tuple[float, float]]) -> bytes:
+    fig, ax = _new_figure(title, METRIC_LABELS.get(metric, metric))
+    times = [datetime.fromtimestamp(ts, timezone.utc) for ts, _ in samples]
+    values = [value for _, value in samples]
+    ax.plot(times, values, color=LINE_COLOR, linewidth=1.5, marker="o" if len(samples) < 50 else None, markersize=3)
+    if metric == "battery":
+        ax.set_ylim(0, 105)
+    return _finish_figure(fig, ax)
+
+# Render message counts bucketed per hour; runs inside a worker process
+def render_activity_chart(title: str, buckets: Sequence[Tuple[float, int]]) -> bytes:
+    fig, ax = _new_figure(title, METRIC_LABELS["messages"])
+    times = [datetime.fromtimestamp(ts, timezone.utc) for ts, _ in buckets]
+    counts = [count for _, count in buckets]
+    ax.bar(times, counts, width=1 / 24 * 0.9, align="edge", color=LINE_COLOR)
+    return _finish_figure(fig, ax)
+
+# Bucket sorted timestamps into hourly counts covering [start, end)
+def hourly_buckets(timestamps: Sequence[float], start: float, end: float) -> List[Tuple[float, int]]:
+    first_bucket = start - (start % 3600)
+    bucket_count = max(1, int((end - first_bucket) // 3600) + 1)
+    counts = [0] * bucket_count
+    for ts in timestamps:
+        if start <= ts < end:
+            counts[int((ts - first_bucket) // 3600)] += 1
+    return [(first_bucket + i * 3600, count) for i, count in enumerate(counts)]
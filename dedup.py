@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Time-bounded LRU set of recently seen packet keys. The meshtastic reader
+# thread calls this directly, so access is guarded by a lock.
+class PacketDeduplicator:
+    def __init__(self, window_seconds: float = 600, max_entries: int = 10_000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"packets": 0, "duplicates": 0, "unkeyed": 0}
+
+    @staticmethod
+    def packet_key(packet: Dict[str, Any]) -> Optional[Tuple[Any, int]]:
+        packet_id = packet.get("id")
+        sender = packet.get("fromId") or packet.get("from")
+        if not packet_id or sender is None:
+            return None
+        return (sender, packet_id)
+
+    def is_duplicate(self, packet: Dict[str, Any], now: Optional[float] = None) -> bool:
+        key = self.packet_key(packet)
+        now = time.time() if now is None else now
+        with self._lock:
+            self.stats["packets"] += 1
+            if key is None:
+                self.stats["unkeyed"] += 1
+                return False
+            # Entries are kept in insertion order, so expired ones sit at the front
+            while self._seen:
+                oldest_key, seen_at = next(iter(self._seen.items()))
+                if now - seen_at <= self.window_seconds:
+                    break
+                del self._seen[oldest_key]
+            if key in self._seen:
+                self.stats["duplicates"] += 1
+                return True
+            if len(self._seen) >= self.max_entries:
+                self._seen.popitem(last=False)
+            self._seen[key] = now
+            return False
+
+    def duplicate_rate(self) -> float:
+        packets = self.stats["packets"]
+        return self.stats["duplicates"] / packets if packets else 0.0
+
+    def __len__(self) -> int:
+        return len(self._seen)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# No routing reply within this long after a transmission counts as a failed attempt
+ACK_TIMEOUT_SECONDS: float = 90.0
+MAX_ATTEMPTS: int = 3
+# Wait before a retry; doubles after each failed attempt
+RETRY_BACKOFF_SECONDS: float = 15.0
+# Routing errors worth retrying; anything else (e.g. NO_CHANNEL, PKI_FAILED) fails at once
+RETRYABLE_ERRORS = {"TIMEOUT", "MAX_RETRANSMIT", "NO_RESPONSE", "NO_ROUTE", "DUTY_CYCLE_LIMIT", "RATE_LIMIT_EXCEEDED"}
+# Finished deliveries and per-node latency samples kept for stats
+HISTORY_SIZE: int = 500
+LATENCY_SAMPLES: int = 100
+
+STATUS_PENDING: str = "pending"
+STATUS_DELIVERED: str = "delivered"
+STATUS_FAILED: str = "failed"
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Tracks direct messages sent with wantAck until the destination acknowledges
+# them. ROUTING_APP packets are matched to deliveries by requestId (the id of
+# the packet they answer); a NAK or a timeout triggers a retry with backoff up
+# to MAX_ATTEMPTS. In-flight deliveries, recent results and per-node stats are
+# persisted so a restart resumes waiting for outstanding acks.
+class DeliveryTracker:
+    def __init__(self, path: str, send_func: Callable[[str, str, int], Optional[int]]):
+        self.path = path
+        self.send_func = send_func  # (node_id, text, channel) -> packet id; blocking
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.by_packet: Dict[int, str] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=HISTORY_SIZE)
+        # {node_id: {"sent": int, "delivered": int, "failed": int, "latencies": [seconds, ...]}}
+        self.node_stats: Dict[str, Dict[str, Any]] = {}
+        self._listeners: Dict[str, List[Callable[[Dict[str, Any]], Awaitable[Any]]]] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.warning(f"Failed to load {self.path}; returning default")
+            return
+        self.pending = {delivery["id"]: delivery for delivery in state.get("pending", [])}
+        self.by_packet = {
+            packet_id: delivery["id"] for delivery in self.pending.values() for packet_id in delivery["packet_ids"]
+        }
+        self.history.extend(state.get("history", []))
+        self.node_stats = state.get("stats", {})
+
+    def save(self) -> None:
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({
+                    "pending": list(self.pending.values()),
+                    "history": list(self.history),
+                    "stats": self.node_stats
+                }, f)
+        except IOError as e:
+            logger.error(f"Failed to save deliveries to {self.path}: {e}")
+
+    def _stats(self, node_id: str) -> Dict[str, Any]:
+        return self.node_stats.setdefault(node_id, {"sent": 0, "delivered": 0, "failed": 0, "latencies": []})
+
+    # Await a callback with the delivery once it is delivered or has failed for good
+    def add_listener(self, delivery_id: str, callback: Callable[[Dict[str, Any]], Awaitable[Any]]) -> None:
+        self._listeners.setdefault(delivery_id, []).append(callback)
+
+    async def send(self, node_id: str, text: str, channel: int = 0) -> Dict[str, Any]:
+        delivery = {
+            "id": secrets.token_hex(6),
+            "node_id": node_id,
+            "text": text,
+            "channel": channel,
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "packet_ids": [],
+            "created_at": time.time(),
+            "sent_at": None,
+            "deadline": None,
+            "next_attempt_at": None,
+            "error": None
+        }
+        self.pending[delivery["id"]] = delivery
+        self._stats(node_id)["sent"] += 1
+        await self._transmit(delivery)
+        return delivery
+
+    async def _transmit(self, delivery: Dict[str, Any]) -> None:
+        delivery["attempts"] += 1
+        delivery["next_attempt_at"] = None
+        try:
+            packet_id = await asyncio.to_thread(self.send_func, delivery["node_id"], delivery["text"], delivery["channel"])
+        except Exception as e:
+            logger.error(f"Failed to send delivery {delivery['id']} to {delivery['node_id']}: {e}")
+            await self._attempt_failed(delivery, f"send error: {e}")
+            return
+        now = time.time()
+        delivery["sent_at"] = now
+        delivery["deadline"] = now + ACK_TIMEOUT_SECONDS
+        if packet_id:
+            delivery["packet_ids"].append(packet_id)
+            self.by_packet[packet_id] = delivery["id"]
+        self.save()
+
+    async def _attempt_failed(self, delivery: Dict[str, Any], error: str, retryable: bool = True,
+                              now: Optional[float] = None) -> None:
+        delivery["error"] = error
+        delivery["deadline"] = None
+        if retryable and delivery["attempts"] < MAX_ATTEMPTS:
+            delivery["next_attempt_at"] = (time.time() if now is None else now) + RETRY_BACKOFF_SECONDS * 2 ** (delivery["attempts"] - 1)
+            logger.info(f"Delivery {delivery['id']} to {delivery['node_id']} attempt {delivery['attempts']} failed ({error}); retrying")
+            self.save()
+        else:
+            await self._finish(delivery, STATUS_FAILED)
+
+    async def _finish(self, delivery: Dict[str, Any], status: str, latency: Optional[float] = None) -> None:
+        delivery["status"] = status
+        delivery["finished_at"] = time.time()
+        delivery["latency"] = latency
+        self.pending.pop(delivery["id"], None)
+        for packet_id in delivery["packet_ids"]:
+            self.by_packet.pop(packet_id, None)
+        stats = self._stats(delivery["node_id"])
+        if status == STATUS_DELIVERED:
+            stats["delivered"] += 1
+            stats["latencies"] = (stats["latencies"] + [latency])[-LATENCY_SAMPLES:]
+        else:
+            stats["failed"] += 1
+        self.history.append(delivery)
+        self.save()
+        for callback in self._listeners.pop(delivery["id"], []):
+            try:
+                await callback(delivery)
+            except Exception as e:
+                logger.error(f"Delivery listener for {delivery['id']} failed: {e}")
+
+    # Match a ROUTING_APP packet to an outstanding delivery; returns whether it was one of ours
+    async def handle_packet(self, packet: Dict[str, Any]) -> bool:
+        decoded = packet.get("decoded", {})
+        if decoded.get("portnum") != "ROUTING_APP":
+            return False
+        delivery = self.pending.get(self.by_packet.get(decoded.get("requestId"), ""))
+        if delivery is None:
+            return False
+        error = decoded.get("routing", {}).get("errorReason", "NONE")
+        if error == "NONE":
+            if packet.get("fromId") != delivery["node_id"]:
+                # Implicit ack: a neighbor rebroadcast the packet; keep waiting for the destination
+                delivery["relayed"] = True
+                return True
+            delivery["error"] = None
+            await self._finish(delivery, STATUS_DELIVERED, time.time() - delivery["sent_at"])
+        else:
+            await self._attempt_failed(delivery, error, error in RETRYABLE_ERRORS)
+        return True
+
+    # Time out unanswered attempts and send due retries
+    async def tick(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        for delivery in list(self.pending.values()):
+            if delivery["deadline"] is not None and now >= delivery["deadline"]:
+                await self._attempt_failed(delivery, "no acknowledgement" + (" (relayed)" if delivery.get("relayed") else ""), now=now)
+            elif delivery["next_attempt_at"] is not None and now >= delivery["next_attempt_at"]:
+                await self._transmit(delivery)
+
+    def summary(self, node_id: str) -> Dict[str, Any]:
+        stats = self.node_stats.get(node_id, {"sent": 0, "delivered": 0, "failed": 0, "latencies": []})
+        finished = stats["delivered"] + stats["failed"]
+        return {
+            "sent": stats["sent"],
+            "delivered": stats["delivered"],
+            "failed": stats["failed"],
+            "pending": sum(1 for delivery in self.pending.values() if delivery["node_id"] == node_id),
+            "delivery_rate": stats["delivered"] / finished if finished else None,
+            "latency_p50": percentile(stats["latencies"], 0.5),
+            "latency_p95": percentile(stats["latencies"], 0.95)
+        }
@@ -0,0 +1,439 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from pubsub import pub
+
+logger = logging.getLogger(__name__)
+
+# Environment variable naming the gateway's Unix socket; setting it in the
+# bot's environment switches the bot to two-process mode
+GATEWAY_SOCKET_ENV: str = "MESHTASTIC_GATEWAY_SOCKET"
+DEFAULT_SOCKET_PATH: str = "meshtastic_gateway.sock"
+
+# Events kept for clients that reconnect and resume from a sequence number
+JOURNAL_SIZE: int = 20_000
+# Per-client send queue; a client that falls this far behind is disconnected and resumes
+CLIENT_QUEUE_SIZE: int = 5_000
+CALL_TIMEOUT_SECONDS: float = 30.0
+RECONNECT_DELAY_SECONDS: float = 1.0
+MAX_RECONNECT_DELAY_SECONDS: float = 30.0
+STATE_SAVE_INTERVAL_SECONDS: float = 5.0
+
+BROADCAST_ADDR: str = "^all"
+
+# Wire format: one JSON object per line. bytes are wrapped as {"__bytes__": base64};
+# protobuf objects under "raw" keys are dropped, as the decoded fields carry the same data.
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return str(value)
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+def _strip_raw(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _strip_raw(item) for key, item in value.items() if key != "raw"}
+    if isinstance(value, list):
+        return [_strip_raw(item) for item in value]
+    return value
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return (json.dumps(_strip_raw(message), default=_json_default) + "\n").encode("utf-8")
+
+def decode_message(line: bytes) -> Dict[str, Any]:
+    return json.loads(line, object_hook=_json_object_hook)
+
+# Copy a dict that another thread may be mutating
+def _copy_nodes(nodes: Dict[str, Any]) -> Dict[str, Any]:
+    for _ in range(5):
+        try:
+            return dict(nodes)
+        except RuntimeError:
+            time.sleep(0.01)
+    return {}
+
+# Daemon side: owns the SerialInterface, numbers every packet and NodeDB update,
+# keeps a bounded journal of them, and streams them to connected clients. A
+# client says hello with the epoch and last sequence number it processed and
+# receives a NodeDB snapshot followed by everything it missed. Clients send
+# calls ({"op": "call", "id", "method", "params"}) and get a result or error back.
+class GatewayServer:
+    def __init__(self, interface_factory: Callable[[], Any], socket_path: str, journal_size: int = JOURNAL_SIZE):
+        self.interface_factory = interface_factory
+        self.socket_path = socket_path
+        self.interface: Any = None
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.journal: Deque[Tuple[int, bytes]] = deque(maxlen=journal_size)
+        self.clients: Set[asyncio.Queue] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.methods: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "sendText": self._send_text,
+            "getMyNodeInfo": lambda params: self.interface.getMyNodeInfo(),
+            "reboot": lambda params: self.interface.localNode.reboot(params.get("seconds", 10)),
+        }
+
+    async def serve(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.interface = await asyncio.to_thread(self.interface_factory)
+        logger.info(f"Radio connected in {time.perf_counter() - started:.1f}s with {len(self.interface.nodes)} nodes")
+        pub.subscribe(self._on_receive, "meshtastic.receive")
+        pub.subscribe(self._on_node_updated, "meshtastic.node.updated")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"Gateway listening on {self.socket_path} (epoch {self.epoch})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.interface.close()
+
+    # Meshtastic threads -> event loop
+    def _on_receive(self, packet: Dict[str, Any], interface: Any, topic=pub.AUTO_TOPIC) -> None:
+        sender = packet.get("fromId")
+        event = {
+            "type": "packet",
+            "topic": topic.getName(),
+            "packet": packet,
+            "node": self.interface.nodes.get(sender) if sender else None
+        }
+        self.loop.call_soon_threadsafe(self._publish, encode_message(event))
+
+    def _on_node_updated(self, node: Dict[str, Any], interface: Any) -> None:
+        self.loop.call_soon_threadsafe(self._publish, encode_message({"type": "node", "node": node}))
+
+    def _publish(self, encoded: bytes) -> None:
+        self.seq += 1
+        # Sequence numbers are spliced in here so they follow loop order
+        line = b'{"seq": %d, ' % self.seq + encoded[1:]
+        self.journal.append((self.seq, line))
+        for queue in list(self.clients):
+            if queue.qsize() >= CLIENT_QUEUE_SIZE:
+                # Disconnect the laggard through the slot reserved for this; it resumes from its last seq
+                self.clients.discard(queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(line)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "nodes": _copy_nodes(self.interface.nodes),
+            "my_node_info": self.interface.getMyNodeInfo()
+        }
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE + 1)
+        try:
+            hello = decode_message(await asyncio.wait_for(reader.readline(), timeout=10))
+            resume_seq = hello.get("seq") if hello.get("epoch") == self.epoch else None
+            can_resume = resume_seq is not None and (not self.journal or resume_seq >= self.journal[0][0] - 1)
+            # No awaits from here until the queue is registered, so nothing is missed or repeated
+            writer.write(encode_message({"type": "welcome", "epoch": self.epoch, "seq": self.seq, "resumed": can_resume}))
+            if hello.get("snapshot") or not can_resume:
+                writer.write(encode_message(self._snapshot()))
+            if can_resume:
+                for seq, line in self.journal:
+                    if seq > resume_seq:
+                        writer.write(line)
+            self.clients.add(queue)
+            sender = asyncio.create_task(self._send_events(queue, writer))
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    asyncio.create_task(self._handle_call(decode_message(line), writer))
+            finally:
+                sender.cancel()
+        except (asyncio.TimeoutError, ConnectionError, ValueError) as e:
+            logger.warning(f"Gateway client error: {e}")
+        finally:
+            self.clients.discard(queue)
+            writer.close()
+
+    async def _send_events(self, queue: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        while True:
+            line = await queue.get()
+            if line is None:
+                logger.warning("Gateway client fell behind; disconnecting it")
+                writer.close()
+                return
+            writer.write(line)
+            await writer.drain()
+
+    async def _handle_call(self, request: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        call_id = request.get("id")
+        method = self.methods.get(request.get("method"))
+        if method is None:
+            response = {"type": "error", "id": call_id, "error": f"Unknown method {request.get('method')}"}
+        else:
+            try:
+                result = await asyncio.to_thread(method, request.get("params") or {})
+                response = {"type": "result", "id": call_id, "result": result}
+            except Exception as e:
+                response = {"type": "error", "id": call_id, "error": f"{type(e).__name__}: {e}"}
+        if not writer.is_closing():
+            writer.write(encode_message(response))
+
+    def _send_text(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        packet = self.interface.sendText(**params)
+        return {"id": getattr(packet, "id", None)}
+
+# Result of a remote sendText; mirrors the packet id of the MeshPacket SerialInterface returns
+class SentPacket:
+    def __init__(self, packet_id: Optional[int]):
+        self.id = packet_id
+
+class RemoteNode:
+    def __init__(self, client: "GatewayClient"):
+        self.client = client
+
+    def reboot(self, secs: int = 10) -> None:
+        self.client.call("reboot", {"seconds": secs})
+
+# Bot side: a drop-in stand-in for SerialInterface backed by the gateway. A
+# reader thread mirrors the NodeDB and republishes packets and node updates on
+# the usual pubsub topics, so the bot's handlers run unchanged. The last
+# processed (epoch, seq) is saved to state_file so a restarted bot resumes the
+# stream where it left off; reconnects after a gateway restart start fresh.
+# Events are held back until start() is called, so the journal replay that
+# follows the snapshot reaches the bot's subscribers instead of nobody.
+class GatewayClient:
+    def __init__(self, socket_path: str, state_file: Optional[str] = None, connect_timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.state_file = state_file
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.my_node_info: Optional[Dict[str, Any]] = None
+        self.localNode = RemoteNode(self)
+        self.epoch: Optional[str] = None
+        self.last_seq = 0
+        self._snapshot_seq = 0
+        self._load_state()
+        # (epoch, seq) of the last event handed to subscribers; this is what state_file records
+        self._published: Tuple[Optional[str], int] = (self.epoch, self.last_seq)
+        self._started = False
+        # [(epoch, seq, topic, kwargs)] received before start(), oldest first
+        self._held: List[Tuple[Optional[str], int, str, Dict[str, Any]]] = []
+        self._publish_lock = threading.Lock()
+        self._last_saved = time.monotonic()
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, List[Any]] = {}  # {call_id: [threading.Event, response]}
+        self._call_ids = itertools.count(1)
+        self._closing = False
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gateway-client", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(connect_timeout):
+            self.close()
+            raise ConnectionError(f"No snapshot from Meshtastic gateway at {socket_path} within {connect_timeout:.0f}s")
+
+    def _load_state(self) -> None:
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            self.epoch, self.last_seq = state["epoch"], int(state["seq"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+            pass
+
+    def _save_state(self) -> None:
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "w") as f:
+                epoch, seq = self._published
+                json.dump({"epoch": epoch, "seq": seq}, f)
+        except IOError as e:
+            logger.error(f"Failed to save gateway state to {self.state_file}: {e}")
+        self._last_saved = time.monotonic()
+
+    def _run(self) -> None:
+        delay = RECONNECT_DELAY_SECONDS
+        while not self._closing:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                self._sock = sock
+                with self._send_lock:
+                    sock.sendall(encode_message({"op": "hello", "epoch": self.epoch, "seq": self.last_seq, "snapshot": True}))
+                delay = RECONNECT_DELAY_SECONDS
+                with sock.makefile("rb") as stream:
+                    for line in stream:
+                        self._handle(decode_message(line))
+                raise ConnectionError("gateway closed the connection")
+            except (OSError, ValueError) as e:
+                connected = self._sock is not None
+                self._sock = None
+                self._fail_pending(f"Gateway connection lost: {e}")
+                if self._closing:
+                    break
+                if connected and self._ready.is_set():
+                    self._publish_connection("meshtastic.connection.lost")
+                logger.warning(f"Meshtastic gateway connection lost ({e}); reconnecting in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+    # Publish the events held since connecting, then publish new ones as they
+    # arrive. Call once the pubsub subscriptions are in place.
+    def start(self) -> None:
+        with self._publish_lock:
+            for epoch, seq, topic, kwargs in self._held:
+                self._send(epoch, seq, topic, kwargs)
+            self._held = []
+            self._started = True
+        self._save_state()
+
+    def _publish(self, seq: int, topic: str, **kwargs: Any) -> None:
+        with self._publish_lock:
+            if self._started:
+                self._send(self.epoch, seq, topic, kwargs)
+            else:
+                self._held.append((self.epoch, seq, topic, kwargs))
+
+    def _send(self, epoch: Optional[str], seq: int, topic: str, kwargs: Dict[str, Any]) -> None:
+        try:
+            pub.sendMessage(topic, interface=self, **kwargs)
+        except Exception as e:
+            logger.error(f"Error in Meshtastic event listener for {topic}: {e}", exc_info=True)
+        if seq and epoch == self.epoch:
+            self._published = (epoch, seq)
+
+    # Mirror SerialInterface's link events after the first connection
+    def _publish_connection(self, topic: str) -> None:
+        self._publish(0, topic)
+
+    def _handle(self, message: Dict[str, Any]) -> None:
+        kind = message.get("type")
+        if kind == "welcome":
+            if message["epoch"] != self.epoch:
+                if self.epoch is not None:
+                    logger.warning("Meshtastic gateway restarted; events sent before the restart were not resumed")
+                self.epoch = message["epoch"]
+                self.last_seq = 0
+            elif not message.get("resumed"):
+                logger.warning(f"Meshtastic gateway journal no longer holds events after {self.last_seq}; some were missed")
+                self.last_seq = message["seq"]
+                with self._publish_lock:
+                    if not self._held:
+                        self._published = (self.epoch, self.last_seq)
+        elif kind == "snapshot":
+            nodes = message.get("nodes") or {}
+            self.nodes.update(nodes)
+            for node_id in [node_id for node_id in self.nodes if node_id not in nodes]:
+                del self.nodes[node_id]
+            self.my_node_info = message.get("my_node_info")
+            self._snapshot_seq = message["seq"]
+            if self._ready.is_set():
+                self._publish_connection("meshtastic.connection.established")
+            self._ready.set()
+        elif kind in ("packet", "node"):
+            seq = message["seq"]
+            if seq <= self.last_seq:
+                return
+            node = message.get("node")
+            node_id = (node or {}).get("user", {}).get("id")
+            if node_id and seq > self._snapshot_seq:
+                self.nodes[node_id] = node
+            self.last_seq = seq
+            if kind == "packet":
+                self._publish(seq, message.get("topic", "meshtastic.receive"), packet=message["packet"])
+            elif node:
+                self._publish(seq, "meshtastic.node.updated", node=node)
+            if self._started and time.monotonic() - self._last_saved >= STATE_SAVE_INTERVAL_SECONDS:
+                self._save_state()
+        elif kind in ("result", "error"):
+            waiter = self._pending.pop(message.get("id"), None)
+            if waiter:
+                waiter[1] = message
+                waiter[0].set()
+
+    def _fail_pending(self, error: str) -> None:
+        for call_id in list(self._pending):
+            waiter = self._pending.pop(call_id, None)
+            if waiter:
+                waiter[1] = {"type": "error", "error": error}
+                waiter[0].set()
+
+    # Blocking request/response call to the gateway
+    def call(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: float = CALL_TIMEOUT_SECONDS) -> Any:
+        sock = self._sock
+        if sock is None:
+            raise ConnectionError("Meshtastic gateway is not connected")
+        call_id = next(self._call_ids)
+        waiter: List[Any] = [threading.Event(), None]
+        self._pending[call_id] = waiter
+        try:
+            with self._send_lock:
+                sock.sendall(encode_message({"op": "call", "id": call_id, "method": method, "params": params or {}}))
+        except OSError as e:
+            self._pending.pop(call_id, None)
+            raise ConnectionError(f"Meshtastic gateway call failed: {e}") from e
+        if not waiter[0].wait(timeout):
+            self._pending.pop(call_id, None)
+            raise TimeoutError(f"Meshtastic gateway call {method} timed out")
+        response = waiter[1]
+        if response["type"] == "error":
+            raise RuntimeError(response["error"])
+        return response.get("result")
+
+    def getMyNodeInfo(self) -> Optional[Dict[str, Any]]:
+        return self.my_node_info
+
+    def sendText(self, text: str, destinationId: Any = BROADCAST_ADDR, wantAck: bool = False,
+                 wantResponse: bool = False, onResponse: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                 channelIndex: int = 0, **kwargs: Any) -> SentPacket:
+        if onResponse is not None:
+            logger.debug("onResponse callbacks are not forwarded through the gateway; responses arrive as packets")
+        params = {"text": text, "destinationId": destinationId, "wantAck": wantAck,
+                  "wantResponse": wantResponse, "channelIndex": channelIndex}
+        params.update(kwargs)
+        result = self.call("sendText", params) or {}
+        return SentPacket(result.get("id"))
+
+    def close(self) -> None:
+        self._closing = True
+        self._save_state()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout=5)
+
+def main() -> None:
+    from dotenv import load_dotenv
+    import meshtastic.serial_interface
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    port = os.getenv("MESHTASTIC_PORT")
+    if not port:
+        raise ValueError("Missing required environment variable: MESHTASTIC_PORT")
+    socket_path = os.getenv(GATEWAY_SOCKET_ENV, DEFAULT_SOCKET_PATH)
+    server = GatewayServer(lambda: meshtastic.serial_interface.SerialInterface(port), socket_path)
+    asyncio.run(server.serve())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import math
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM: float = 6371.0088
+KM_PER_DEGREE_LAT: float = 111.32
+
+# Default grid cell size in degrees (~5.5 km north-south)
+DEFAULT_CELL_DEGREES: float = 0.05
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+# Extract (latitude, longitude) from a decoded position, accepting the integer form too
+def position_coordinates(position: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    latitude = position.get("latitude")
+    longitude = position.get("longitude")
+    if latitude is None and "latitudeI" in position:
+        latitude = position["latitudeI"] * 1e-7
+    if longitude is None and "longitudeI" in position:
+        longitude = position["longitudeI"] * 1e-7
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return None
+    if latitude == 0 and longitude == 0:
+        return None  # No GPS fix
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return float(latitude), float(longitude)
+
+# Uniform lat/lon grid index. Each node lives in exactly one cell, so an
+# update is O(1) and a radius/box query only visits the cells it overlaps.
+class GeoGridIndex:
+    def __init__(self, cell_degrees: float = DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.lon_cells = int(round(360 / cell_degrees))
+        self.cells: Dict[Tuple[int, int], Set[str]] = {}
+        # {node_id: (latitude, longitude, updated_at, cell)}
+        self.positions: Dict[str, Tuple[float, float, float, Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            int(math.floor((latitude + 90) / self.cell_degrees)),
+            int(math.floor((longitude + 180) / self.cell_degrees)) % self.lon_cells
+        )
+
+    def update(self, node_id: str, latitude: float, longitude: float, updated_at: Optional[float] = None) -> None:
+        cell = self._cell(latitude, longitude)
+        previous = self.positions.get(node_id)
+        if previous and previous[3] != cell:
+            self._discard_from_cell(node_id, previous[3])
+        self.positions[node_id] = (latitude, longitude, time.time() if updated_at is None else updated_at, cell)
+        self.cells.setdefault(cell, set()).add(node_id)
+
+    def remove(self, node_id: str) -> None:
+        previous = self.positions.pop(node_id, None)
+        if previous:
+            self._discard_from_cell(node_id, previous[3])
+
+    def _discard_from_cell(self, node_id: str, cell: Tuple[int, int]) -> None:
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(node_id)
+            if not members:
+                del self.cells[cell]
+
+    def get(self, node_id: str) -> Optional[Tuple[float, float, float]]:
+        position = self.positions.get(node_id)
+        return position[:3] if position else None
+
+    def _lon_cell_range(self, min_lon: float, max_lon: float) -> List[int]:
+        if max_lon - min_lon >= 360:
+            return list(range(self.lon_cells))
+        first = int(math.floor((min_lon + 180) / self.cell_degrees))
+        last = int(math.floor((max_lon + 180) / self.cell_degrees))
+        return sorted({index % self.lon_cells for index in range(first, last + 1)})
+
+    def _candidates(self, min_lat: float, max_lat: float, lon_cells: List[int]):
+        first_lat = int(math.floor((max(min_lat, -90) + 90) / self.cell_degrees))
+        last_lat = int(math.floor((min(max_lat, 90) + 90) / self.cell_degrees))
+        if (last_lat - first_lat + 1) * len(lon_cells) > len(self.cells):
+            # Query covers more cells than are occupied; walk the occupied ones instead
+            wanted_lon_cells = set(lon_cells)
+            for (lat_cell, lon_cell), members in self.cells.items():
+                if first_lat <= lat_cell <= last_lat and lon_cell in wanted_lon_cells:
+                    yield from members
+            return
+        for lat_cell in range(first_lat, last_lat + 1):
+            for lon_cell in lon_cells:
+                members = self.cells.get((lat_cell, lon_cell))
+                if members:
+                    yield from members
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[str, float]]:
+        lat_delta = radius_km / KM_PER_DEGREE_LAT
+        cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + lat_delta)))
+        lon_delta = 360.0 if cos_lat <= 0 else radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+        lon_cells = self._lon_cell_range(longitude - lon_delta, longitude + lon_delta)
+        results = []
+        for node_id in self._candidates(latitude - lat_delta, latitude + lat_delta, lon_cells):
+            node_lat, node_lon, _, _ = self.positions[node_id]
+            distance = haversine_km(latitude, longitude, node_lat, node_lon)
+            if distance <= radius_km:
+                results.append((node_id, distance))
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def in_bounding_box(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[str]:
+        if min_lon <= max_lon:
+            lon_cells = self._lon_cell_range(min_lon, max_lon)
+        else:
+            # Box crosses the antimeridian
+            lon_cells = sorted(set(self._lon_cell_range(min_lon, 180)) | set(self._lon_cell_range(-180, max_lon)))
+        results = []
+        for node_id in self._candidates(min_lat, max_lat, lon_cells):
+            node_lat, node_lon, _, _ = self.positions[node_id]
+            in_lon = min_lon <= node_lon <= max_lon if min_lon <= max_lon else (node_lon >= min_lon or node_lon <= max_lon)
+            if min_lat <= node_lat <= max_lat and in_lon:
+                results.append(node_id)
+        return results
+
+    def nearest(self, latitude: float, longitude: float, count: int = 1, exclude: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        exclude = exclude or set()
+        if len(self.positions) - len(exclude & self.positions.keys()) <= 0:
+            return []
+        center_lat, center_lon = self._cell(latitude, longitude)
+        best: List[Tuple[str, float]] = []
+        ring = 0
+        max_ring = int(180 / self.cell_degrees) + 1
+        while ring <= max_ring:
+            if (2 * ring + 1) ** 2 > len(self.cells):
+                # Rings now cover more cells than are occupied; finish with a scan of the index
+                best = [
+                    (node_id, haversine_km(latitude, longitude, node_lat, node_lon))
+                    for node_id, (node_lat, node_lon, _, _) in self.positions.items()
+                    if node_id not in exclude
+                ]
+                best.sort(key=lambda item: item[1])
+                return best[:count]
+            for lat_cell in range(center_lat - ring, center_lat + ring + 1):
+                for lon_offset in range(-ring, ring + 1):
+                    if ring and abs(lat_cell - center_lat) != ring and abs(lon_offset) != ring:
+                        continue  # Interior cells were visited by earlier rings
+                    for node_id in self.cells.get((lat_cell, (center_lon + lon_offset) % self.lon_cells), ()):
+                        if node_id not in exclude:
+                            node_lat, node_lon, _, _ = self.positions[node_id]
+                            best.append((node_id, haversine_km(latitude, longitude, node_lat, node_lon)))
+            best.sort(key=lambda item: item[1])
+            best = best[:count]
+            if len(best) == count:
+                # Anything outside this ring is at least `ring` whole cells away
+                edge_lat = min(89.9, abs(latitude) + (ring + 1) * self.cell_degrees)
+                bound_km = ring * self.cell_degrees * KM_PER_DEGREE_LAT * math.cos(math.radians(edge_lat))
+                if best[-1][1] <= bound_km:
+                    return best
+            ring += 1
+        return best
@@ -0,0 +1,151 @@
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from relay import RateBucket
+
+logger = logging.getLogger(__name__)
+
+# Mesh channel indexes relayed to a guild unless it picks others
+DEFAULT_MESH_CHANNELS: tuple = (0,)
+# Relayed mesh messages per minute per guild; bursts up to the same number
+DEFAULT_RELAY_RATE: int = 30
+RELAY_RATE_SECONDS: float = 60.0
+
+def _optional_int(value: Any) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+# Settings for one Discord server sharing the radio. IDs are parsed to ints
+# once here, so call sites look channels and roles up directly. Each guild has
+# its own relay rate bucket, so a busy mesh channel cannot starve the others.
+# bridge_channels maps Discord channels whose messages go to the mesh to the
+# mesh channel index they are sent on.
+class GuildConfig:
+    def __init__(self, guild_id: int, relay_channel_id: Optional[int] = None, node_channel_id: Optional[int] = None,
+                 admin_role_id: Optional[int] = None, node_owner_role_id: Optional[int] = None,
+                 mesh_channels: Iterable[int] = DEFAULT_MESH_CHANNELS, relay_rate: int = DEFAULT_RELAY_RATE,
+                 bridge_channels: Optional[Dict[Any, int]] = None):
+        self.guild_id = int(guild_id)
+        self.relay_channel_id = _optional_int(relay_channel_id)
+        self.node_channel_id = _optional_int(node_channel_id)
+        self.admin_role_id = _optional_int(admin_role_id)
+        self.node_owner_role_id = _optional_int(node_owner_role_id)
+        self.mesh_channels = sorted({int(index) for index in mesh_channels})
+        self.relay_rate = int(relay_rate)
+        self.relay_bucket = RateBucket(self.relay_rate, RELAY_RATE_SECONDS)
+        self.bridge_channels = {int(channel_id): int(index) for channel_id, index in (bridge_channels or {}).items()}
+
+    @classmethod
+    def from_dict(cls, guild_id: int, entry: Dict[str, Any]) -> "GuildConfig":
+        return cls(
+            guild_id,
+            relay_channel_id=entry.get("relay_channel_id"),
+            node_channel_id=entry.get("node_channel_id"),
+            admin_role_id=entry.get("admin_role_id"),
+            node_owner_role_id=entry.get("node_owner_role_id"),
+            mesh_channels=entry.get("mesh_channels", DEFAULT_MESH_CHANNELS),
+            relay_rate=entry.get("relay_rate", DEFAULT_RELAY_RATE),
+            bridge_channels=entry.get("bridge_channels")
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relay_channel_id": self.relay_channel_id,
+            "node_channel_id": self.node_channel_id,
+            "admin_role_id": self.admin_role_id,
+            "node_owner_role_id": self.node_owner_role_id,
+            "mesh_channels": self.mesh_channels,
+            "relay_rate": self.relay_rate,
+            "bridge_channels": {str(channel_id): index for channel_id, index in self.bridge_channels.items()}
+        }
+
+# Per-guild config store backed by a JSON file, plus a routing table from mesh
+# channel index to the guilds relaying it. The primary guild comes from the
+# environment and always exists; saved settings for it take precedence.
+class GuildRegistry:
+    def __init__(self, path: str, primary: GuildConfig):
+        self.path = path
+        self.primary_id = primary.guild_id
+        self.guilds: Dict[int, GuildConfig] = {primary.guild_id: primary}
+        # {mesh channel index: [guild configs with a relay channel]}
+        self.routes: Dict[int, List[GuildConfig]] = {}
+        # {Discord channel ID: (guild config, mesh channel index)} for bridged channels
+        self.bridges: Dict[int, Tuple[GuildConfig, int]] = {}
+        self._rebuild_routes()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.info(f"No usable {self.path}; using the guild from the environment only")
+            return
+        for guild_id, entry in entries.items():
+            self.guilds[int(guild_id)] = GuildConfig.from_dict(int(guild_id), entry)
+        self._rebuild_routes()
+
+    def save(self) -> None:
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({str(guild_id): config.to_dict() for guild_id, config in self.guilds.items()}, f, indent=4)
+        except IOError as e:
+            logger.error(f"Failed to save guild config to {self.path}: {e}")
+
+    def _rebuild_routes(self) -> None:
+        routes: Dict[int, List[GuildConfig]] = {}
+        bridges: Dict[int, Tuple[GuildConfig, int]] = {}
+        for config in self.guilds.values():
+            for channel_id, index in config.bridge_channels.items():
+                bridges[channel_id] = (config, index)
+            if config.relay_channel_id is None:
+                continue
+            for index in config.mesh_channels:
+                routes.setdefault(index, []).append(config)
+        self.routes = routes
+        self.bridges = bridges
+
+    @property
+    def primary(self) -> GuildConfig:
+        return self.guilds[self.primary_id]
+
+    def __iter__(self) -> Iterator[GuildConfig]:
+        return iter(list(self.guilds.values()))
+
+    def __len__(self) -> int:
+        return len(self.guilds)
+
+    def get(self, guild_id: Optional[int]) -> Optional[GuildConfig]:
+        return self.guilds.get(guild_id) if guild_id is not None else None
+
+    # The guild a guild-less record (DM claim, legacy alert) belongs to
+    def get_or_primary(self, guild_id: Optional[int]) -> GuildConfig:
+        return self.guilds.get(guild_id) or self.primary
+
+    def relay_targets(self, channel_index: int) -> List[GuildConfig]:
+        return self.routes.get(channel_index, [])
+
+    def bridge_target(self, channel_id: int) -> Optional[Tuple[GuildConfig, int]]:
+        return self.bridges.get(channel_id)
+
+    # Add a guild (no channels yet) or replace fields of an existing one. Fields
+    # passed as None keep their value; the fields named in `clear` are unset.
+    def update(self, guild_id: int, clear: Iterable[str] = (), **fields: Any) -> GuildConfig:
+        current = self.guilds.get(guild_id)
+        entry = current.to_dict() if current else {}
+        entry.update({key: value for key, value in fields.items() if value is not None})
+        entry.update({key: None for key in clear})
+        config = GuildConfig.from_dict(guild_id, entry)
+        if current is not None and config.relay_rate == current.relay_rate:
+            config.relay_bucket = current.relay_bucket
+        self.guilds[guild_id] = config
+        self._rebuild_routes()
+        self.save()
+        return config
+
+    def remove(self, guild_id: int) -> bool:
+        if guild_id == self.primary_id or guild_id not in self.guilds:
+            return False
+        del self.guilds[guild_id]
+        self._rebuild_routes()
+        self.save()
+        return True
@@ -0,0 +1,87 @@
+import copy
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+LOG_FORMAT_TEXT: str = "text"
+LOG_FORMAT_JSON: str = "json"
+TEXT_FORMAT: str = '%(asctime)s %(levelname)s: %(message)s'
+
+# One JSON object per line, for log shippers
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+# Parse a level name such as "debug" or "WARNING"
+def parse_log_level(level: str) -> int:
+    value = logging.getLevelName(level.strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level {level!r}")
+    return value
+
+# Parse "meshtastic=WARNING,discord=INFO" into {logger_name: level}
+def parse_log_levels(spec: Optional[str]) -> Dict[str, int]:
+    levels: Dict[str, int] = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        if not name.strip() or not level.strip():
+            continue
+        try:
+            levels[name.strip()] = parse_log_level(level)
+        except ValueError:
+            raise ValueError(f"Unknown log level {level!r} for logger {name.strip()!r}") from None
+    return levels
+
+# QueueHandler.prepare() bakes the traceback into the message and drops
+# exc_info, which suits queues to other processes. This queue stays in the
+# process, so records keep exc_info and the listener's formatter (e.g. the
+# JSON "exception" field) renders it, off the calling thread.
+class _LocalQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Route every log record through an in-memory queue. Callers (including
+# coroutines on the event loop) only pay for an enqueue; a background
+# listener thread owns the file and console handlers, so slow disks and
+# rollover renames never block the caller. Returns the started listener;
+# stop it on shutdown to flush the queue.
+def configure_logging(log_file: str, log_format: str = LOG_FORMAT_TEXT, level: int = logging.INFO,
+                      levels: Optional[Dict[str, int]] = None, max_bytes: int = 10_000_000,
+                      backup_count: int = 5) -> QueueListener:
+    formatter = JsonFormatter() if log_format == LOG_FORMAT_JSON else logging.Formatter(TEXT_FORMAT)
+    handlers = [RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_LocalQueueHandler(log_queue))
+    root.setLevel(level)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+# Attach another handler (e.g. the Discord admin channel) to a running listener
+def add_listener_handler(listener: QueueListener, handler: logging.Handler) -> None:
+    listener.handlers = listener.handlers + (handler,)
+
+def remove_listener_handler(listener: QueueListener, handler: logging.Handler) -> None:
+    listener.handlers = tuple(existing for existing in listener.handlers if existing is not handler)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Deque, Optional
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SECONDS: float = 0.25
+DEFAULT_THRESHOLD_SECONDS: float = 0.5
+# At most one stall report per this many seconds; the rest are counted
+REPORT_INTERVAL_SECONDS: float = 300.0
+LAG_SAMPLES: int = 2400  # 10 minutes of heartbeats
+MAX_STACK_FRAMES: int = 20
+MAX_REPORT_LENGTH: int = 3500  # Fits a Discord embed description
+
+# Measures event-loop scheduling lag with a heartbeat coroutine and catches
+# the code responsible for stalls with a sampling thread: when the heartbeat
+# is overdue by more than the threshold, the loop thread is still inside the
+# blocking callback, so its current stack points straight at the culprit.
+# Reports go through `report` (called on the sampling thread) at most once
+# per REPORT_INTERVAL_SECONDS.
+class LoopWatchdog:
+    def __init__(self, report: Callable[[str], None], threshold: float = DEFAULT_THRESHOLD_SECONDS,
+                 lag_histogram: Optional[Histogram] = None, stall_counter: Optional[Counter] = None):
+        self.report = report
+        self.threshold = threshold
+        self.lag_histogram = lag_histogram
+        self.stall_counter = stall_counter
+        self.lags: Deque[float] = deque(maxlen=LAG_SAMPLES)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.suppressed = 0
+        self._last_beat = time.monotonic()
+        self._last_report = -REPORT_INTERVAL_SECONDS
+        self._captured_beat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+
+    # Turn on asyncio's own slow-callback logging ("Executing <Handle> took ...")
+    @staticmethod
+    def enable_slow_callback_logging(loop: asyncio.AbstractEventLoop, threshold: float) -> None:
+        loop.slow_callback_duration = threshold
+        loop.set_debug(True)
+
+    async def run(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        sampler = threading.Thread(target=self._sample, name="loop-watchdog", daemon=True)
+        sampler.start()
+        try:
+            while True:
+                expected = time.monotonic() + HEARTBEAT_SECONDS
+                await asyncio.sleep(HEARTBEAT_SECONDS)
+                now = time.monotonic()
+                lag = max(0.0, now - expected)
+                self._last_beat = now
+                self.lags.append(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if self.lag_histogram is not None:
+                    self.lag_histogram.observe(lag)
+        finally:
+            self._stop.set()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._last_beat
+            overdue = time.monotonic() - beat - HEARTBEAT_SECONDS
+            if overdue < self.threshold or self._captured_beat == beat:
+                continue
+            self._captured_beat = beat  # One capture per stall
+            self.stalls += 1
+            if self.stall_counter is not None:
+                self.stall_counter.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=MAX_STACK_FRAMES)) if frame else "(stack unavailable)\n"
+            now = time.monotonic()
+            if now - self._last_report < REPORT_INTERVAL_SECONDS:
+                self.suppressed += 1
+                continue
+            self._last_report = now
+            suppressed = f" ({self.suppressed} more stalls since the last report)" if self.suppressed else ""
+            self.suppressed = 0
+            header = f"Event loop blocked for over {overdue:.2f}s{suppressed}. Blocking stack:\n"
+            try:
+                self.report(header + stack[-(MAX_REPORT_LENGTH - len(header)):])
+            except Exception as e:
+                logger.error(f"Failed to report event loop stall: {e}")
@@ -0,0 +1,93 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from relay import RateBucket
+
+logger = logging.getLogger(__name__)
+
+COMMAND_PREFIX: str = "!"
+# Commands per minute one node may send; extra ones get no reply
+NODE_RATE: int = 4
+NODE_RATE_SECONDS: float = 60.0
+MAX_CACHED_REPLIES: int = 256
+# Rate buckets of nodes quiet for this long are dropped
+BUCKET_IDLE_SECONDS: float = 3600.0
+
+OUTCOME_REPLIED: str = "replied"
+OUTCOME_CACHED: str = "cached"
+OUTCOME_RATE_LIMITED: str = "rate_limited"
+OUTCOME_UNKNOWN: str = "unknown"
+
+# handler(node_id, args) -> reply text
+MeshCommandHandler = Callable[[str, str], str]
+
+# One registered command. Replies of commands with cache_seconds > 0 are reused
+# for the same arguments, whichever node asks.
+class MeshCommand:
+    def __init__(self, name: str, handler: MeshCommandHandler, usage: str, cache_seconds: float = 0.0):
+        self.name = name
+        self.handler = handler
+        self.usage = usage
+        self.cache_seconds = cache_seconds
+
+# Routes "!name args" texts from mesh nodes to handlers. Lookup is a single
+# dict access on the first word; each node has its own rate bucket, checked
+# before any work is done, and cached replies skip the handler entirely.
+class MeshCommandDispatcher:
+    def __init__(self, node_rate: int = NODE_RATE, max_cached: int = MAX_CACHED_REPLIES):
+        self.node_rate = node_rate
+        self.max_cached = max_cached
+        self.commands: Dict[str, MeshCommand] = {}
+        self.node_buckets: Dict[str, RateBucket] = {}
+        # {(command, args): (expires at, reply)}, least recently stored first
+        self.cache: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self.last_pruned = time.monotonic()
+
+    def register(self, name: str, handler: MeshCommandHandler, usage: str = "", cache_seconds: float = 0.0) -> None:
+        self.commands[name.lower()] = MeshCommand(name.lower(), handler, usage or f"{COMMAND_PREFIX}{name}", cache_seconds)
+
+    def usage(self) -> List[str]:
+        return [command.usage for command in self.commands.values()]
+
+    @staticmethod
+    def is_command(text: str) -> bool:
+        return text.startswith(COMMAND_PREFIX) and len(text) > len(COMMAND_PREFIX)
+
+    # Reply for a command text from `node_id` as (outcome, reply). The reply is
+    # None when the node is over its rate, so floods cost no airtime.
+    def dispatch(self, node_id: str, text: str, now: Optional[float] = None) -> Tuple[str, Optional[str]]:
+        now = time.monotonic() if now is None else now
+        self._prune_buckets(now)
+        bucket = self.node_buckets.get(node_id)
+        if bucket is None:
+            bucket = self.node_buckets[node_id] = RateBucket(self.node_rate, NODE_RATE_SECONDS)
+        if bucket.delay(now) > 0:
+            return OUTCOME_RATE_LIMITED, None
+        bucket.reserve(now)
+        name, _, args = text[len(COMMAND_PREFIX):].strip().partition(" ")
+        command = self.commands.get(name.lower())
+        if command is None:
+            return OUTCOME_UNKNOWN, f"Unknown command {COMMAND_PREFIX}{name}. Send {COMMAND_PREFIX}help for the list."
+        args = " ".join(args.split())
+        key = (command.name, args.lower())
+        if command.cache_seconds > 0:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] > now:
+                return OUTCOME_CACHED, cached[1]
+        reply = command.handler(node_id, args)
+        if command.cache_seconds > 0:
+            self.cache.pop(key, None)
+            self.cache[key] = (now + command.cache_seconds, reply)
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+        return OUTCOME_REPLIED, reply
+
+    def _prune_buckets(self, now: float) -> None:
+        if now - self.last_pruned < BUCKET_IDLE_SECONDS:
+            return
+        self.last_pruned = now
+        # A bucket whose theoretical arrival is this far in the past is back to a full burst
+        self.node_buckets = {node_id: bucket for node_id, bucket in self.node_buckets.items()
+                             if bucket.theoretical_arrival > now - BUCKET_IDLE_SECONDS}
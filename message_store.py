@@ -0,0 +1,423 @@
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+# Columnar, append-mostly message log. Instead of one dict per message it keeps
+# parallel columns: float timestamps, indexes into a table of interned node IDs,
+# and UTF-8 text packed into a single buffer addressed by offsets. Messages are
+# evicted from the front by advancing a head pointer; the columns are compacted
+# once half of the storage is dead.
+class MessageStore:
+    def __init__(self, records: Optional[Iterable[Dict[str, Any]]] = None):
+        self._timestamps = array("d")
+        self._node_refs = array("I")
+        self._text = bytearray()
+        self._text_offsets = array("Q", [0])  # One more entry than messages
+        self._node_table: List[str] = []
+        self._node_lookup: Dict[str, int] = {}
+        self._head = 0
+        if records:
+            self.extend(records)
+
+    # Sequence-like API used by the bot (len, indexing, slicing, iteration)
+
+    def __len__(self) -> int:
+        return len(self._timestamps) - self._head
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(len(self)))]
+        return self._record(self._position(index))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self._record(i)
+
+    def _position(self, index: int) -> int:
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("message index out of range")
+        return index
+
+    def _record(self, index: int) -> Dict[str, Any]:
+        return {"node_id": self.node_id_at(index), "timestamp": self.timestamp_at(index), "message": self.text_at(index)}
+
+    # Column accessors (logical index, no dict allocation)
+
+    def timestamp_at(self, index: int) -> float:
+        return self._timestamps[self._head + index]
+
+    def node_id_at(self, index: int) -> str:
+        return self._node_table[self._node_refs[self._head + index]]
+
+    def text_at(self, index: int) -> str:
+        position = self._head + index
+        return self._text[self._text_offsets[position]:self._text_offsets[position + 1]].decode("utf-8")
+
+    def append(self, record: Dict[str, Any]) -> None:
+        node_id = str(record.get("node_id", "Unknown"))
+        node_ref = self._node_lookup.get(node_id)
+        if node_ref is None:
+            node_ref = len(self._node_table)
+            self._node_table.append(sys.intern(node_id))
+            self._node_lookup[node_id] = node_ref
+        self._timestamps.append(float(record.get("timestamp", 0.0)))
+        self._node_refs.append(node_ref)
+        self._text += str(record.get("message", "")).encode("utf-8")
+        self._text_offsets.append(len(self._text))
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.append(record)
+
+    def pop(self, index: int = -1) -> Dict[str, Any]:
+        if index not in (0, -len(self)):
+            raise ValueError("MessageStore only supports evicting the oldest message")
+        record = self[0]
+        self.evict(1)
+        return record
+
+    def evict(self, count: int) -> None:
+        self._head += max(0, min(count, len(self)))
+        if self._head and self._head * 2 >= len(self._timestamps):
+            self._compact()
+
+    def _compact(self) -> None:
+        head = self._head
+        text_start = self._text_offsets[head]
+        del self._timestamps[:head]
+        del self._node_refs[:head]
+        del self._text[:text_start]
+        self._text_offsets = array("Q", (offset - text_start for offset in self._text_offsets[head:]))
+        self._head = 0
+
+    # Query helpers
+
+    def first_index_at_or_after(self, timestamp: float) -> int:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Newest matching messages first, scanning the node column backwards
+    def latest_for_nodes(self, node_ids: Set[str], count: int) -> List[int]:
+        refs = {self._node_lookup[node_id] for node_id in node_ids if node_id in self._node_lookup}
+        found: List[int] = []
+        position = len(self._timestamps) - 1
+        while position >= self._head and len(found) < count and refs:
+            if self._node_refs[position] in refs:
+                found.append(position - self._head)
+            position -= 1
+        return found
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+# Write a sparse (seq, offset) checkpoint every this many lines
+CHECKPOINT_INTERVAL: int = 1000
+
+# Append-only JSON-lines message log with an offset index.
+# Sequence numbers are global line numbers (lines dropped from the front by
+# compaction keep counting) and offsets are logical: physical file offset plus
+# every byte ever dropped. A small sidecar file (<log>.idx) records the first
+# sequence number, the dropped byte count and a checkpoint every
+# CHECKPOINT_INTERVAL lines, so opening the log only has to read the lines
+# written since the last checkpoint, never the whole file. A dense offset
+# array is filled in as the log is scanned forward (e.g. by the search index
+# builder) and by appends, giving O(1) random access to any line.
+class MessageLog:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.max_bytes = max_bytes
+        self.first_seq = 0
+        self.next_seq = 0
+        self.dropped_bytes = 0
+        self.checkpoints: List[Tuple[int, int]] = []
+        self.offsets = array("Q")  # Logical offsets of lines first_seq, first_seq + 1, ...
+        self._size = 0
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def end_offset(self) -> int:
+        return self.dropped_bytes + self._size
+
+    def open(self) -> None:
+        with self._lock:
+            if not os.path.exists(self.path):
+                open(self.path, "ab").close()
+            self._size = os.path.getsize(self.path)
+            if not self._load_index():
+                self._rebuild_index()
+            self._file = open(self.path, "ab")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _load_index(self) -> bool:
+        try:
+            with open(self.index_path, "r") as f:
+                header = f.readline().split()
+                self.first_seq, self.dropped_bytes = int(header[0]), int(header[1])
+                self.checkpoints = [(int(seq), int(offset)) for seq, offset in (line.split() for line in f if line.strip())]
+        except (FileNotFoundError, ValueError, IndexError):
+            return False
+        if not self.checkpoints or self.checkpoints[0] != (self.first_seq, self.dropped_bytes):
+            return False
+        last_seq, last_offset = self.checkpoints[-1]
+        if last_offset > self.end_offset:
+            return False
+        # Count the lines written after the last checkpoint (at most a few thousand)
+        self.next_seq = last_seq
+        self._scan_tail(last_offset)
+        return True
+
+    def _rebuild_index(self) -> None:
+        self.first_seq = 0
+        self.next_seq = 0
+        self.dropped_bytes = 0
+        self.checkpoints = [(0, 0)]
+        self._scan_tail(0)
+        self._write_index()
+
+    # Walk lines from a logical offset to EOF, advancing next_seq and adding missing checkpoints
+    def _scan_tail(self, offset: int) -> None:
+        new_checkpoints = []
+        with open(self.path, "rb") as f:
+            f.seek(offset - self.dropped_bytes)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn final write; it is overwritten by the next append
+                if self.next_seq % CHECKPOINT_INTERVAL == 0 and self.next_seq > self.checkpoints[-1][0]:
+                    new_checkpoints.append((self.next_seq, offset))
+                offset += len(line)
+                self.next_seq += 1
+        if offset - self.dropped_bytes < self._size:
+            with open(self.path, "r+b") as f:
+                f.truncate(offset - self.dropped_bytes)
+            self._size = offset - self.dropped_bytes
+        if new_checkpoints:
+            self.checkpoints.extend(new_checkpoints)
+            self._write_index()
+
+    def _write_index(self) -> None:
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(f"{self.first_seq} {self.dropped_bytes}\n")
+            f.writelines(f"{seq} {offset}\n" for seq, offset in self.checkpoints)
+        os.replace(temp_path, self.index_path)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        return self.append_many([record])
+
+    # Append records; returns the sequence number of the first one. Raises
+    # OSError, leaving the log unchanged, when the file is not open or the write fails.
+    def append_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        with self._lock:
+            if self._file is None:
+                raise OSError(f"{self.path} is not open")
+            first = seq = self.next_seq
+            new_checkpoints = []
+            new_offsets = []
+            chunks = []
+            offset = self.end_offset
+            for record in records:
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                if seq % CHECKPOINT_INTERVAL == 0:
+                    new_checkpoints.append((seq, offset))
+                new_offsets.append(offset)
+                chunks.append(line)
+                offset += len(line)
+                seq += 1
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+            if self.first_seq + len(self.offsets) == first:
+                self.offsets.extend(new_offsets)
+            self.next_seq = seq
+            self._size = offset - self.dropped_bytes
+            if new_checkpoints:
+                self.checkpoints.extend(new_checkpoints)
+                with open(self.index_path, "a") as f:
+                    f.writelines(f"{seq} {checkpoint_offset}\n" for seq, checkpoint_offset in new_checkpoints)
+            return first
+
+    # Logical offset of a line; O(1) once the dense offsets cover it, else seek from a checkpoint
+    def offset_of(self, seq: int) -> int:
+        with self._lock:
+            if not self.first_seq <= seq <= self.next_seq:
+                raise IndexError(f"message {seq} is not in the log")
+            if seq == self.next_seq:
+                return self.end_offset
+            if seq < self.first_seq + len(self.offsets):
+                return self.offsets[seq - self.first_seq]
+            position = bisect_right(self.checkpoints, (seq, float("inf"))) - 1
+            checkpoint_seq, offset = self.checkpoints[position]
+            with open(self.path, "rb") as f:
+                f.seek(offset - self.dropped_bytes)
+                for _ in range(seq - checkpoint_seq):
+                    offset += len(f.readline())
+            return offset
+
+    def read(self, seq: int) -> Optional[Dict[str, Any]]:
+        rows = self.read_forward(seq, 1)
+        return rows[0][1] if rows and rows[0][0] == seq else None
+
+    # Read up to max_lines records starting at seq (clamped to the oldest retained line)
+    def read_forward(self, seq: int, max_lines: int) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            seq = max(seq, self.first_seq)
+            if seq >= self.next_seq:
+                return []
+            offset = self.offset_of(seq)
+            rows = []
+            with open(self.path, "rb") as f:
+                f.seek(offset - self.dropped_bytes)
+                while len(rows) < max_lines and seq < self.next_seq:
+                    line = f.readline()
+                    if self.first_seq + len(self.offsets) == seq:
+                        self.offsets.append(offset)
+                    rows.append((seq, json.loads(line)))
+                    offset += len(line)
+                    seq += 1
+            return rows
+
+    # Walk backwards from just before `before_seq`, newest first. Stops after `count`
+    # matches, after `max_lines` lines, or at the first record where `stop` is true.
+    def scan_backward(self, before_seq: int, predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                      count: Optional[int] = None, stop: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                      max_lines: Optional[int] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        # Only locate the starting point under the lock. Lines below before_seq never
+        # change, and if a compaction swaps the file mid-scan this handle keeps
+        # reading the old one, so the scan itself does not hold up appends.
+        with self._lock:
+            before_seq = min(before_seq, self.next_seq)
+            if before_seq <= self.first_seq or self._size == 0:
+                return []
+            end = self.offset_of(before_seq) - self.dropped_bytes
+            first_seq = self.first_seq
+            f = open(self.path, "rb")
+        seq = before_seq
+        rows = []
+        scanned = 0
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            while end > 0 and seq > first_seq:
+                start = mapped.rfind(b"\n", 0, end - 1) + 1
+                record = json.loads(mapped[start:end])
+                seq -= 1
+                end = start
+                scanned += 1
+                if stop is not None and stop(record):
+                    break
+                if predicate is None or predicate(record):
+                    rows.append((seq, record))
+                    if count is not None and len(rows) >= count:
+                        break
+                if max_lines is not None and scanned >= max_lines:
+                    break
+        return rows
+
+    # Sequence number to start a forward scan from to see every record at or after
+    # `timestamp`: binary search over the checkpoints, reading one record per probe.
+    # Assumes timestamps grow with seq, which holds since records are appended on arrival.
+    def seq_at_time(self, timestamp: float) -> int:
+        with self._lock:
+            candidates = [seq for seq, _ in self.checkpoints if seq >= self.first_seq]
+            low, high = 0, len(candidates)
+            while low < high:
+                middle = (low + high) // 2
+                record = self.read(candidates[middle])
+                if record is not None and record.get("timestamp", 0) < timestamp:
+                    low = middle + 1
+                else:
+                    high = middle
+            return candidates[low - 1] if low > 0 else self.first_seq
+
+    def needs_compaction(self) -> bool:
+        return self._size > self.max_bytes
+
+    # Drop the oldest lines so the file shrinks to ~90% of max_bytes. Runs in a worker
+    # thread; the bulk copy happens without the lock and only the final catch-up and
+    # file swap block appends. Evicted records are passed to on_evict in batches.
+    def compact(self, on_evict: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> int:
+        with self._lock:
+            if not self.needs_compaction():
+                return 0
+            target = self._size - int(self.max_bytes * 0.9)
+            cut_seq = self.first_seq
+            cut = 0
+            snapshot_size = self._size
+        batch: List[Dict[str, Any]] = []
+        with open(self.path, "rb") as source:
+            while cut < target:
+                line = source.readline()
+                if not line:
+                    break
+                cut += len(line)
+                cut_seq += 1
+                if on_evict is not None:
+                    batch.append(json.loads(line))
+                    if len(batch) >= 10_000:
+                        on_evict(batch)
+                        batch = []
+            if batch and on_evict is not None:
+                on_evict(batch)
+            temp_path = self.path + ".compact"
+            with open(temp_path, "wb") as target_file:
+                shutil.copyfileobj(_LimitedReader(source, snapshot_size - cut), target_file)
+                with self._lock:
+                    # Copy whatever was appended during the bulk copy, then swap files
+                    source.seek(snapshot_size)
+                    shutil.copyfileobj(source, target_file)
+                    target_file.flush()
+                    os.fsync(target_file.fileno())
+                    self._file.close()
+                    self._file = None
+                    source.close()
+                    target_file.close()
+                    os.replace(temp_path, self.path)
+                    dropped = cut_seq - self.first_seq
+                    del self.offsets[:dropped]
+                    self.dropped_bytes += cut
+                    self.first_seq = cut_seq
+                    self.checkpoints = [(cut_seq, self.dropped_bytes)] + [c for c in self.checkpoints if c[0] > cut_seq]
+                    self._size = os.path.getsize(self.path)
+                    self._write_index()
+                    self._file = open(self.path, "ab")
+                    return dropped
+
+# File reader that stops after a fixed number of bytes (for copyfileobj)
+class _LimitedReader:
+    def __init__(self, source: BinaryIO, limit: int):
+        self.source = source
+        self.remaining = limit
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.source.read(size)
+        self.remaining -= len(data)
+        return data
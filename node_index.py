@@ -0,0 +1,55 @@
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Values that are unknown sort after every known value
+MISSING: Tuple[int] = (1,)
+
+def present(value: Any) -> Tuple[int, Any]:
+    return (0, value)
+
+# Keeps one pre-sorted list of (key, node_id) per sort order. Updating a node
+# moves it within each list with a binary search, so listing a page never
+# needs to re-sort the whole node set.
+class NodeSortIndex:
+    def __init__(self, sort_keys: List[str]):
+        self.sort_keys = list(sort_keys)
+        self.sorted: Dict[str, List[Tuple[Any, str]]] = {key: [] for key in self.sort_keys}
+        self.keys_by_node: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys_by_node)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.keys_by_node
+
+    def update(self, node_id: str, keys: Dict[str, Any]) -> None:
+        previous = self.keys_by_node.get(node_id, {})
+        for sort_key in self.sort_keys:
+            new_value = keys.get(sort_key, MISSING)
+            if sort_key in previous:
+                if previous[sort_key] == new_value:
+                    continue
+                self._remove_entry(sort_key, previous[sort_key], node_id)
+            insort(self.sorted[sort_key], (new_value, node_id))
+        self.keys_by_node[node_id] = {sort_key: keys.get(sort_key, MISSING) for sort_key in self.sort_keys}
+
+    def remove(self, node_id: str) -> None:
+        previous = self.keys_by_node.pop(node_id, None)
+        if previous:
+            for sort_key, value in previous.items():
+                self._remove_entry(sort_key, value, node_id)
+
+    def _remove_entry(self, sort_key: str, value: Any, node_id: str) -> None:
+        entries = self.sorted[sort_key]
+        position = bisect_left(entries, (value, node_id))
+        if position < len(entries) and entries[position] == (value, node_id):
+            del entries[position]
+
+    def page(self, sort_key: str, page: int, page_size: int) -> List[str]:
+        start = page * page_size
+        return [node_id for _, node_id in self.sorted[sort_key][start:start + page_size]]
+
+    def iter_sorted(self, sort_key: str, predicate: Optional[Callable[[str], bool]] = None) -> Iterator[str]:
+        for _, node_id in self.sorted[sort_key]:
+            if predicate is None or predicate(node_id):
+                yield node_id
@@ -0,0 +1,177 @@
+import secrets
+from bisect import bisect_right
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+RULE_NODE: str = "node"
+RULE_KEYWORD: str = "keyword"
+RULE_BATTERY: str = "battery"
+RULE_TYPES: List[str] = [RULE_NODE, RULE_KEYWORD, RULE_BATTERY]
+
+# Bounds that keep preferences.json small without evicting anyone
+MAX_RULES_PER_USER: int = 25
+MAX_KEYWORD_LENGTH: int = 64
+
+# Multi-pattern substring matcher (Aho-Corasick). Patterns are matched
+# case-insensitively; search() walks the text once and yields every
+# pattern occurring in it, so the cost does not depend on how many patterns
+# were added.
+class KeywordAutomaton:
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Set[str]] = [set()]
+        for pattern in patterns:
+            self._add(pattern.lower())
+        self._link()
+
+    def _add(self, pattern: str) -> None:
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+            state = next_state
+        self.output[state].add(pattern)
+
+    # Breadth-first pass computing failure links and merging outputs along them
+    def _link(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def search(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return found
+
+# Bit h set means hour h (UTC) is inside the window; windows may wrap past midnight
+def hour_mask(start_hour: int, end_hour: int) -> int:
+    mask = 0
+    hour = start_hour % 24
+    while hour != end_hour % 24:
+        mask |= 1 << hour
+        hour = (hour + 1) % 24
+    return mask
+
+def new_rule(rule_type: str, node_id: Optional[str] = None, keyword: Optional[str] = None,
+             threshold: Optional[int] = None) -> Dict[str, Any]:
+    rule: Dict[str, Any] = {"id": secrets.token_hex(3), "type": rule_type}
+    if node_id:
+        rule["node_id"] = node_id
+    if keyword:
+        rule["keyword"] = keyword.lower()
+    if threshold is not None:
+        rule["threshold"] = threshold
+    return rule
+
+def describe_rule(rule: Dict[str, Any]) -> str:
+    if rule["type"] == RULE_NODE:
+        return f"messages from {rule['node_id']}"
+    if rule["type"] == RULE_KEYWORD:
+        scope = f" from {rule['node_id']}" if rule.get("node_id") else ""
+        return f"messages containing \"{rule['keyword']}\"{scope}"
+    return f"battery of {rule['node_id']} below {rule['threshold']}%"
+
+# Per-user notification subscriptions compiled into shared matchers: a hash
+# map from node ID to subscribers, one keyword automaton over every user's
+# keywords, sorted battery thresholds per node and a 24-bit quiet-hours mask
+# per user. Matching a packet touches only the rules it can trigger, never the
+# full user list. compile() must be called after preferences change.
+class NotificationRules:
+    def __init__(self):
+        self.node_subscribers: Dict[str, Set[str]] = {}
+        # {keyword: [(user_id, node_id or None), ...]}
+        self.keyword_subscribers: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+        self.automaton = KeywordAutomaton()
+        # {node_id: ([threshold, ...] ascending, [user_id, ...] in the same order)}
+        self.battery_thresholds: Dict[str, Tuple[List[int], List[str]]] = {}
+        self.quiet_masks: Dict[str, int] = {}
+        # Users with the legacy "notify me about my own nodes" preference
+        self.owner_subscribers: Set[str] = set()
+        self.last_battery: Dict[str, int] = {}
+
+    def compile(self, preferences: Dict[str, Dict[str, Any]]) -> None:
+        node_subscribers: Dict[str, Set[str]] = {}
+        keyword_subscribers: Dict[str, List[Tuple[str, Optional[str]]]] = {}
+        battery_rules: Dict[str, List[Tuple[int, str]]] = {}
+        quiet_masks: Dict[str, int] = {}
+        owner_subscribers: Set[str] = set()
+        for user_id, pref in preferences.items():
+            if not isinstance(pref, dict):
+                continue
+            if pref.get("dm_notifications", False):
+                owner_subscribers.add(user_id)
+            quiet = pref.get("quiet_hours")
+            if quiet:
+                quiet_masks[user_id] = hour_mask(quiet[0], quiet[1])
+            for rule in pref.get("rules", []):
+                if rule["type"] == RULE_NODE:
+                    node_subscribers.setdefault(rule["node_id"], set()).add(user_id)
+                elif rule["type"] == RULE_KEYWORD:
+                    keyword_subscribers.setdefault(rule["keyword"], []).append((user_id, rule.get("node_id")))
+                elif rule["type"] == RULE_BATTERY:
+                    battery_rules.setdefault(rule["node_id"], []).append((rule["threshold"], user_id))
+        self.node_subscribers = node_subscribers
+        self.keyword_subscribers = keyword_subscribers
+        self.automaton = KeywordAutomaton(keyword_subscribers)
+        self.battery_thresholds = {
+            node_id: ([threshold for threshold, _ in sorted(rules)], [user_id for _, user_id in sorted(rules)])
+            for node_id, rules in battery_rules.items()
+        }
+        self.quiet_masks = quiet_masks
+        self.owner_subscribers = owner_subscribers
+
+    def is_quiet(self, user_id: str, hour: int) -> bool:
+        return bool(self.quiet_masks.get(user_id, 0) >> hour & 1)
+
+    def _collect(self, matches: Dict[str, List[str]], user_id: str, reason: str, hour: int) -> None:
+        if not self.is_quiet(user_id, hour):
+            matches.setdefault(user_id, []).append(reason)
+
+    # Users to notify about a text message, with the reasons each one matched
+    def match_message(self, node_id: str, text: str, owner_id: Optional[str], hour: int) -> Dict[str, List[str]]:
+        matches: Dict[str, List[str]] = {}
+        if owner_id in self.owner_subscribers:
+            self._collect(matches, owner_id, "your node", hour)
+        for user_id in self.node_subscribers.get(node_id, ()):
+            self._collect(matches, user_id, f"node {node_id}", hour)
+        if self.keyword_subscribers:
+            for keyword in self.automaton.search(text):
+                for user_id, keyword_node in self.keyword_subscribers[keyword]:
+                    if keyword_node is None or keyword_node == node_id:
+                        self._collect(matches, user_id, f"keyword \"{keyword}\"", hour)
+        return matches
+
+    # Users whose low-battery threshold the node just crossed on the way down
+    def match_battery(self, node_id: str, level: int, hour: int) -> Dict[str, List[str]]:
+        previous = self.last_battery.get(node_id)
+        self.last_battery[node_id] = level
+        matches: Dict[str, List[str]] = {}
+        rules = self.battery_thresholds.get(node_id)
+        if rules is None or previous is None or level >= previous:
+            return matches
+        thresholds, user_ids = rules
+        # Thresholds t with level < t <= previous were crossed by this reading
+        for index in range(bisect_right(thresholds, level), bisect_right(thresholds, previous)):
+            self._collect(matches, user_ids[index], f"battery below {thresholds[index]}%", hour)
+        return matches
@@ -0,0 +1,129 @@
+import json
+import logging
+import math
+import secrets
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Messages to nodes not heard for this long are queued instead of sent
+STALE_AFTER_SECONDS: int = 2 * 3600
+DEFAULT_TTL_SECONDS: int = 24 * 3600
+# Per-node bound; the oldest queued message is dropped to make room
+MAX_MESSAGES_PER_NODE: int = 10
+
+# LoRa parameters of the default LongFast preset, used to estimate airtime
+SPREADING_FACTOR: int = 11
+BANDWIDTH_HZ: int = 250_000
+CODING_RATE: int = 5  # 4/5
+PREAMBLE_SYMBOLS: int = 16
+# Meshtastic header plus protobuf framing around the text payload
+PACKET_OVERHEAD_BYTES: int = 32
+# Fraction of channel time a flush may occupy, and the shortest gap between sends
+DUTY_CYCLE: float = 0.1
+MIN_GAP_SECONDS: float = 2.0
+
+# Time on air of one LoRa packet, from the Semtech SX127x datasheet formula
+def estimate_airtime(payload_bytes: int) -> float:
+    symbol_time = (2 ** SPREADING_FACTOR) / BANDWIDTH_HZ
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    numerator = 8 * payload_bytes - 4 * SPREADING_FACTOR + 28 + 16
+    denominator = 4 * (SPREADING_FACTOR - 2 * low_data_rate)
+    payload_symbols = 8 + max(math.ceil(numerator / denominator) * CODING_RATE, 0)
+    return (PREAMBLE_SYMBOLS + 4.25 + payload_symbols) * symbol_time
+
+# Spaces transmissions so they use at most DUTY_CYCLE of the channel: after
+# a packet with airtime A the next one may go out A / DUTY_CYCLE later.
+# reserve() books the next slot and returns how long the caller must wait.
+class AirtimePacer:
+    def __init__(self, duty_cycle: float = DUTY_CYCLE, min_gap: float = MIN_GAP_SECONDS):
+        self.duty_cycle = duty_cycle
+        self.min_gap = min_gap
+        self.next_slot = 0.0
+
+    def reserve(self, text: str, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        airtime = estimate_airtime(len(text.encode("utf-8")) + PACKET_OVERHEAD_BYTES)
+        start = max(self.next_slot, now)
+        self.next_slot = start + max(airtime / self.duty_cycle, self.min_gap)
+        return start - now
+
+# Persistent per-node queue of direct messages waiting for their destination
+# to come back in range. Entries expire after their TTL and each node holds
+# at most MAX_MESSAGES_PER_NODE of them.
+class Outbox:
+    def __init__(self, path: str, max_per_node: int = MAX_MESSAGES_PER_NODE):
+        self.path = path
+        self.max_per_node = max_per_node
+        # {node_id: [{"id", "text", "channel", "queued_at", "expires_at", "queued_by"}, ...]} oldest first
+        self.queues: Dict[str, List[Dict[str, Any]]] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                self.queues = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.warning(f"Failed to load {self.path}; returning default")
+            self.queues = {}
+
+    def save(self) -> None:
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(self.queues, f)
+        except IOError as e:
+            logger.error(f"Failed to save outbox to {self.path}: {e}")
+
+    def has_messages(self, node_id: str) -> bool:
+        return bool(self.queues.get(node_id))
+
+    # Queue a message; returns the new entry and any entry dropped to stay within the per-node bound
+    def enqueue(self, node_id: str, text: str, channel: int, queued_by: str,
+                ttl: int = DEFAULT_TTL_SECONDS) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        now = time.time()
+        entry = {
+            "id": secrets.token_hex(4),
+            "text": text,
+            "channel": channel,
+            "queued_at": now,
+            "expires_at": now + ttl,
+            "queued_by": queued_by
+        }
+        queue = self.queues.setdefault(node_id, [])
+        queue.append(entry)
+        dropped = queue.pop(0) if len(queue) > self.max_per_node else None
+        self.save()
+        return entry, dropped
+
+    # Remove expired entries; returns how many were dropped
+    def expire(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        dropped = 0
+        for node_id in list(self.queues):
+            queue = self.queues[node_id]
+            kept = [entry for entry in queue if entry["expires_at"] > now]
+            dropped += len(queue) - len(kept)
+            if kept:
+                self.queues[node_id] = kept
+            else:
+                del self.queues[node_id]
+        if dropped:
+            self.save()
+        return dropped
+
+    # The oldest unexpired message for a node, left in the queue until remove()
+    def peek(self, node_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        return next((entry for entry in self.queues.get(node_id, []) if entry["expires_at"] > now), None)
+
+    def remove(self, node_id: str, entry_id: Optional[str] = None) -> int:
+        queue = self.queues.get(node_id, [])
+        kept = [entry for entry in queue if entry_id is not None and entry["id"] != entry_id]
+        removed = len(queue) - len(kept)
+        if kept:
+            self.queues[node_id] = kept
+        else:
+            self.queues.pop(node_id, None)
+        if removed:
+            self.save()
+        return removed
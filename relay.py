@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import re
+import time
+from typing import List, Optional
+
+import aiohttp
+import discord
+
+logger = logging.getLogger(__name__)
+
+RELAY_MODE_CHANNEL: str = "channel"
+RELAY_MODE_WEBHOOK: str = "webhook"
+
+WEBHOOK_NAME: str = "Meshtastic Relay"
+DEFAULT_POOL_SIZE: int = 3
+# Discord allows about 5 requests per 2 seconds on each webhook, and about
+# 30 webhook messages per minute per channel regardless of how many webhooks post
+WEBHOOK_RATE: int = 5
+WEBHOOK_PER_SECONDS: float = 2.0
+CHANNEL_RATE: int = 30
+CHANNEL_PER_SECONDS: float = 60.0
+# Past this much queueing on the channel budget, overflow goes out as the bot instead
+MAX_WEBHOOK_WAIT_SECONDS: float = 2.0
+# Display names must be 1-80 characters and may not contain these words
+MAX_USERNAME_LENGTH: int = 80
+FORBIDDEN_USERNAME_WORDS = re.compile(r"discord|clyde", re.IGNORECASE)
+
+# Rate limiter using the generic cell rate algorithm: `rate` requests per
+# `per_seconds`, allowing bursts up to `rate`. reserve() books the next slot
+# and returns how long the caller must wait for it.
+class RateBucket:
+    def __init__(self, rate: int, per_seconds: float):
+        self.interval = per_seconds / rate
+        self.tolerance = per_seconds - self.interval
+        self.theoretical_arrival = 0.0
+
+    def delay(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, max(self.theoretical_arrival, now) - self.tolerance - now)
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        wait = self.delay(now)
+        self.theoretical_arrival = max(self.theoretical_arrival, now) + self.interval
+        return wait
+
+def webhook_username(long_name: Optional[str], short_name: Optional[str], node_id: str) -> str:
+    name = long_name or node_id
+    if short_name and short_name != long_name:
+        name = f"{name} ({short_name})"
+    name = FORBIDDEN_USERNAME_WORDS.sub(lambda match: match.group(0)[0] + "\u200b" + match.group(0)[1:], name).strip()
+    return (name or node_id)[:MAX_USERNAME_LENGTH]
+
+# Pool of webhooks in the relay channel. Each webhook has its own rate-limit
+# bucket, so posts go to whichever webhook frees up first; all of them share
+# one aiohttp session. The pool is created on first use and send() returns
+# False whenever the caller should fall back to posting as the bot, including
+# when the channel's webhook budget is saturated, so bursts use both buckets.
+class WebhookRelay:
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self.webhooks: List[discord.Webhook] = []
+        self.buckets: List[RateBucket] = []
+        self.channel_bucket = RateBucket(CHANNEL_RATE, CHANNEL_PER_SECONDS)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.channel_id: Optional[int] = None
+        self.disabled_reason: Optional[str] = None
+        self._setup_lock = asyncio.Lock()
+        self.stats = {"webhook": 0, "fallback": 0}
+
+    async def _ensure_pool(self, channel: discord.TextChannel) -> bool:
+        if self.webhooks and self.channel_id == channel.id:
+            return True
+        if self.disabled_reason:
+            return False
+        async with self._setup_lock:
+            if self.webhooks and self.channel_id == channel.id:
+                return True
+            try:
+                if self.session is None or self.session.closed:
+                    self.session = aiohttp.ClientSession()
+                existing = [
+                    webhook for webhook in await channel.webhooks()
+                    if webhook.name == WEBHOOK_NAME and webhook.token and webhook.user and webhook.user.id == channel.guild.me.id
+                ]
+                while len(existing) < self.pool_size:
+                    existing.append(await channel.create_webhook(name=WEBHOOK_NAME, reason="Meshtastic relay pool"))
+                self.webhooks = [
+                    discord.Webhook.from_url(webhook.url, session=self.session) for webhook in existing[:self.pool_size]
+                ]
+                self.buckets = [RateBucket(WEBHOOK_RATE, WEBHOOK_PER_SECONDS) for _ in self.webhooks]
+                self.channel_id = channel.id
+                logger.info(f"Webhook relay ready with {len(self.webhooks)} webhooks in channel {channel.id}")
+                return True
+            except discord.Forbidden:
+                self.disabled_reason = "missing Manage Webhooks permission"
+                logger.error(f"Webhook relay disabled ({self.disabled_reason}); relaying as the bot")
+            except discord.HTTPException as e:
+                logger.error(f"Failed to set up webhook relay: {e}; relaying as the bot for now")
+            return False
+
+    async def send(self, channel: discord.TextChannel, username: str, content: str) -> bool:
+        if not await self._ensure_pool(channel):
+            self.stats["fallback"] += 1
+            return False
+        now = time.monotonic()
+        if self.channel_bucket.delay(now) > MAX_WEBHOOK_WAIT_SECONDS:
+            self.stats["fallback"] += 1
+            return False
+        index = min(range(len(self.webhooks)), key=lambda position: self.buckets[position].delay(now))
+        webhook = self.webhooks[index]
+        wait = max(self.buckets[index].reserve(now), self.channel_bucket.reserve(now))
+        if wait:
+            await asyncio.sleep(wait)
+            # A concurrent send may have found a webhook deleted and emptied the pool meanwhile
+            if webhook not in self.webhooks:
+                self.stats["fallback"] += 1
+                return False
+        try:
+            await webhook.send(
+                content=content[:2000],
+                username=username,
+                allowed_mentions=discord.AllowedMentions.none()
+            )
+            self.stats["webhook"] += 1
+            return True
+        except discord.NotFound:
+            # Someone deleted a webhook; rebuild the pool on the next message
+            logger.warning("Relay webhook was deleted; recreating the pool")
+            self.webhooks = []
+        except discord.HTTPException as e:
+            logger.error(f"Webhook relay send failed: {e}")
+        self.stats["fallback"] += 1
+        return False
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
@@ -0,0 +1,271 @@
+import math
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+# BM25 ranking parameters
+BM25_K1: float = 1.2
+BM25_B: float = 0.75
+
+# Only the newest candidates are ranked for very common terms
+MAX_SCORED_CANDIDATES: int = 20_000
+# A prefix term expands to at most this many vocabulary entries
+MAX_PREFIX_EXPANSIONS: int = 256
+
+# Sender filter pseudo-token; tokenize() never produces a NUL character
+NODE_TOKEN_PREFIX: str = "\0node:"
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+# Parsed search query: plain terms, prefix terms ("wat*") and quoted phrases
+class SearchQuery:
+    def __init__(self, text: str):
+        self.terms: List[str] = []
+        self.prefixes: List[str] = []
+        self.phrases: List[List[str]] = []
+        for phrase, word in QUERY_PATTERN.findall(text):
+            if phrase:
+                tokens = tokenize(phrase)
+                if len(tokens) > 1:
+                    self.phrases.append(tokens)
+                self.terms.extend(tokens)
+            elif word.endswith("*") and tokenize(word):
+                self.prefixes.append(tokenize(word)[0])
+            else:
+                self.terms.extend(tokenize(word))
+
+    def __bool__(self) -> bool:
+        return bool(self.terms or self.prefixes)
+
+# Append-only inverted index over the message log. Documents are identified
+# by a monotonically increasing sequence number; evicted documents are
+# dropped lazily when the stale part of the postings grows large.
+class MessageSearchIndex:
+    def __init__(self, first_seq: int = 0):
+        self.first_seq = first_seq
+        self.next_seq = first_seq
+        # {token: (sequence numbers, term frequencies)}
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.timestamps = array("d")
+        self.lengths = array("H")
+        self._array_offset = first_seq  # Sequence number of timestamps[0]
+        self._total_length = 0
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+
+    def add(self, seq: int, timestamp: float, text: str, node_id: Optional[str] = None) -> None:
+        if seq != self.next_seq:
+            raise ValueError(f"Expected sequence {self.next_seq}, got {seq}")
+        tokens = tokenize(text)
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        if node_id:
+            counts[NODE_TOKEN_PREFIX + node_id] = 1
+        for token, count in counts.items():
+            entry = self.postings.get(token)
+            if entry is None:
+                entry = self.postings[token] = (array("I"), array("B"))
+                self._vocabulary_dirty = True
+            entry[0].append(seq)
+            entry[1].append(min(count, 255))
+        length = min(len(tokens), 65535)
+        self.timestamps.append(timestamp)
+        self.lengths.append(length)
+        self._total_length += length
+        self.next_seq += 1
+
+    def evict_before(self, seq: int) -> None:
+        if seq <= self.first_seq:
+            return
+        if seq >= self.next_seq:
+            # Everything indexed so far is gone; restart empty at the new position
+            self.__init__(seq)
+            return
+        for index in range(self.first_seq - self._array_offset, seq - self._array_offset):
+            self._total_length -= self.lengths[index]
+        self.first_seq = seq
+        # Compact once a quarter of the stored documents are stale
+        if (self.first_seq - self._array_offset) * 4 >= self.next_seq - self._array_offset:
+            self.compact()
+
+    def compact(self) -> None:
+        drop = self.first_seq - self._array_offset
+        if drop <= 0:
+            return
+        del self.timestamps[:drop]
+        del self.lengths[:drop]
+        self._array_offset = self.first_seq
+        for token in list(self.postings):
+            seqs, frequencies = self.postings[token]
+            start = bisect_left(seqs, self.first_seq)
+            if start == len(seqs):
+                del self.postings[token]
+                self._vocabulary_dirty = True
+            elif start:
+                del seqs[:start]
+                del frequencies[:start]
+
+    def _timestamp(self, seq: int) -> float:
+        return self.timestamps[seq - self._array_offset]
+
+    def _seq_range(self, start_time: Optional[float], end_time: Optional[float]) -> Tuple[int, int]:
+        lo_index = self.first_seq - self._array_offset
+        hi_index = len(self.timestamps)
+        if start_time is not None:
+            lo_index = max(lo_index, bisect_left(self.timestamps, start_time, lo_index, hi_index))
+        if end_time is not None:
+            hi_index = bisect_right(self.timestamps, end_time, lo_index, hi_index)
+        return lo_index + self._array_offset, hi_index + self._array_offset
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self.postings)
+            self._vocabulary_dirty = False
+        start = bisect_left(self._vocabulary, prefix)
+        expansions = []
+        for token in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not token.startswith(prefix):
+                break
+            expansions.append(token)
+        return expansions
+
+    # Sequence numbers and frequencies of one term restricted to [lo, hi)
+    def _term_slice(self, token: str, lo: int, hi: int) -> Optional[Tuple[array, array, int, int]]:
+        entry = self.postings.get(token)
+        if entry is None:
+            return None
+        seqs, frequencies = entry
+        start = bisect_left(seqs, lo)
+        end = bisect_left(seqs, hi, start)
+        return (seqs, frequencies, start, end) if start < end else None
+
+    # Narrow [lo, hi) to the span covered by the given senders' messages
+    def _node_seq_bounds(self, node_ids: List[str], lo: int, hi: int) -> Tuple[int, int]:
+        first, last = hi, lo
+        for node_id in node_ids:
+            term_slice = self._term_slice(NODE_TOKEN_PREFIX + node_id, lo, hi)
+            if term_slice:
+                seqs, _, start, end = term_slice
+                first = min(first, seqs[start])
+                last = max(last, seqs[end - 1] + 1)
+        return first, last
+
+    def _document_frequency(self, token: str) -> int:
+        entry = self.postings.get(token)
+        if entry is None:
+            return 0
+        return len(entry[0]) - bisect_left(entry[0], self.first_seq)
+
+    def search(self, query: SearchQuery, start_time: Optional[float] = None, end_time: Optional[float] = None,
+               get_text: Optional[Callable[[int], Optional[str]]] = None,
+               node_ids: Optional[List[str]] = None) -> List[Tuple[int, float]]:
+        if not query or len(self) == 0:
+            return []
+        lo, hi = self._seq_range(start_time, end_time)
+        if lo >= hi:
+            return []
+        if node_ids is not None:
+            lo, hi = self._node_seq_bounds(node_ids, lo, hi)
+            if lo >= hi:
+                return []
+        terms: List[Tuple[str, array, array, int, int]] = []
+        for token in dict.fromkeys(query.terms):
+            term_slice = self._term_slice(token, lo, hi)
+            if term_slice is None:
+                return []
+            terms.append((token,) + term_slice)
+        terms.sort(key=lambda term: term[4] - term[3])
+        # Prefix terms match any expansion: {seq: [(token, frequency), ...]}
+        prefix_clauses: List[Dict[int, List[Tuple[str, int]]]] = []
+        for prefix in query.prefixes:
+            clause: Dict[int, List[Tuple[str, int]]] = {}
+            for token in self._expand_prefix(prefix):
+                term_slice = self._term_slice(token, lo, hi)
+                if term_slice:
+                    seqs, frequencies, start, end = term_slice
+                    for seq, frequency in zip(seqs[start:end], frequencies[start:end]):
+                        clause.setdefault(seq, []).append((token, frequency))
+            if not clause:
+                return []
+            prefix_clauses.append(clause)
+        if node_ids is not None:
+            # Sender filter: matches any of the nodes and contributes nothing to the score
+            clause = {}
+            for node_id in node_ids:
+                term_slice = self._term_slice(NODE_TOKEN_PREFIX + node_id, lo, hi)
+                if term_slice:
+                    seqs, _, start, end = term_slice
+                    clause.update((seq, []) for seq in seqs[start:end])
+            if not clause:
+                return []
+            prefix_clauses.append(clause)
+        prefix_clauses.sort(key=len)
+        # Drive from the rarest clause, newest first, probing the others by binary search
+        if terms and (not prefix_clauses or terms[0][4] - terms[0][3] <= len(prefix_clauses[0])):
+            _, driver_seqs, _, driver_start, driver_end = terms[0]
+            driver = (driver_seqs[index] for index in range(driver_end - 1, driver_start - 1, -1))
+        else:
+            driver = iter(sorted(prefix_clauses[0], reverse=True))
+        matches: List[Tuple[int, List[Tuple[str, int]]]] = []
+        for seq in driver:
+            matched: List[Tuple[str, int]] = []
+            for token, term_seqs, term_frequencies, term_start, term_end in terms:
+                position = bisect_left(term_seqs, seq, term_start, term_end)
+                if position == term_end or term_seqs[position] != seq:
+                    break
+                matched.append((token, term_frequencies[position]))
+            else:
+                if all(seq in clause for clause in prefix_clauses):
+                    for clause in prefix_clauses:
+                        matched.extend(clause[seq])
+                    if query.phrases and get_text is not None and not self._contains_phrases(get_text(seq), query.phrases):
+                        continue
+                    matches.append((seq, matched))
+                    if len(matches) >= MAX_SCORED_CANDIDATES:
+                        break
+        return self._rank(matches)
+
+    @staticmethod
+    def _contains_phrases(text: Optional[str], phrases: List[List[str]]) -> bool:
+        if text is None:
+            return False
+        tokens = tokenize(text)
+        for phrase in phrases:
+            width = len(phrase)
+            if not any(tokens[index:index + width] == phrase for index in range(len(tokens) - width + 1)):
+                return False
+        return True
+
+    def _rank(self, matches: List[Tuple[int, List[Tuple[str, int]]]]) -> List[Tuple[int, float]]:
+        document_count = len(self)
+        average_length = (self._total_length / document_count) or 1.0
+        idf_cache: Dict[str, float] = {}
+        results = []
+        for seq, matched in matches:
+            length = self.lengths[seq - self._array_offset]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+            score = 0.0
+            for token, frequency in matched:
+                idf = idf_cache.get(token)
+                if idf is None:
+                    df = self._document_frequency(token)
+                    idf = idf_cache[token] = math.log(1 + (document_count - df + 0.5) / (df + 0.5))
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            results.append((seq, score))
+        # Highest score first; newer messages win ties
+        results.sort(key=lambda item: (item[1], item[0]), reverse=True)
+        return results
+
+    def timestamp_of(self, seq: int) -> Optional[float]:
+        if self.first_seq <= seq < self.next_seq:
+            return self._timestamp(seq)
+        return None
@@ -0,0 +1,256 @@
+import argparse
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from message_store import MessageLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR: str = "snapshots"
+CHAIN_PREFIX: str = "state-"
+CHAIN_SUFFIX: str = ".snap.gz"
+# Snapshots per chain file, counting the full snapshot that starts it
+SNAPSHOTS_PER_CHAIN: int = 24
+CHAINS_TO_KEEP: int = 2
+MESSAGE_BATCH_LINES: int = 2000
+
+# Copy the containers of `value` down to `depth` levels and share everything
+# below. Used inside the capture critical section: the bot replaces or appends
+# those deeper objects but never mutates them, so sharing them is safe and
+# keeps the copy proportional to the number of keys, not the size of the state.
+# depth=None copies everything.
+def copy_to_depth(value: Any, depth: Optional[int]) -> Any:
+    if depth is None:
+        return copy.deepcopy(value)
+    if depth <= 0:
+        return value
+    if isinstance(value, dict):
+        return {key: copy_to_depth(item, depth - 1) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_to_depth(item, depth - 1) for item in value]
+    return value
+
+# Split a store into (path, value) entries, descending into dicts up to `depth`
+# levels. Deltas are computed per entry, so depth sets the delta granularity.
+def flatten(value: Any, depth: int, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    if depth <= 0 or not isinstance(value, dict) or not value:
+        yield path, value
+        return
+    for key, item in value.items():
+        yield from flatten(item, depth - 1, path + (str(key),))
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+# Writes full and incremental snapshots of the bot's stores. A chain is one
+# gzip file: a full snapshot followed by deltas, each appended as its own gzip
+# member so a crash mid-write only loses the snapshot being written. Each
+# snapshot is JSONL: a header, store entry sets/deletes, new message log
+# records, and an end marker that restore uses to skip torn snapshots.
+class SnapshotWriter:
+    def __init__(self, directory: str = DEFAULT_SNAPSHOT_DIR, snapshots_per_chain: int = SNAPSHOTS_PER_CHAIN,
+                 chains_to_keep: int = CHAINS_TO_KEEP):
+        self.directory = directory
+        self.snapshots_per_chain = snapshots_per_chain
+        self.chains_to_keep = chains_to_keep
+        self.chain_path: Optional[str] = None
+        self.chain_length = 0
+        self.next_id = 1
+        # {(store, path): digest of the entry's JSON} as of the last snapshot
+        self.digests: Dict[Tuple[str, Tuple[str, ...]], bytes] = {}
+        self.message_seq = 0
+        self.last_snapshot: Optional[Dict[str, Any]] = None
+
+    # Serialize a captured state. `stores` maps store name to
+    # {"file": path, "depth": delta depth, "value": captured copy}; messages in
+    # `log` up to end_seq (the log's next_seq at capture time) are included.
+    # Runs in a worker thread; returns the header of the written snapshot.
+    def write(self, stores: Dict[str, Dict[str, Any]], log: MessageLog, messages_file: str, end_seq: int) -> Dict[str, Any]:
+        full = self.chain_path is None or self.chain_length >= self.snapshots_per_chain
+        created = time.time()
+        if full:
+            os.makedirs(self.directory, exist_ok=True)
+            self.chain_path = os.path.join(self.directory, f"{CHAIN_PREFIX}{int(created * 1000)}{CHAIN_SUFFIX}")
+            self.chain_length = 0
+            self.digests = {}
+            self.message_seq = log.first_seq
+        lines: List[str] = []
+        digests: Dict[Tuple[str, Tuple[str, ...]], bytes] = {}
+        changed = 0
+        for name, store in stores.items():
+            entries = []
+            for path, value in flatten(store["value"], store["depth"]):
+                text = json.dumps(value, sort_keys=True)
+                key = (name, path)
+                digests[key] = _digest(text)
+                if full or self.digests.get(key) != digests[key]:
+                    entries.append((path, text))
+            removed = [] if full else [path for store_name, path in self.digests if store_name == name and (name, path) not in digests]
+            # Deletes go first: a container that turned into keyed entries (or back) is removed, then rebuilt
+            lines.extend(json.dumps({"type": "delete", "store": name, "path": list(path)}) for path in removed)
+            lines.extend(f'{{"type": "set", "store": {json.dumps(name)}, "path": {json.dumps(list(path))}, "value": {text}}}' for path, text in entries)
+            changed += len(entries) + len(removed)
+        header = {
+            "type": "header",
+            "id": self.next_id,
+            "kind": "full" if full else "delta",
+            "created": created,
+            "files": {name: store["file"] for name, store in stores.items()},
+            "messages_file": messages_file,
+            "message_range": [max(self.message_seq, log.first_seq), end_seq],
+            "entries": changed
+        }
+        with gzip.open(self.chain_path, "ab") as out:
+            out.write((json.dumps(header) + "\n").encode("utf-8"))
+            if lines:
+                out.write(("\n".join(lines) + "\n").encode("utf-8"))
+            seq = header["message_range"][0]
+            while seq < end_seq:
+                rows = log.read_forward(seq, min(MESSAGE_BATCH_LINES, end_seq - seq))
+                if not rows:
+                    break
+                out.write("".join(json.dumps({"type": "message", "record": record}) + "\n" for _, record in rows).encode("utf-8"))
+                seq = rows[-1][0] + 1
+            out.write((json.dumps({"type": "end", "id": self.next_id}) + "\n").encode("utf-8"))
+        self.digests = digests
+        self.message_seq = end_seq
+        self.chain_length += 1
+        self.next_id += 1
+        self.last_snapshot = header
+        if full:
+            self._prune()
+        return header
+
+    def _prune(self) -> None:
+        for path in list_chains(self.directory)[:-self.chains_to_keep]:
+            try:
+                os.remove(path)
+                logger.info(f"Removed old snapshot chain {path}")
+            except OSError as e:
+                logger.warning(f"Failed to remove old snapshot chain {path}: {e}")
+
+def list_chains(directory: str) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name.startswith(CHAIN_PREFIX) and name.endswith(CHAIN_SUFFIX)]
+    names.sort(key=lambda name: int(name[len(CHAIN_PREFIX):-len(CHAIN_SUFFIX)]))
+    return [os.path.join(directory, name) for name in names]
+
+# Yield the complete snapshots in a chain as (header, lines); a torn final
+# snapshot (no end marker, or a truncated gzip member) is skipped
+def read_chain(path: str) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    header: Optional[Dict[str, Any]] = None
+    lines: List[Dict[str, Any]] = []
+    try:
+        with gzip.open(path, "rb") as f:
+            for raw in f:
+                entry = json.loads(raw)
+                if entry["type"] == "header":
+                    header, lines = entry, []
+                elif entry["type"] == "end":
+                    if header is not None and entry["id"] == header["id"]:
+                        yield header, lines
+                    header, lines = None, []
+                elif header is not None:
+                    lines.append(entry)
+    except (EOFError, gzip.BadGzipFile, ValueError) as e:
+        logger.warning(f"Snapshot chain {path} ends with an incomplete snapshot: {e}")
+
+def _apply(stores: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    path = entry["path"]
+    if not path:
+        if entry["type"] == "set":
+            stores[entry["store"]] = entry["value"]
+        else:
+            stores.pop(entry["store"], None)
+        return
+    parent = stores.setdefault(entry["store"], {})
+    for key in path[:-1]:
+        if not isinstance(parent.get(key), dict):
+            parent[key] = {}
+        parent = parent[key]
+    if entry["type"] == "set":
+        parent[path[-1]] = entry["value"]
+    else:
+        parent.pop(path[-1], None)
+
+def _write_atomic(path: str, write) -> None:
+    temp_path = path + ".restore"
+    with open(temp_path, "w") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+# Rebuild every store as of the latest snapshot taken at or before `at` (default:
+# the latest) and write the files into `target`. Returns the header of the
+# snapshot restored to. The bot must be stopped first.
+def restore(directory: str, target: str = ".", at: Optional[float] = None) -> Dict[str, Any]:
+    chain = None
+    for path in reversed(list_chains(directory)):
+        first = next(read_chain(path), None)
+        if first is not None and (at is None or first[0]["created"] <= at):
+            chain = path
+            break
+    if chain is None:
+        raise FileNotFoundError(f"No snapshot in {directory} at or before the requested time")
+    stores: Dict[str, Any] = {}
+    restored: Optional[Dict[str, Any]] = None
+    message_path = os.path.join(target, "messages.restore.jsonl")
+    with open(message_path, "w") as messages:
+        for header, lines in read_chain(chain):
+            if at is not None and header["created"] > at:
+                break
+            for entry in lines:
+                if entry["type"] == "message":
+                    messages.write(json.dumps(entry["record"]) + "\n")
+                else:
+                    _apply(stores, entry)
+            restored = header
+    for name, filename in restored["files"].items():
+        _write_atomic(os.path.join(target, filename), lambda f, value=stores.get(name): json.dump(value, f, indent=4))
+    messages_file = os.path.join(target, restored["messages_file"])
+    os.replace(message_path, messages_file)
+    # The message log rebuilds its sequence index on the next start
+    try:
+        os.remove(messages_file + ".idx")
+    except FileNotFoundError:
+        pass
+    return restored
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+def _parse_time(text: str) -> float:
+    parsed = datetime.fromisoformat(text.strip())
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="List or restore bot state snapshots")
+    parser.add_argument("--dir", default=DEFAULT_SNAPSHOT_DIR, help="Snapshot directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the snapshots that can be restored")
+    restore_parser = commands.add_parser("restore", help="Restore state files from a snapshot (stop the bot first)")
+    restore_parser.add_argument("--at", help="Restore the latest snapshot at or before this UTC time (YYYY-MM-DD[ HH:MM])")
+    restore_parser.add_argument("--target", default=".", help="Directory to write the restored files into")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    if args.command == "list":
+        for path in list_chains(args.dir):
+            for header, _ in read_chain(path):
+                start, end = header["message_range"]
+                print(f"{os.path.basename(path)}  #{header['id']:<4} {header['kind']:<5} {_format_time(header['created'])}  "
+                      f"{header['entries']} entries, {end - start} messages")
+        return
+    header = restore(args.dir, args.target, _parse_time(args.at) if args.at else None)
+    print(f"Restored {header['kind']} snapshot #{header['id']} from {_format_time(header['created'])} into {args.target}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Delay before restarting a crashed task; doubles per consecutive crash up to the maximum
+RESTART_DELAY_SECONDS: float = 5.0
+MAX_RESTART_DELAY_SECONDS: float = 300.0
+# A task that ran this long before crashing starts again from the base delay
+STABLE_RUN_SECONDS: float = 600.0
+
+# Runs named background coroutines, at most one instance per name. A task that
+# raises is logged and restarted with exponential backoff; a task that returns
+# normally is considered finished and forgotten, so one-off tasks with unique
+# names (e.g. one per node) do not pile up. Tasks can wait for a readiness coroutine
+# (e.g. bot.wait_until_ready) before their first run.
+class TaskSupervisor:
+    def __init__(self, wait_ready: Optional[Callable[[], Awaitable[Any]]] = None):
+        self.wait_ready = wait_ready
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.restarts: Dict[str, int] = {}
+        self.last_errors: Dict[str, str] = {}
+
+    def is_running(self, name: str) -> bool:
+        task = self.tasks.get(name)
+        return task is not None and not task.done()
+
+    # Start a task unless one with this name is already running; returns whether it was started
+    def start(self, name: str, factory: Callable[[], Awaitable[Any]], wait_ready: bool = True) -> bool:
+        if self.is_running(name):
+            return False
+        self.tasks[name] = asyncio.create_task(self._supervise(name, factory, wait_ready), name=name)
+        return True
+
+    async def _supervise(self, name: str, factory: Callable[[], Awaitable[Any]], wait_ready: bool) -> None:
+        if wait_ready and self.wait_ready is not None:
+            await self.wait_ready()
+        delay = RESTART_DELAY_SECONDS
+        while True:
+            started = time.monotonic()
+            try:
+                await factory()
+                logger.info(f"Background task {name} finished")
+                self._forget(name)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.restarts[name] = self.restarts.get(name, 0) + 1
+                self.last_errors[name] = f"{type(e).__name__}: {e}"
+                if time.monotonic() - started >= STABLE_RUN_SECONDS:
+                    delay = RESTART_DELAY_SECONDS
+                logger.error(f"Background task {name} crashed ({self.last_errors[name]}); restarting in {delay:.0f}s", exc_info=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RESTART_DELAY_SECONDS)
+
+    def _forget(self, name: str) -> None:
+        self.tasks.pop(name, None)
+        self.restarts.pop(name, None)
+        self.last_errors.pop(name, None)
+
+    async def stop(self, name: str) -> None:
+        task = self.tasks.pop(name, None)
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stop_all(self) -> None:
+        for name in list(self.tasks):
+            await self.stop(name)
+
+    # {name: {"running": bool, "restarts": int, "last_error": str or None}}
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "running": not task.done(),
+                "restarts": self.restarts.get(name, 0),
+                "last_error": self.last_errors.get(name)
+            }
+            for name, task in self.tasks.items()
+        }
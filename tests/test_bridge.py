@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bridge import FragmentReassembler, MeshTransmitter, fragment_text
+from outbox import AirtimePacer
+
+def text_packet(sender: str, text: str) -> dict:
+    return {"fromId": sender, "decoded": {"portnum": "TEXT_MESSAGE_APP", "text": text}}
+
+# Fragments produced by fragment_text, fed through the same preprocessing the
+# mesh message handler applies, must give back the original text
+class FragmentRoundTripTest(unittest.TestCase):
+    def reassemble(self, fragments, order=None):
+        reassembler = FragmentReassembler()
+        results = [reassembler.add_packet(text_packet("!a", fragments[index]))
+                   for index in (order or range(len(fragments)))]
+        self.assertTrue(all(result is None for result in results[:-1]))
+        return results[-1]
+
+    def test_words_keep_their_spaces(self):
+        text = " ".join(f"word{index}" for index in range(120))
+        fragments, truncated = fragment_text(text, 5)
+        self.assertGreater(len(fragments), 1)
+        self.assertFalse(truncated)
+        self.assertEqual(self.reassemble(fragments), text)
+
+    def test_out_of_order_multibyte(self):
+        text = "héllo wörld " * 40 + "🙂" * 30
+        fragments, _ = fragment_text(text, 0x2a)
+        self.assertEqual(self.reassemble(fragments, list(reversed(range(len(fragments))))), text.strip())
+
+    def test_plain_text_is_stripped(self):
+        self.assertEqual(FragmentReassembler().add_packet(text_packet("!a", "  hello \n")), "hello")
+
+# A slow radio write must not stall the event loop
+class MeshTransmitterTest(unittest.TestCase):
+    def test_send_runs_off_the_event_loop(self):
+        async def scenario():
+            sending = threading.Event()
+            sent = threading.Event()
+            released = []
+            def send(text, channel, destination):
+                sending.set()
+                released.append(sent.wait(1.0))
+            transmitter = MeshTransmitter(send, AirtimePacer(duty_cycle=1.0, min_gap=0.0))
+            runner = asyncio.create_task(transmitter.run())
+            transmitter.enqueue(["hello"], 0)
+            while not sending.is_set():
+                await asyncio.sleep(0.01)
+            sent.set()
+            while not released:
+                await asyncio.sleep(0.01)
+            runner.cancel()
+            return released
+        # The loop kept running and released the send; a blocked loop lets the wait time out
+        self.assertEqual(asyncio.run(scenario()), [True])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+import heapq
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Edges not refreshed by a packet or NodeDB update within this window are dropped
+DEFAULT_EDGE_TTL: float = 3 * 3600
+
+# LoRa SNR range used to turn link quality into an edge cost (higher SNR = cheaper hop)
+MIN_SNR: float = -20.0
+MAX_SNR: float = 12.0
+UNKNOWN_SNR_COST: float = 2.0
+
+def node_id_from_num(num: Any) -> Optional[str]:
+    if isinstance(num, str):
+        return num if num.startswith("!") else None
+    if isinstance(num, int) and 0 < num < 0xFFFFFFFF:
+        return f"!{num:08x}"
+    return None
+
+def snr_to_cost(snr: Optional[float]) -> float:
+    if snr is None:
+        return UNKNOWN_SNR_COST
+    snr = min(max(snr, MIN_SNR), MAX_SNR)
+    return round(1.0 + (MAX_SNR - snr) / 8.0, 2)
+
+# Weighted, undirected mesh graph maintained incrementally from packets.
+# Nodes are grouped into connected components; shortest-path trees and
+# articulation points are cached per component and only the components
+# touched by an edge change are invalidated.
+class MeshTopology:
+    def __init__(self, edge_ttl: float = DEFAULT_EDGE_TTL):
+        self.edge_ttl = edge_ttl
+        # {node_id: {neighbor_id: (cost, snr, updated_at)}}
+        self.adjacency: Dict[str, Dict[str, Tuple[float, Optional[float], float]]] = {}
+        self.component_of: Dict[str, int] = {}
+        self.components: Dict[int, Set[str]] = {}
+        self._next_component_id: int = 0
+        # {component_id: {source: (distances, previous_hop)}}
+        self._path_cache: Dict[int, Dict[str, Tuple[Dict[str, float], Dict[str, str]]]] = {}
+        self._articulation_cache: Dict[int, Set[str]] = {}
+        self.stats: Dict[str, int] = {"edge_updates": 0, "invalidations": 0, "path_cache_hits": 0, "path_computations": 0}
+
+    def _new_component(self, members: Set[str]) -> int:
+        component_id = self._next_component_id
+        self._next_component_id += 1
+        self.components[component_id] = members
+        for node in members:
+            self.component_of[node] = component_id
+        return component_id
+
+    def _invalidate(self, component_id: int) -> None:
+        self._path_cache.pop(component_id, None)
+        self._articulation_cache.pop(component_id, None)
+        self.stats["invalidations"] += 1
+
+    def _ensure_node(self, node: str) -> int:
+        if node not in self.component_of:
+            self.adjacency.setdefault(node, {})
+            return self._new_component({node})
+        return self.component_of[node]
+
+    def update_edge(self, a: str, b: str, snr: Optional[float] = None, now: Optional[float] = None) -> None:
+        if a == b:
+            return
+        now = time.time() if now is None else now
+        cost = snr_to_cost(snr)
+        existing = self.adjacency.get(a, {}).get(b)
+        self.adjacency.setdefault(a, {})[b] = (cost, snr, now)
+        self.adjacency.setdefault(b, {})[a] = (cost, snr, now)
+        if existing and existing[0] == cost:
+            return  # Only the timestamp changed; cached results stay valid
+        self.stats["edge_updates"] += 1
+        comp_a = self._ensure_node(a)
+        comp_b = self._ensure_node(b)
+        if comp_a == comp_b:
+            self._invalidate(comp_a)
+            return
+        # Merge the smaller component into the larger one
+        if len(self.components[comp_a]) < len(self.components[comp_b]):
+            comp_a, comp_b = comp_b, comp_a
+        self._invalidate(comp_a)
+        self._invalidate(comp_b)
+        moved = self.components.pop(comp_b)
+        self.components[comp_a].update(moved)
+        for node in moved:
+            self.component_of[node] = comp_a
+
+    def remove_edge(self, a: str, b: str) -> None:
+        if b not in self.adjacency.get(a, {}):
+            return
+        del self.adjacency[a][b]
+        del self.adjacency[b][a]
+        self.stats["edge_updates"] += 1
+        component_id = self.component_of[a]
+        self._invalidate(component_id)
+        reachable = self._reachable_from(a)
+        if b in reachable:
+            return
+        # The edge was a bridge: split off the side containing a
+        remaining = self.components[component_id] - reachable
+        self.components[component_id] = remaining
+        self._new_component(reachable)
+
+    def expire_edges(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        stale = [
+            (a, b)
+            for a, neighbors in self.adjacency.items()
+            for b, (_, _, updated_at) in neighbors.items()
+            if a < b and now - updated_at > self.edge_ttl
+        ]
+        for a, b in stale:
+            self.remove_edge(a, b)
+        return len(stale)
+
+    def _reachable_from(self, start: str) -> Set[str]:
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for neighbor in self.adjacency.get(node, {}):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    stack.append(neighbor)
+        return seen
+
+    def neighbors(self, node: str) -> List[Tuple[str, Optional[float], float]]:
+        return sorted(
+            ((neighbor, snr, updated_at) for neighbor, (_, snr, updated_at) in self.adjacency.get(node, {}).items()),
+            key=lambda item: item[1] if item[1] is not None else MIN_SNR - 1,
+            reverse=True
+        )
+
+    def _shortest_path_tree(self, source: str) -> Tuple[Dict[str, float], Dict[str, str]]:
+        component_id = self.component_of[source]
+        cached = self._path_cache.get(component_id, {}).get(source)
+        if cached:
+            self.stats["path_cache_hits"] += 1
+            return cached
+        self.stats["path_computations"] += 1
+        distances: Dict[str, float] = {source: 0.0}
+        previous: Dict[str, str] = {}
+        heap: List[Tuple[float, str]] = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances.get(node, float("inf")):
+                continue
+            for neighbor, (cost, _, _) in self.adjacency[node].items():
+                candidate = distance + cost
+                if candidate < distances.get(neighbor, float("inf")):
+                    distances[neighbor] = candidate
+                    previous[neighbor] = node
+                    heapq.heappush(heap, (candidate, neighbor))
+        tree = (distances, previous)
+        self._path_cache.setdefault(component_id, {})[source] = tree
+        return tree
+
+    def shortest_path(self, source: str, target: str) -> Optional[Tuple[List[str], float]]:
+        if source not in self.component_of or target not in self.component_of:
+            return None
+        if self.component_of[source] != self.component_of[target]:
+            return None
+        distances, previous = self._shortest_path_tree(source)
+        if target not in distances:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path, distances[target]
+
+    def _component_articulation_points(self, component_id: int) -> Set[str]:
+        cached = self._articulation_cache.get(component_id)
+        if cached is not None:
+            return cached
+        members = self.components[component_id]
+        points: Set[str] = set()
+        if len(members) >= 3:
+            # Iterative Tarjan (no recursion limit issues on long chains)
+            root = next(iter(members))
+            discovery: Dict[str, int] = {root: 0}
+            low: Dict[str, int] = {root: 0}
+            parent: Dict[str, Optional[str]] = {root: None}
+            root_children = 0
+            counter = 1
+            stack = [(root, iter(self.adjacency[root]))]
+            while stack:
+                node, children = stack[-1]
+                advanced = False
+                for child in children:
+                    if child not in discovery:
+                        parent[child] = node
+                        discovery[child] = low[child] = counter
+                        counter += 1
+                        if node == root:
+                            root_children += 1
+                        stack.append((child, iter(self.adjacency[child])))
+                        advanced = True
+                        break
+                    if child != parent[node]:
+                        low[node] = min(low[node], discovery[child])
+                if advanced:
+                    continue
+                stack.pop()
+                up = parent[node]
+                if up is not None:
+                    low[up] = min(low[up], low[node])
+                    if up != root and low[node] >= discovery[up]:
+                        points.add(up)
+            if root_children > 1:
+                points.add(root)
+        self._articulation_cache[component_id] = points
+        return points
+
+    def articulation_points(self) -> Set[str]:
+        points: Set[str] = set()
+        for component_id in self.components:
+            points |= self._component_articulation_points(component_id)
+        return points
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "nodes": len(self.component_of),
+            "edges": sum(len(neighbors) for neighbors in self.adjacency.values()) // 2,
+            "components": len(self.components),
+        }
+
+    # Packet and NodeDB ingestion
+
+    def ingest_packet(self, packet: Dict[str, Any], now: Optional[float] = None) -> None:
+        decoded = packet.get("decoded", {})
+        portnum = decoded.get("portnum")
+        if portnum == "NEIGHBORINFO_APP":
+            info = decoded.get("neighborinfo", {})
+            reporter = node_id_from_num(info.get("nodeId")) or packet.get("fromId")
+            if not reporter:
+                return
+            for neighbor in info.get("neighbors", []):
+                neighbor_id = node_id_from_num(neighbor.get("nodeId"))
+                if neighbor_id:
+                    self.update_edge(reporter, neighbor_id, neighbor.get("snr"), now)
+        elif portnum == "TRACEROUTE_APP":
+            route = decoded.get("traceroute", {})
+            # The reply travels from the traced node back to the requester
+            origin = packet.get("toId") or node_id_from_num(packet.get("to"))
+            target = packet.get("fromId") or node_id_from_num(packet.get("from"))
+            if not origin or not target:
+                return
+            self._ingest_route(origin, route.get("route", []), target, route.get("snrTowards", []), now)
+            if "routeBack" in route or "snrBack" in route:
+                self._ingest_route(target, route.get("routeBack", []), origin, route.get("snrBack", []), now)
+
+    def _ingest_route(self, origin: str, hops: Iterable[Any], target: str, snrs: List[Any], now: Optional[float]) -> None:
+        path = [origin] + [hop for hop in (node_id_from_num(num) for num in hops) if hop] + [target]
+        for index in range(len(path) - 1):
+            # Traceroute SNR values are reported in quarter-dB steps
+            snr = snrs[index] / 4.0 if index < len(snrs) and isinstance(snrs[index], (int, float)) else None
+            self.update_edge(path[index], path[index + 1], snr, now)
+
+    def ingest_node(self, local_id: Optional[str], node_id: str, node_info: Dict[str, Any], now: Optional[float] = None) -> None:
+        if not local_id or node_id == local_id:
+            return
+        # Zero hops away means the local radio hears the node directly
+        hops_away = node_info.get("hopsAway")
+        if hops_away == 0:
+            self.update_edge(local_id, node_id, node_info.get("snr"), now)
+        elif isinstance(hops_away, int) and hops_away > 0:
+            self.remove_edge(local_id, node_id)
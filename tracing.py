@@ -0,0 +1,77 @@
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from metrics import Histogram
+
+# Recent stage durations kept per (kind, stage) for /perf percentiles
+SAMPLES_PER_STAGE: int = 1000
+
+# Timeline of one sampled event. Each mark() closes the segment that started
+# at the previous mark (or at creation) and names it after the stage that just
+# finished, so call sites only need one line between stages.
+class Trace:
+    def __init__(self, tracer: "Tracer", kind: str):
+        self.tracer = tracer
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.stages: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last_mark))
+        self.last_mark = now
+
+    def finish(self) -> None:
+        self.stages.append(("total", time.perf_counter() - self.started))
+        self.tracer.record(self)
+
+# Stand-in for events that were not sampled; every call is a no-op
+class NullTrace:
+    def mark(self, stage: str) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+NULL_TRACE = NullTrace()
+
+def percentiles(samples: List[float], fractions: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> List[Optional[float]]:
+    if not samples:
+        return [None for _ in fractions]
+    ordered = sorted(samples)
+    return [ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] for fraction in fractions]
+
+# Samples a fraction of events and keeps per-stage latency for them, both as
+# bounded in-memory samples (for /perf) and in an optional metrics histogram
+class Tracer:
+    def __init__(self, sample_rate: float, histogram: Optional[Histogram] = None):
+        self.sample_rate = sample_rate
+        self.histogram = histogram
+        self.samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self.traced: Dict[str, int] = {}
+
+    def start(self, kind: str):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return NULL_TRACE
+        return Trace(self, kind)
+
+    def record(self, trace: Trace) -> None:
+        self.traced[trace.kind] = self.traced.get(trace.kind, 0) + 1
+        for stage, duration in trace.stages:
+            samples = self.samples.get((trace.kind, stage))
+            if samples is None:
+                samples = self.samples[(trace.kind, stage)] = deque(maxlen=SAMPLES_PER_STAGE)
+            samples.append(duration)
+            if self.histogram is not None:
+                self.histogram.observe(duration, kind=trace.kind, stage=stage)
+
+    # {kind: [(stage, count, p50, p95, p99), ...]} with stages in the order they were first seen
+    def summary(self) -> Dict[str, List[Tuple[str, int, Optional[float], Optional[float], Optional[float]]]]:
+        result: Dict[str, List[Tuple[str, int, Optional[float], Optional[float], Optional[float]]]] = {}
+        for (kind, stage), samples in list(self.samples.items()):
+            values = list(samples)
+            result.setdefault(kind, []).append((stage, len(values), *percentiles(values)))
+        return result